@@ -83,7 +83,7 @@ export async function POST(request: NextRequest) {
     });
 
     // Call Python PDF API
-    const pdfResponse = await fetch(`${PDF_API_URL}/generate`, {
+    const pdfResponse = await fetch(`${PDF_API_URL}/generate${flatten ? "?flatten=1" : ""}`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
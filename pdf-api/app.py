@@ -4,1048 +4,582 @@ Hosted on Render, called by Next.js app on Vercel
 
 Endpoints:
   POST /generate - Generate filled N-400 PDF from form data
+  POST /generate/batch - Generate many PDFs, streamed back as a ZIP
+  GET|POST /preview?page=N - One flattened page of the filled form
   GET /health - Health check
-  GET /fields - List PDF field names (debugging)
+  GET /metrics - Prometheus metrics for this worker
+  GET /debug/profiles - Recorded fill profiles (when PDF_PROFILE_DIR is set; see profiler.py)
+  GET /fields - Field catalog with type, page, rect, tooltip and on-states
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, abort, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from pypdf import PdfReader, PdfWriter
-from pypdf.generic import NameObject, BooleanObject
+from field_mapping import export_values, map_form_data_to_pdf_fields
+from compact import compact_base, parse_size_modes, write_compact
+from template_cache import PdfChunks, cached_templates, catalog_body, get_template, on_template_load
+from intake import DECODER as JSON_DECODER, PayloadError, decode_arrays, iter_ndjson, read_batch, read_intake
+from intake_schema import VALIDATE_DEFAULT, validate
+from fill_pool import PoolBusy, current_fill_pool, get_fill_pool
+from metrics import REGISTRY, instrumented, register_collector
+from pdf_cache import cache_key, get_pdf_cache
+from profiler import (PROFILE_HEADER, PROFILE_SUFFIXES, authorized as profile_authorized, list_profiles,
+                      maybe_profile, profile_dir, requested as profile_requested)
+from request_log import RequestTimer, configure_logging, logger
 import os
-import io
+import hashlib
 import json
+import logging
+import time
+import unicodedata
+import zipfile
+from contextlib import nullcontext
+from typing import FrozenSet, Optional
+from urllib.parse import quote
 
 app = Flask(__name__)
 CORS(app)
+configure_logging()
 
 TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "templates", "n-400.pdf")
 
+# PDF_INCREMENTAL=1 makes /generate answer with incremental updates by default;
+# ?incremental=0 or ?incremental=1 overrides it per request.
+INCREMENTAL_DEFAULT = os.environ.get("PDF_INCREMENTAL", "0") == "1"
+
+# PDF_FLATTEN=1 makes /generate flatten by default; ?flatten=0 or ?flatten=1
+# overrides it per request (route.ts forwards the caller's flatten flag).
+FLATTEN_DEFAULT = os.environ.get("PDF_FLATTEN", "0") == "1"
+
+# PDF_SIZE_MODES=objstm,dedupe (or "all") writes smaller full documents by
+# default; ?size= overrides it per request, ?size= with no value turns it off
+# (see compact.py).
+SIZE_DEFAULT = parse_size_modes(os.environ.get("PDF_SIZE_MODES"))
+
+# /fields changes only with the template; clients revalidate with the ETag after a minute
+FIELDS_CACHE_CONTROL = "public, max-age=60"
+
+# Seconds clients are told to wait when the fill pool queue is full (see fill_pool.py)
+FILL_RETRY_AFTER = os.environ.get("PDF_FILL_RETRY_AFTER", "1")
+
+
+def check_export_values(template) -> None:
+    """Warn about mapped checkbox values that match none of the widget's /AP /N states."""
+    problems = template.check_button_values(export_values())
+    for name, value, states in problems:
+        logger.warning("unknown checkbox export value", extra={
+            "field": name, "value": value, "on_states": list(states),
+        })
+    logger.info("checked checkbox export values", extra={"problems": len(problems)})
+
+
+on_template_load(check_export_values)
+
+
+def _template_metrics(value):
+    def collect():
+        values = {}
+        for path, cache in cached_templates().items():
+            template = cache.peek()
+            result = value(cache, template)
+            if result is not None:
+                values[(os.path.basename(path),)] = result
+        return values
+    return collect
+
+
+def _pdf_cache_metric(name: str):
+    def collect():
+        cache = get_pdf_cache()
+        return {(): cache.stats()[name]} if cache is not None else {}
+    return collect
+
+
+def _fill_pool_metric(name: str):
+    def collect():
+        pool = current_fill_pool()
+        return {(): getattr(pool, name)} if pool is not None else {}
+    return collect
+
+
+register_collector("pdf_api_template_loaded", "1 when the parsed template is held in memory.",
+                   ("template",), _template_metrics(lambda cache, t: int(t is not None)))
+register_collector("pdf_api_template_loads_total", "Template parses (first load and mtime reloads).",
+                   ("template",), _template_metrics(lambda cache, t: cache.loads), kind="counter")
+register_collector("pdf_api_template_load_seconds", "How long the current template took to parse.",
+                   ("template",), _template_metrics(lambda cache, t: t and t.load_seconds))
+register_collector("pdf_api_template_age_seconds", "Seconds since the current template was parsed.",
+                   ("template",), _template_metrics(lambda cache, t: t and round(time.time() - t.loaded_at, 3)))
+register_collector("pdf_api_template_bytes", "Size of the cached serialized template.",
+                   ("template",), _template_metrics(lambda cache, t: t and len(t.base.data)))
+register_collector("pdf_api_appearance_cache_hits_total", "Text appearances served from the LRU (see appearances.py).",
+                   ("template",), _template_metrics(lambda cache, t: t and t.appearances.hits), kind="counter")
+register_collector("pdf_api_appearance_cache_misses_total", "Text appearances rendered.",
+                   ("template",), _template_metrics(lambda cache, t: t and t.appearances.misses), kind="counter")
+register_collector("pdf_api_appearance_cache_entries", "Rendered text appearances held in the LRU.",
+                   ("template",), _template_metrics(lambda cache, t: t and len(t.appearances._cache)))
+for _name, _kind in (("hits", "counter"), ("disk_hits", "counter"), ("misses", "counter"),
+                     ("evictions", "counter"), ("entries", "gauge"), ("bytes", "gauge")):
+    register_collector(f"pdf_api_pdf_cache_{_name}" + ("_total" if _kind == "counter" else ""),
+                       f"Generated-PDF cache {_name.replace('_', ' ')} (see pdf_cache.py).",
+                       (), _pdf_cache_metric(_name), kind=_kind)
+register_collector("pdf_api_fill_pool_workers", "Fill pool processes.", (), _fill_pool_metric("workers"))
+register_collector("pdf_api_fill_pool_pending", "Fills queued or running in the pool.", (),
+                   _fill_pool_metric("pending"))
+register_collector("pdf_api_fill_pool_rejected_total", "Fills refused with 503 because the pool was full.",
+                   (), _fill_pool_metric("rejected"), kind="counter")
+
+
+def fill_pdf_chunks(template_path: str, field_data: dict, incremental: bool = False,
+                    flatten: bool = False, timer: Optional[RequestTimer] = None,
+                    size_modes: FrozenSet[str] = frozenset()) -> PdfChunks:
+    """
+    Fill PDF with form data and return it as a PdfChunks.
+
+    This mirrors the working logic from scripts/fill-pdf.py:
+    - Decrypts if needed
+    - Renders text appearances once per layout and value (see appearances.py)
+    - Applies each mapped field to the widgets it names
+
+    The template is parsed and indexed once per worker (see template_cache.py);
+    each call fills a copy-on-write working copy of it. Untouched parts of the
+    document are views of the cached template bytes rather than copies, so a
+    response can be streamed without ever joining the whole file.
+
+    With incremental=True the result is the cached template bytes followed by
+    a PDF incremental update holding only the changed field objects, instead
+    of a full re-serialization of the document.
 
-def format_date(date_str: str) -> str:
-    """Convert date to MM/DD/YYYY format."""
-    if not date_str:
-        return ""
-    if "/" in date_str and len(date_str) == 10:
-        return date_str
-    if "-" in date_str:
-        parts = date_str.split("-")
-        if len(parts) == 3:
-            return f"{parts[1]}/{parts[2]}/{parts[0]}"
-    return date_str
-
-
-def safe_get_array(data: dict, key: str, default=None):
-    """Safely get an array from data, handling JSON strings."""
-    if default is None:
-        default = []
-    value = data.get(key, default)
-    if isinstance(value, list):
-        return value
-    if isinstance(value, str):
+    With flatten=True the field appearances are drawn into the page content
+    and the AcroForm is dropped (see WorkingCopy.flatten), so the result is a
+    plain document that viewers don't need to regenerate appearances for.
+
+    size_modes (see compact.parse_size_modes) writes the full document with
+    cross-reference and object streams, recompressed or deduplicated template
+    objects; they don't apply to incremental output.
+
+    Stage timings (template, fill, flatten, serialize) and the widget count
+    are added to ``timer`` when one is passed.
+    """
+    timer = timer or RequestTimer()
+    with timer.stage("template"):
+        template = get_template(template_path)
+    writer = template.working_copy()
+
+    # Only the widgets named in field_data are visited (see template.widget_index)
+    with timer.stage("fill"):
         try:
-            parsed = json.loads(value)
-            if isinstance(parsed, list):
-                return parsed
-        except (json.JSONDecodeError, TypeError):
-            pass
-    return default
+            filled_count = writer.update_widgets(field_data)
+        except Exception as e:
+            logger.warning("error applying fields", extra={"error": str(e)})
+            filled_count = 0
+    timer.fields["filled_widgets"] = filled_count
+
+    if flatten:
+        with timer.stage("flatten"):
+            writer.flatten()
 
+    with timer.stage("serialize"):
+        if size_modes and not incremental:
+            return write_compact(writer, size_modes)
+        return writer.write_chunks(incremental=incremental)
 
-def map_form_data_to_pdf_fields(data: dict) -> dict:
+
+def fill_pdf(template_path: str, field_data: dict, incremental: bool = False, flatten: bool = False,
+             size_modes: FrozenSet[str] = frozenset()) -> bytes:
+    """Fill PDF with form data and return bytes (see fill_pdf_chunks)."""
+    return fill_pdf_chunks(template_path, field_data, incremental=incremental, flatten=flatten,
+                           size_modes=size_modes).getvalue()
+
+
+def warm_up() -> None:
     """
-    Map intake form data to PDF field names with correct checkbox states.
-
-    Intake fields with no PDF equivalent in this N-400 template (not mapped):
-    - request_disability_accommodations (form has no separate accommodation-request field)
-    - employment_to for row 1 (PDF has no P7_To1; only rows 2/3 have To date)
-    - total_days_outside_us, trips_over_6_months (no matching text/checkbox in this PDF)
-    - spouse_is_us_citizen, spouse_country_of_birth (covered indirectly via 5a/5b)
-    - q_failed_to_file_taxes (no "failed to file" question in this N-400; P9_Line3 is "owe taxes")
-    - q_advocated_overthrow (q_served_military_police_unit maps with q_military_police_service to P9_Line8a)
-    - q_willing_take_oath, q_willing_noncombatant, q_willing_work_national_importance
-      (oath items 34-37 share checkbox group; only bear arms/understand oath have distinct fields)
-    - interpreter/preparer address (street, city, state, zip): PDF has name, biz, phone, email only
-    - preparer_is_attorney, preparer_accredited_representative, preparer_bar_number (no fields in template)
-
-    Template variable names may differ from intake names. See test-output/pdf_field_reference.json
-    for all 488 PDF field names and their full descriptions (search "tu" for concepts).
+    Load the template and run one throwaway fill, so the first request doesn't.
+
+    gunicorn.conf.py calls this in the master before forking (or in each
+    worker without preload). The fill builds the per-template state that is
+    otherwise built lazily, such as the appearance fonts' encodings, and the
+    compacted template for the default size modes.
     """
-    fields = {}
-
-    # Helper for Yes/No checkboxes
-    def set_yes_no(field_base: str, value: str, yes_idx: int = 1, no_idx: int = 0):
-        """Set Yes/No checkbox. Default: [0]=No, [1]=Yes. Some reversed. Yes uses /Y; No uses /N (PDF export values)."""
-        if value:
-            value_lower = str(value).lower().strip()
-            if value_lower == "yes":
-                fields[f"{field_base}[{yes_idx}]"] = "/Y"
-            elif value_lower == "no":
-                fields[f"{field_base}[{no_idx}]"] = "/N"
-
-    # ═══════════════════════════════════════════════════════════════
-    # A-NUMBER (All 14 pages)
-    # ═══════════════════════════════════════════════════════════════
-    if data.get("a_number"):
-        a_num = data["a_number"].replace("-", "").replace(" ", "")
-        fields["form1[0].#subform[0].#area[0].Line1_AlienNumber[0]"] = a_num
-        fields["form1[0].#subform[1].#area[1].Line1_AlienNumber[1]"] = a_num
-        fields["form1[0].#subform[2].#area[2].Line1_AlienNumber[2]"] = a_num
-        fields["form1[0].#subform[3].#area[3].Line1_AlienNumber[3]"] = a_num
-        fields["form1[0].#subform[4].#area[4].Line1_AlienNumber[4]"] = a_num
-        fields["form1[0].#subform[5].#area[6].Line1_AlienNumber[5]"] = a_num
-        fields["form1[0].#subform[6].#area[7].Line1_AlienNumber[6]"] = a_num
-        fields["form1[0].#subform[7].#area[8].Line1_AlienNumber[7]"] = a_num
-        fields["form1[0].#subform[8].#area[9].Line1_AlienNumber[8]"] = a_num
-        fields["form1[0].#subform[9].#area[10].Line1_AlienNumber[9]"] = a_num
-        fields["form1[0].#subform[10].#area[11].Line1_AlienNumber[10]"] = a_num
-        fields["form1[0].#subform[11].#area[12].Line1_AlienNumber[11]"] = a_num
-        fields["form1[0].#subform[12].#area[13].Line1_AlienNumber[12]"] = a_num
-        fields["form1[0].#subform[13].#area[14].Line1_AlienNumber[13]"] = a_num
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 1: ELIGIBILITY (Page 1)
-    # ═══════════════════════════════════════════════════════════════
-    eligibility = data.get("eligibility_basis", "")
-    eligibility_map = {
-        "5year": ("form1[0].#subform[0].Part1_Eligibility[2]", "/A"),
-        "3year_marriage": ("form1[0].#subform[0].Part1_Eligibility[1]", "/B"),
-        "vawa": ("form1[0].#subform[0].Part1_Eligibility[0]", "/C"),
-        "spouse_qualified_employment": ("form1[0].#subform[0].Part1_Eligibility[6]", "/D"),
-        "military_current": ("form1[0].#subform[0].Part1_Eligibility[3]", "/E"),
-        "military_former": ("form1[0].#subform[0].Part1_Eligibility[4]", "/F"),
-        "other": ("form1[0].#subform[0].Part1_Eligibility[5]", "/G"),
-    }
-    if eligibility in eligibility_map:
-        field_name, value = eligibility_map[eligibility]
-        fields[field_name] = value
-
-    if eligibility == "other" and data.get("other_basis_reason"):
-        fields["form1[0].#subform[0].Part1Line5_OtherExplain[0]"] = data["other_basis_reason"]
-
-    # USCIS Field Office (e.g. for INA 319(b) filers)
-    if data.get("uscis_field_office"):
-        fields["form1[0].#subform[0].DropDownList1[0]"] = data["uscis_field_office"]
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 2: PERSONAL INFO (Pages 1-2)
-    # ═══════════════════════════════════════════════════════════════
-    # Name
-    if data.get("last_name"):
-        fields["form1[0].#subform[0].P2_Line1_FamilyName[0]"] = data["last_name"]
-    if data.get("first_name"):
-        fields["form1[0].#subform[0].P2_Line1_GivenName[0]"] = data["first_name"]
-    if data.get("middle_name"):
-        fields["form1[0].#subform[0].P2_Line1_MiddleName[0]"] = data["middle_name"]
-
-    # Other Names (array or individual fields)
-    if data.get("has_used_other_names") == "yes":
-        other_names = safe_get_array(data, "other_names", [])
-        name1 = other_names[0] if len(other_names) > 0 and isinstance(other_names[0], dict) else {}
-        if name1.get("family_name") or data.get("other_last_name_1"):
-            fields["form1[0].#subform[0].Line2_FamilyName1[0]"] = name1.get("family_name") or data.get("other_last_name_1", "")
-        if name1.get("given_name") or data.get("other_first_name_1"):
-            fields["form1[0].#subform[0].Line3_GivenName1[0]"] = name1.get("given_name") or data.get("other_first_name_1", "")
-        if name1.get("middle_name") or data.get("other_middle_name_1"):
-            fields["form1[0].#subform[0].Line3_MiddleName1[0]"] = name1.get("middle_name") or data.get("other_middle_name_1", "")
-
-        name2 = other_names[1] if len(other_names) > 1 and isinstance(other_names[1], dict) else {}
-        if name2.get("family_name") or data.get("other_last_name_2"):
-            fields["form1[0].#subform[0].Line2_FamilyName2[0]"] = name2.get("family_name") or data.get("other_last_name_2", "")
-        if name2.get("given_name") or data.get("other_first_name_2"):
-            fields["form1[0].#subform[0].Line3_GivenName2[0]"] = name2.get("given_name") or data.get("other_first_name_2", "")
-        if name2.get("middle_name") or data.get("other_middle_name_2"):
-            fields["form1[0].#subform[0].Line3_MiddleName2[0]"] = name2.get("middle_name") or data.get("other_middle_name_2", "")
-
-    # Name Change (Page 2)
-    if data.get("wants_name_change") == "yes":
-        fields["form1[0].#subform[1].P2_Line34_NameChange[1]"] = "/Y"
-        if data.get("new_name_last"):
-            fields["form1[0].#subform[1].Part2Line3_FamilyName[0]"] = data["new_name_last"]
-        if data.get("new_name_first"):
-            fields["form1[0].#subform[1].Part2Line4a_GivenName[0]"] = data["new_name_first"]
-        if data.get("new_name_middle"):
-            fields["form1[0].#subform[1].Part2Line4a_MiddleName[0]"] = data["new_name_middle"]
-    elif data.get("wants_name_change") == "no":
-        fields["form1[0].#subform[1].P2_Line34_NameChange[0]"] = "/N"
-
-    # USCIS Account Number
-    if data.get("uscis_account_number"):
-        fields["form1[0].#subform[1].P2_Line6_USCISELISAcctNumber[0]"] = data["uscis_account_number"]
-
-    # Gender - /M for male, /F for female
-    gender = data.get("gender", "").lower()
-    if gender == "male":
-        fields["form1[0].#subform[1].P2_Line7_Gender[0]"] = "/M"
-    elif gender == "female":
-        fields["form1[0].#subform[1].P2_Line7_Gender[1]"] = "/F"
-
-    # Date of Birth
-    if data.get("date_of_birth"):
-        fields["form1[0].#subform[1].P2_Line8_DateOfBirth[0]"] = format_date(data["date_of_birth"])
-
-    # Date became permanent resident
-    if data.get("date_became_permanent_resident"):
-        fields["form1[0].#subform[1].P2_Line9_DateBecamePermanentResident[0]"] = format_date(data["date_became_permanent_resident"])
-
-    # Countries
-    if data.get("country_of_birth"):
-        fields["form1[0].#subform[1].P2_Line10_CountryOfBirth[0]"] = data["country_of_birth"]
-    # Part 2.11 - Country of Citizenship/Nationality (always output if present)
-    country_of_citizenship = data.get("country_of_citizenship") or data.get("country_of_nationality")
-    if country_of_citizenship:
-        fields["form1[0].#subform[1].P2_Line11_CountryOfNationality[0]"] = country_of_citizenship
-
-    # Q10 - Was your mother or father a U.S. citizen before your 18th birthday?
-    # (P2_Line10_claimdisability is parent citizenship, NOT disability accommodations)
-    if data.get("parent_us_citizen_before_18") == "yes":
-        fields["form1[0].#subform[1].P2_Line10_claimdisability[1]"] = "/Y"
-    elif data.get("parent_us_citizen_before_18") == "no":
-        fields["form1[0].#subform[1].P2_Line10_claimdisability[0]"] = "/N"
-
-    # Q11 - Disability preventing English/civics
-    if data.get("disability_prevents_english") == "yes":
-        fields["form1[0].#subform[1].P2_Line11_claimdisability[1]"] = "/Y"
-    elif data.get("disability_prevents_english") == "no":
-        fields["form1[0].#subform[1].P2_Line11_claimdisability[0]"] = "/N"
-
-    # Q12.a - SSA Card
-    if data.get("ssa_wants_card") == "yes":
-        fields["form1[0].#subform[1].Line12a_Checkbox[1]"] = "/Y"
-    elif data.get("ssa_wants_card") == "no":
-        fields["form1[0].#subform[1].Line12a_Checkbox[0]"] = "/N"
-
-    # Q12.b - SSN
-    if data.get("ssn"):
-        ssn_clean = data["ssn"].replace("-", "").replace(" ", "")
-        fields["form1[0].#subform[1].Line12b_SSN[0]"] = ssn_clean
-
-    # Q12.c - SSA Consent
-    if data.get("ssa_consent_disclosure") == "yes":
-        fields["form1[0].#subform[1].Line12\\.c_Checkbox[1]"] = "/Y"
-    elif data.get("ssa_consent_disclosure") == "no":
-        fields["form1[0].#subform[1].Line12\\.c_Checkbox[0]"] = "/N"
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 4: RESIDENCE (Page 3)
-    # ═══════════════════════════════════════════════════════════════
-    if data.get("street_address"):
-        fields["form1[0].#subform[2].P4_Line1_StreetName[0]"] = data["street_address"]
-    if data.get("residence_in_care_of"):
-        fields["form1[0].#subform[2].P4_Line1_InCareOfName[0]"] = data["residence_in_care_of"]
-    elif data.get("mailing_same_as_residence") == "yes" and data.get("mailing_in_care_of"):
-        fields["form1[0].#subform[2].P4_Line1_InCareOfName[0]"] = data["mailing_in_care_of"]
-
-    # Apt/Ste/Flr checkboxes
-    apt_type = data.get("apt_type", "").lower()
-    if apt_type == "apt":
-        fields["form1[0].#subform[2].P4_Line1_Unit[2]"] = "/APT"
-    elif apt_type == "ste":
-        fields["form1[0].#subform[2].P4_Line1_Unit[1]"] = "/STE"
-    elif apt_type == "flr":
-        fields["form1[0].#subform[2].P4_Line1_Unit[0]"] = "/FLR"
-
-    # Apt/Ste/Flr number - always output if present (not optional in UI)
-    apt_ste_flr = data.get("apt_ste_flr") or ""
-    if apt_ste_flr:
-        fields["form1[0].#subform[2].P4_Line1_Number[0]"] = apt_ste_flr
-
-    if data.get("city"):
-        fields["form1[0].#subform[2].P4_Line1_City[0]"] = data["city"]
-
-    # State/Province - always output if present
-    state_val = data.get("state") or ""
-    if state_val:
-        state_val = f" {state_val.upper()}" if not state_val.startswith(' ') else state_val
-        fields["form1[0].#subform[2].P4_Line1_State[0]"] = state_val
-    
-    province_val = data.get("residence_province") or ""
-    if province_val:
-        fields["form1[0].#subform[2].P4_Line1_Province[0]"] = province_val
-
-    # Zip/Postal Code - always output if present
-    zip_code_val = data.get("zip_code") or ""
-    if zip_code_val:
-        fields["form1[0].#subform[2].P4_Line1_ZipCode[0]"] = zip_code_val
-    
-    postal_code_val = data.get("residence_postal_code") or ""
-    if postal_code_val:
-        fields["form1[0].#subform[2].P4_Line1_PostalCode[0]"] = postal_code_val
-
-    fields["form1[0].#subform[2].P4_Line1_Country[0]"] = "United States"
-
-    # Residence dates (From / To)
-    # Template appears to place the "From" box in index [1].
-    if data.get("residence_from"):
-        fields["form1[0].#subform[2].P4_Line1_DatesofResidence[1]"] = format_date(data["residence_from"])
-    if data.get("residence_to"):
-        to_val = data["residence_to"]
-        if isinstance(to_val, str) and to_val.upper() == "PRESENT":
-            fields["form1[0].#subform[2].P4_Line1_DatesofResidence[0]"] = "Present"
-        else:
-            fields["form1[0].#subform[2].P4_Line1_DatesofResidence[0]"] = format_date(to_val)
-
-    # Part 4.2 - Is your current physical address also your current mailing address?
-    # This checkbox determines if Part 4.3 (mailing address) is required
-    mailing_same = data.get("mailing_same_as_residence", "")
-    if mailing_same == "yes":
-        fields["form1[0].#subform[2].Pt3_Line2a_Checkbox[1]"] = "/Y"
-    elif mailing_same == "no":
-        fields["form1[0].#subform[2].Pt3_Line2a_Checkbox[0]"] = "/N"
-
-    # Part 4.3 - Mailing address fields (only required if Part 4.2 is "no")
-    # If Part 4.2 is "yes", skip to Part 5 (mailing address fields should be empty)
-    if mailing_same == "no":
-        mailing_unit = data.get("mailing_apt_type", "").lower()
-        if mailing_unit == "apt":
-            fields["form1[0].#subform[3].P5_Line1b_Unit[2]"] = "/APT"
-        elif mailing_unit == "ste":
-            fields["form1[0].#subform[3].P5_Line1b_Unit[1]"] = "/STE"
-        elif mailing_unit == "flr":
-            fields["form1[0].#subform[3].P5_Line1b_Unit[0]"] = "/FLR"
-        if data.get("mailing_apt_ste_flr"):
-            fields["form1[0].#subform[3].P5_Line1b_Number[0]"] = data["mailing_apt_ste_flr"]
-        if data.get("mailing_in_care_of"):
-            fields["form1[0].#subform[3].P5_Line1b_InCareOfName[0]"] = data["mailing_in_care_of"]
-        if data.get("mailing_street_address"):
-            fields["form1[0].#subform[3].P5_Line1b_StreetName[0]"] = data["mailing_street_address"]
-        if data.get("mailing_city"):
-            fields["form1[0].#subform[3].P5_Line1b_City[0]"] = data["mailing_city"]
-        if data.get("mailing_state"):
-            fields["form1[0].#subform[3].P4_Line1_State[1]"] = data["mailing_state"]
-        if data.get("mailing_zip_code"):
-            fields["form1[0].#subform[3].P5_Line1b_ZipCode[0]"] = data["mailing_zip_code"]
-        if data.get("mailing_province"):
-            fields["form1[0].#subform[3].P5_Line1b_Province[0]"] = data["mailing_province"]
-        if data.get("mailing_postal_code"):
-            fields["form1[0].#subform[3].P5_Line1b_PostalCode[0]"] = data["mailing_postal_code"]
-        if data.get("mailing_country"):
-            fields["form1[0].#subform[3].P5_Line1b_Country[0]"] = data["mailing_country"]
-
-    # Previous physical addresses (Part 4.1 table)
-    residence_addresses = safe_get_array(data, "residence_addresses", [])
-    for i, address in enumerate(residence_addresses[:3]):
-        if not isinstance(address, dict):
-            continue
-        idx = i + 1
-        if address.get("street_address"):
-            fields[f"form1[0].#subform[2].P4_Line3_PhysicalAddress{idx}[0]"] = address["street_address"]
-        if address.get("city"):
-            fields[f"form1[0].#subform[2].P4_Line3_CityTown{idx}[0]"] = address["city"]
-        state_val = address.get("state") or address.get("province")
-        if state_val:
-            fields[f"form1[0].#subform[2].P4_Line3_State{idx}[0]"] = state_val
-        zip_val = address.get("zip_code") or address.get("postal_code")
-        if zip_val:
-            fields[f"form1[0].#subform[2].P4_Line3_ZipCode{idx}[0]"] = zip_val
-        if address.get("country"):
-            fields[f"form1[0].#subform[2].P4_Line3_Country{idx}[0]"] = address["country"]
-
-        if address.get("dates_from"):
-            if idx == 1:
-                fields["form1[0].#subform[2].P4_Line3_From1[0]"] = format_date(address["dates_from"])
-            else:
-                fields[f"form1[0].#subform[2].P4_Line3_From{idx}[0]"] = format_date(address["dates_from"])
-        if address.get("dates_to"):
-            if idx == 1:
-                fields["form1[0].#subform[2].P4_Line3_From1[1]"] = format_date(address["dates_to"])
-            else:
-                fields[f"form1[0].#subform[2].P4_Line3_To{idx}[0]"] = format_date(address["dates_to"])
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 7: BIOGRAPHIC INFO (Page 3)
-    # ═══════════════════════════════════════════════════════════════
-    ethnicity = data.get("ethnicity", "").lower()
-    if ethnicity == "hispanic":
-        fields["form1[0].#subform[2].P7_Line1_Ethnicity[1]"] = "/Y"
-    elif ethnicity in ["not_hispanic", "not hispanic"]:
-        fields["form1[0].#subform[2].P7_Line1_Ethnicity[0]"] = "/N"
-
-    race = data.get("race", "").lower()
-    race_map = {
-        "white": ("form1[0].#subform[2].P7_Line2_Race[4]", "/W"),
-        "asian": ("form1[0].#subform[2].P7_Line2_Race[1]", "/A"),
-        "black": ("form1[0].#subform[2].P7_Line2_Race[2]", "/B"),
-        "native": ("form1[0].#subform[2].P7_Line2_Race[0]", "/I"),
-        "pacific": ("form1[0].#subform[2].P7_Line2_Race[3]", "/A"),
-    }
-    if race in race_map:
-        fields[race_map[race][0]] = race_map[race][1]
-
-    if data.get("height_feet"):
-        fields["form1[0].#subform[2].P7_Line3_HeightFeet[0]"] = str(data["height_feet"])
-    if data.get("height_inches"):
-        fields["form1[0].#subform[2].P7_Line3_HeightInches[0]"] = str(data["height_inches"])
-
-    weight = data.get("weight", "")
-    if weight:
-        w = str(weight).zfill(3)
-        fields["form1[0].#subform[2].P7_Line4_Pounds1[0]"] = w[0]
-        fields["form1[0].#subform[2].P7_Line4_Pounds2[0]"] = w[1]
-        fields["form1[0].#subform[2].P7_Line4_Pounds3[0]"] = w[2]
-
-    eye_color = data.get("eye_color", "").lower()
-    eye_map = {
-        "brown": ("form1[0].#subform[2].P7_Line5_Eye[0]", "/BRO"),
-        "blue": ("form1[0].#subform[2].P7_Line5_Eye[1]", "/BLU"),
-        "green": ("form1[0].#subform[2].P7_Line5_Eye[2]", "/GRN"),
-        "hazel": ("form1[0].#subform[2].P7_Line5_Eye[3]", "/HAZ"),
-        "gray": ("form1[0].#subform[2].P7_Line5_Eye[4]", "/GRY"),
-        "black": ("form1[0].#subform[2].P7_Line5_Eye[5]", "/BLK"),
-        "pink": ("form1[0].#subform[2].P7_Line5_Eye[6]", "/PNK"),
-        "maroon": ("form1[0].#subform[2].P7_Line5_Eye[7]", "/MAR"),
-        "unknown": ("form1[0].#subform[2].P7_Line5_Eye[8]", "/XXX"),
-    }
-    if eye_color in eye_map:
-        fields[eye_map[eye_color][0]] = eye_map[eye_color][1]
-
-    hair_color = data.get("hair_color", "").lower()
-    hair_map = {
-        "bald": ("form1[0].#subform[2].P7_Line6_Hair[0]", "/BAL"),
-        "sandy": ("form1[0].#subform[2].P7_Line6_Hair[1]", "/SDY"),
-        "red": ("form1[0].#subform[2].P7_Line6_Hair[2]", "/RED"),
-        "white": ("form1[0].#subform[2].P7_Line6_Hair[3]", "/WHI"),
-        "gray": ("form1[0].#subform[2].P7_Line6_Hair[4]", "/GRY"),
-        "blond": ("form1[0].#subform[2].P7_Line6_Hair[5]", "/BLN"),
-        "brown": ("form1[0].#subform[2].P7_Line6_Hair[6]", "/BRO"),
-        "black": ("form1[0].#subform[2].P7_Line6_Hair[7]", "/BLK"),
-        "unknown": ("form1[0].#subform[2].P7_Line6_Hair[8]", "/XXX"),
-    }
-    if hair_color in hair_map:
-        fields[hair_map[hair_color][0]] = hair_map[hair_color][1]
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 5: MARITAL STATUS (Page 4)
-    # ═══════════════════════════════════════════════════════════════
-    marital = data.get("marital_status", "").lower()
-    marital_map = {
-        "divorced": ("form1[0].#subform[3].P10_Line1_MaritalStatus[0]", "/D"),
-        "single": ("form1[0].#subform[3].P10_Line1_MaritalStatus[1]", "/S"),
-        "widowed": ("form1[0].#subform[3].P10_Line1_MaritalStatus[2]", "/W"),
-        "married": ("form1[0].#subform[3].P10_Line1_MaritalStatus[3]", "/M"),
-        "annulled": ("form1[0].#subform[3].P10_Line1_MaritalStatus[4]", "/A"),
-        "separated": ("form1[0].#subform[3].P10_Line1_MaritalStatus[5]", "/E"),
-    }
-    if marital in marital_map:
-        fields[marital_map[marital][0]] = marital_map[marital][1]
-
-    # Q2 - Spouse military (P7_Line2_Forces: [0]=N, [1]=Y)
-    if data.get("spouse_is_military_member") == "yes":
-        fields["form1[0].#subform[3].P7_Line2_Forces[1]"] = "/Y"
-    elif data.get("spouse_is_military_member") == "no":
-        fields["form1[0].#subform[3].P7_Line2_Forces[0]"] = "/N"
-
-    # Part 5.3 - Times Married: null = 0, 0 = 0, etc.
-    times_married = data.get("times_married")
-    if times_married is None or times_married == "":
-        times_married = "0"
-    fields["form1[0].#subform[3].Part9Line3_TimesMarried[0]"] = str(times_married)
-
-    # Spouse info
-    if marital == "married":
-        if data.get("spouse_last_name"):
-            fields["form1[0].#subform[3].P10_Line4a_FamilyName[0]"] = data["spouse_last_name"]
-        if data.get("spouse_first_name"):
-            fields["form1[0].#subform[3].P10_Line4a_GivenName[0]"] = data["spouse_first_name"]
-        if data.get("spouse_middle_name"):
-            fields["form1[0].#subform[3].P10_Line4a_MiddleName[0]"] = data["spouse_middle_name"]
-        if data.get("spouse_date_of_birth"):
-            fields["form1[0].#subform[3].P10_Line4d_DateofBirth[0]"] = format_date(data["spouse_date_of_birth"])
-        if data.get("spouse_date_of_marriage"):
-            fields["form1[0].#subform[3].P10_Line4e_DateEnterMarriage[0]"] = format_date(data["spouse_date_of_marriage"])
-
-        # Part 4.d - Spouse address same as applicant (must come first)
-        if data.get("spouse_address_same_as_applicant") == "yes":
-            fields["form1[0].#subform[3].P10_Line5_Citizen[1]"] = "/Y"
-            fields["form1[0].#subform[10].P10_Line1_Citizen[1]"] = "/Y"
-        elif data.get("spouse_address_same_as_applicant") == "no":
-            fields["form1[0].#subform[3].P10_Line5_Citizen[0]"] = "/N"
-            fields["form1[0].#subform[10].P10_Line1_Citizen[0]"] = "/N"
-
-        # Part 4.c and 5.a/5.b - Spouse citizenship (conditional logic)
-        # 5.a - When did your current spouse become a U.S. citizen?
-        spouse_citizenship_by_birth = data.get("spouse_citizenship_by_birth")
-        if spouse_citizenship_by_birth == "yes":
-            # By Birth in the United States - Go to Item Number 7
-            fields["form1[0].#subform[3].P10_Line5a_When[0]"] = "/B"
-        elif spouse_citizenship_by_birth == "no":
-            # Other - Complete Item Number 5.b
-            fields["form1[0].#subform[3].P10_Line5a_When[1]"] = "/O"
-            # 5.b - Date Your Current Spouse Became a U.S. Citizen (required if 5.a is "no")
-            if data.get("spouse_date_became_citizen"):
-                fields["form1[0].#subform[3].P10_Line5b_DateBecame[0]"] = format_date(data["spouse_date_became_citizen"])
-
-        # Spouse A-number (Page 5)
-        if data.get("spouse_a_number"):
-            fields["form1[0].#subform[4].#area[5].P7_Line6_ANumber[0]"] = data["spouse_a_number"]
-
-        # Part 5.7 - Spouse times married: null = 0, 0 = 0, etc.
-        spouse_times_married = data.get("spouse_times_married")
-        if spouse_times_married is None or spouse_times_married == "":
-            spouse_times_married = "0"
-        fields["form1[0].#subform[4].P10_Line4g_Employer[0]"] = str(spouse_times_married)
-
-        # Spouse employer (Page 5 - Q8)
-        if data.get("spouse_current_employer"):
-            fields["form1[0].#subform[4].TextField1[0]"] = data["spouse_current_employer"]
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 6: CHILDREN (Page 5)
-    # ═══════════════════════════════════════════════════════════════
-    if data.get("total_children"):
-        fields["form1[0].#subform[4].P11_Line1_TotalChildren[0]"] = str(data["total_children"])
-
-    children = safe_get_array(data, "children", [])
-    for i, child in enumerate(children[:3]):
-        if not isinstance(child, dict):
-            continue
-        idx = i + 1
-        if child.get("first_name") or child.get("last_name"):
-            name = f"{child.get('first_name', '')} {child.get('last_name', '')}".strip()
-            fields[f"form1[0].#subform[4].P7_EmployerName{idx}[0]"] = name
-        if child.get("date_of_birth"):
-            fields[f"form1[0].#subform[4].P7_From{idx}[0]"] = format_date(child["date_of_birth"])
-        if child.get("residence"):
-            fields[f"form1[0].#subform[4].P7_OccupationFieldStudy{idx}[0]"] = child["residence"]
-        if child.get("relationship"):
-            fields[f"form1[0].#subform[4].P7_OccupationFieldStudy{idx}[1]"] = child["relationship"]
-
-        support_val = child.get("support") or data.get("providing_support_for_children")
-        if support_val:
-            if idx == 1:
-                if support_val == "yes":
-                    fields["form1[0].#subform[4].P9_Line5a[0]"] = "/Y"
-                elif support_val == "no":
-                    fields["form1[0].#subform[4].P9_Line5a[1]"] = "/N"
-            elif idx == 2:
-                if support_val == "yes":
-                    fields["form1[0].#subform[4].P6_ChildTwo[1]"] = "/Y"
-                elif support_val == "no":
-                    fields["form1[0].#subform[4].P6_ChildTwo[0]"] = "/N"
-            elif idx == 3:
-                if support_val == "yes":
-                    fields["form1[0].#subform[4].P6_ChildThree[1]"] = "/Y"
-                elif support_val == "no":
-                    fields["form1[0].#subform[4].P6_ChildThree[0]"] = "/N"
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 3: EMPLOYMENT (Page 5)
-    # Uses P5_EmployerName for Name column, P7_ for other columns
-    # ═══════════════════════════════════════════════════════════════
-    employment_history = safe_get_array(data, "employment_history", [])
-
-    # Employment 1
-    emp1 = employment_history[0] if len(employment_history) > 0 and isinstance(employment_history[0], dict) else {}
-    employer1 = emp1.get("employer_or_school") or data.get("current_employer", "")
-    if employer1:
-        fields["form1[0].#subform[4].P5_EmployerName1[0]"] = employer1
-    occupation1 = emp1.get("occupation_or_field") or data.get("current_occupation", "")
-    if occupation1:
-        fields["form1[0].#subform[4].P7_OccupationFieldStudy1[2]"] = occupation1
-    city1 = emp1.get("city") or data.get("employer_city", "")
-    if city1:
-        fields["form1[0].#subform[4].P7_City1[0]"] = city1
-    state1 = emp1.get("state") or data.get("employer_state", "")
-    if state1:
-        fields["form1[0].#subform[4].P7_State1[0]"] = state1
-    zip1 = emp1.get("zip_code") or data.get("employer_zip_code", "")
-    if zip1:
-        fields["form1[0].#subform[4].P7_ZipCode1[0]"] = zip1
-    if emp1.get("country"):
-        fields["form1[0].#subform[4].P7_Country1[0]"] = emp1["country"]
-    from1 = emp1.get("dates_from") or data.get("employment_from", "")
-    if from1:
-        fields["form1[0].#subform[4].P7_From1[1]"] = format_date(from1)
-    # Note: PDF has no P7_To1 for employment 1 "To" date; only rows 2/3 have To fields
-
-    # Employment 2
-    if len(employment_history) > 1 and isinstance(employment_history[1], dict):
-        emp2 = employment_history[1]
-        if emp2.get("employer_or_school"):
-            fields["form1[0].#subform[4].P5_EmployerName2[0]"] = emp2["employer_or_school"]
-        if emp2.get("occupation_or_field"):
-            fields["form1[0].#subform[4].P7_OccupationFieldStudy2[2]"] = emp2["occupation_or_field"]
-        if emp2.get("city"):
-            fields["form1[0].#subform[4].P7_City2[0]"] = emp2["city"]
-        if emp2.get("state"):
-            fields["form1[0].#subform[4].P7_State2[0]"] = emp2["state"]
-        if emp2.get("zip_code"):
-            fields["form1[0].#subform[4].P7_ZipCode2[0]"] = emp2["zip_code"]
-        if emp2.get("country"):
-            fields["form1[0].#subform[4].P7_Country2[0]"] = emp2["country"]
-        if emp2.get("dates_from"):
-            fields["form1[0].#subform[4].P7_From2[1]"] = format_date(emp2["dates_from"])
-        if emp2.get("dates_to"):
-            fields["form1[0].#subform[4].P7_To2[0]"] = format_date(emp2["dates_to"])
-
-    # Employment 3
-    if len(employment_history) > 2 and isinstance(employment_history[2], dict):
-        emp3 = employment_history[2]
-        if emp3.get("employer_or_school"):
-            fields["form1[0].#subform[4].P5_EmployerName3[0]"] = emp3["employer_or_school"]
-        if emp3.get("occupation_or_field"):
-            fields["form1[0].#subform[4].P7_OccupationFieldStudy3[2]"] = emp3["occupation_or_field"]
-        if emp3.get("city"):
-            fields["form1[0].#subform[4].P7_City3[0]"] = emp3["city"]
-        if emp3.get("state"):
-            fields["form1[0].#subform[4].P7_State3[0]"] = emp3["state"]
-        if emp3.get("zip_code"):
-            fields["form1[0].#subform[4].P7_ZipCode3[0]"] = emp3["zip_code"]
-        if emp3.get("country"):
-            fields["form1[0].#subform[4].P7_Country3[0]"] = emp3["country"]
-        if emp3.get("dates_from"):
-            fields["form1[0].#subform[4].P7_From3[1]"] = format_date(emp3["dates_from"])
-        if emp3.get("dates_to"):
-            fields["form1[0].#subform[4].P7_To3[0]"] = format_date(emp3["dates_to"])
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 4: TIME OUTSIDE US (Pages 5-6)
-    # ═══════════════════════════════════════════════════════════════
-    # Trips (up to 6)
-    trips = safe_get_array(data, "trips", [])
-    for i, trip in enumerate(trips[:6]):
-        if not isinstance(trip, dict):
-            continue
-        idx = i + 1
-        if trip.get("date_left_us"):
-            fields[f"form1[0].#subform[5].P8_Line1_DateLeft{idx}[0]"] = format_date(trip["date_left_us"])
-        if trip.get("date_returned_us"):
-            fields[f"form1[0].#subform[5].P8_Line1_DateReturn{idx}[0]"] = format_date(trip["date_returned_us"])
-        if trip.get("countries_traveled"):
-            if idx == 1:
-                fields["form1[0].#subform[5].P9_Line1_Countries1[0]"] = trip["countries_traveled"]
-            else:
-                fields[f"form1[0].#subform[5].P8_Line1_Countries{idx}[0]"] = trip["countries_traveled"]
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 12: BACKGROUND QUESTIONS (Pages 6-10)
-    # ═══════════════════════════════════════════════════════════════
-
-    # --- Page 6 (subform[5]) ---
-    set_yes_no("form1[0].#subform[5].P9_Line1", data.get("q_claimed_us_citizen", ""))
-    set_yes_no("form1[0].#subform[5].P9_Line2", data.get("q_voted_in_us", ""))
-    # Q3/Q4 have reversed states: [0]=Y, [1]=N
-    # P9_Line3 = Q3 "owe overdue taxes"; P9_Line4 = Q4 "nonresident on tax return"
-    set_yes_no("form1[0].#subform[5].P9_Line3", data.get("q_owe_taxes", ""), yes_idx=0, no_idx=1)
-    set_yes_no("form1[0].#subform[5].P9_Line4", data.get("q_nonresident_alien_tax", ""), yes_idx=0, no_idx=1)
-    # Q5 Communist/Totalitarian
-    set_yes_no("form1[0].#subform[5].P9_5a", data.get("q_communist_party", ""), yes_idx=0, no_idx=1)
-    set_yes_no("form1[0].#subform[5].P9_5b", data.get("q_terrorist_org", ""), yes_idx=0, no_idx=1)
-
-    # --- Page 7 (subform[6]) Q6-Q14 ---
-    # Q6.a - Used weapon
-    set_yes_no("form1[0].#subform[6].P12_6a", data.get("q_used_weapon_explosive", ""))
-    # Q6.b - Kidnapping (REVERSED: [0]=Y, [1]=N)
-    set_yes_no("form1[0].#subform[6].P12_6b", data.get("q_kidnapping_assassination_hijacking", ""), yes_idx=0, no_idx=1)
-    # Q6.c - Threatened violence
-    set_yes_no("form1[0].#subform[6].P12_6c", data.get("q_threatened_weapon_violence", ""))
-
-    # Q7.a - Torture
-    set_yes_no("form1[0].#subform[6].P9_Line7a", data.get("q_torture", ""))
-    # Q7.b - Genocide
-    set_yes_no("form1[0].#subform[6].P9_Line7\\.b\\.", data.get("q_genocide", ""))
-    # Q7.c - Killing
-    set_yes_no("form1[0].#subform[6].P9_Line7\\.c", data.get("q_killing_person", ""))
-    # Q7.d - Severe injury (using P11_7d)
-    set_yes_no("form1[0].#subform[6].P11_7d", data.get("q_severely_injuring", ""))
-    # Q7.e - Sexual contact
-    set_yes_no("form1[0].#subform[6].P9_Line7\\.e", data.get("q_sexual_contact_nonconsent", ""))
-    # Q7.f - Religious persecution
-    set_yes_no("form1[0].#subform[6].P9_Line7\\.f", data.get("q_religious_persecution", ""))
-    # Q7.g - Harm based on race/religion
-    set_yes_no("form1[0].#subform[6].P9_Line7\\.g", data.get("q_harm_race_religion", ""))
-
-    # Q8.a - Military/police service
-    # Q8.a - Military/police service (intake may use q_military_police_service or q_served_military_police_unit)
-    set_yes_no("form1[0].#subform[6].P9_Line8a", data.get("q_military_police_service") or data.get("q_served_military_police_unit", ""))
-    # Q8.b - Armed group
-    set_yes_no("form1[0].#subform[6].P9_Line8b", data.get("q_armed_group", ""))
-
-    # Q9 - Detention facility
-    set_yes_no("form1[0].#subform[6].P9_Line9", data.get("q_detention_facility", ""))
-
-    # Q10.a - Group used weapons
-    set_yes_no("form1[0].#subform[6].P9_Line10a", data.get("q_group_used_weapons", ""))
-    # Q10.b - Used weapon against person
-    set_yes_no("form1[0].#subform[6].P9_Line10b", data.get("q_used_weapon_against_person", ""))
-    # Q10.c - Threatened weapon (REVERSED: [0]=Y, [1]=N)
-    set_yes_no("form1[0].#subform[6].P9_Line10c", data.get("q_threatened_weapon_use", ""), yes_idx=0, no_idx=1)
-
-    # Q11 - Sold/provided weapons
-    set_yes_no("form1[0].#subform[6].P9_Line11", data.get("q_sold_provided_weapons", ""))
-    # Q12 - Weapons training
-    set_yes_no("form1[0].#subform[6].P9_Line12", data.get("q_weapons_training", ""))
-    # Q13 - Recruited under 15
-    set_yes_no("form1[0].#subform[6].P9_Line13", data.get("q_recruited_under_15", ""))
-    # Q14 - Used under 15 in hostilities
-    set_yes_no("form1[0].#subform[6].P9_Line14", data.get("q_used_under_15_hostilities", ""))
-
-    # --- Page 8 (subform[7]) Q15, Q22 ---
-    # Q15.a - Committed crime not arrested (CORRECTED: was using wrong subform)
-    set_yes_no("form1[0].#subform[7].P9_Line15a", data.get("q_committed_crime_not_arrested", ""))
-    # Q15.b - Arrested (CORRECTED)
-    set_yes_no("form1[0].#subform[7].P9_Line15b", data.get("q_arrested", ""))
-
-    # Crime details table (up to 5 entries - CORRECTED field names)
-    crimes = safe_get_array(data, "crimes", [])
-    if crimes:
-        for i, crime in enumerate(crimes[:5]):  # PDF has space for 5 crime entries
-            if not isinstance(crime, dict):
-                continue
-            idx = i + 1
-            # Crime description/what was the offense
-            if crime.get("crime_description"):
-                fields[f"form1[0].#subform[7].P12_Line29_why{idx}[0]"] = crime["crime_description"]
-            # Date of crime
-            if crime.get("date_of_crime"):
-                fields[f"form1[0].#subform[7].P12_Line29_Date{idx}[0]"] = format_date(crime["date_of_crime"])
-            # Date of conviction
-            if crime.get("date_of_conviction"):
-                fields[f"form1[0].#subform[7].P12_Line29_DateOfConv{idx}[0]"] = format_date(crime["date_of_conviction"])
-            # Result/disposition, place, sentence - Outcome[0/1/2] are text fields
-            if crime.get("result_disposition"):
-                fields[f"form1[0].#subform[7].P12_Line29_Outcome{idx}[0]"] = crime["result_disposition"]
-            if crime.get("place_of_crime"):
-                fields[f"form1[0].#subform[7].P12_Line29_Outcome{idx}[1]"] = crime["place_of_crime"]
-            if crime.get("sentence"):
-                fields[f"form1[0].#subform[7].P12_Line29_Outcome{idx}[2]"] = crime["sentence"]
-
-    # Q16 - Completed probation (P12_Line16 on subform[7])
-    set_yes_no("form1[0].#subform[7].P12_Line16", data.get("q_completed_probation", ""))
-
-    # Q22.a - Male 18-26 lived in US (P9_Line22a on subform[8], NOT P12_Line16)
-
-    # --- Page 9 (subform[8]) Q17-24 ---
-
-    # Q17.a - Prostitution (P11_Line17A)
-    set_yes_no("form1[0].#subform[8].P11_Line17A", data.get("q_prostitution", ""))
-    # Q17.b - Controlled substances (P11_Line17B)
-    set_yes_no("form1[0].#subform[8].P11_Line17B", data.get("q_controlled_substances", ""))
-    # Q17.c - Polygamy / married to more than one person (P11_Line17C)
-    set_yes_no("form1[0].#subform[8].P11_Line17C", data.get("q_polygamy", ""))
-
-    # Q17.d - Marriage fraud (P12_Line17d)
-    set_yes_no("form1[0].#subform[8].P12_Line17d", data.get("q_marriage_fraud", ""))
-    # Q17.e - Helped illegal entry (P12_Line17e)
-    set_yes_no("form1[0].#subform[8].P12_Line17e", data.get("q_helped_illegal_entry", ""))
-    # Q17.f - Illegal gambling (P12_Line17f: [0]=Yes, [1]=No - TU bug shows both "Select Yes")
-    set_yes_no("form1[0].#subform[8].P12_Line17f", data.get("q_illegal_gambling", ""), yes_idx=0, no_idx=1)
-    # Q17.g - Failed child support (P12_Line17g)
-    set_yes_no("form1[0].#subform[8].P12_Line17g", data.get("q_failed_child_support", ""))
-    # Q17.h - Misrepresentation public benefits (P12_Line17h)
-    set_yes_no("form1[0].#subform[8].P12_Line17h", data.get("q_misrepresentation_public_benefits", ""))
-
-    # Q18 - False info to govt (P12_Line18: [0]=Yes, [1]=No - TU bug shows both "Select Yes")
-    set_yes_no("form1[0].#subform[8].P12_Line18", data.get("q_false_info_us_government", ""), yes_idx=0, no_idx=1)
-    # Q19 - Lied to govt (P12_Line19: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[8].P12_Line19", data.get("q_lied_us_government", ""), yes_idx=0, no_idx=1)
-    # Q20 - Removal proceedings (P12_Line20)
-    set_yes_no("form1[0].#subform[8].P12_Line20", data.get("q_removal_proceedings", ""))
-    # Q21 - Removed/deported (P12_Line21)
-    set_yes_no("form1[0].#subform[8].P12_Line21", data.get("q_removed_deported", ""))
-
-    # Q22.a - Male 18-26 lived in US (P9_Line22a)
-    set_yes_no("form1[0].#subform[8].P9_Line22a", data.get("q_male_18_26_lived_us", ""))
-    # Q22.b - Registered selective service (Pt9_Line22b)
-    set_yes_no("form1[0].#subform[8].Pt9_Line22b", data.get("q_registered_selective_service", ""))
-    # Q22.c - Selective service number (CORRECTED field name)
-    if data.get("selective_service_number"):
-        fields["form1[0].#subform[8].P9_Line22c_SSNumber[0]"] = data["selective_service_number"]
-    # Q22.c - Selective service date (CORRECTED field name)
-    if data.get("selective_service_date"):
-        fields["form1[0].#subform[8].P9_Line22c_Date[0]"] = format_date(data["selective_service_date"])
-
-    # Q23 - Left US avoid draft (P12_Line23)
-    set_yes_no("form1[0].#subform[8].P12_Line23", data.get("q_left_us_avoid_draft", ""))
-    # Q24 - Applied military exemption (P12_Line24)
-    set_yes_no("form1[0].#subform[8].P12_Line24", data.get("q_applied_military_exemption", ""))
-
-    # --- Page 9 (subform[8]) Q25 ---
-    # Q25 - Served US military (P12_Line25)
-    set_yes_no("form1[0].#subform[8].P12_Line25", data.get("q_served_us_military", ""))
-
-    # --- Page 10 (subform[9]) Q26-37 ---
-
-    # Q26.a - Current military member (CORRECTED: P12_Line26a)
-    set_yes_no("form1[0].#subform[9].P12_Line26a", data.get("q_current_military_member", ""))
-    # Q26.b - Scheduled deploy (CORRECTED: P12_Line26b)
-    set_yes_no("form1[0].#subform[9].P12_Line26b", data.get("q_scheduled_deploy", ""))
-    # Q26.c - Stationed outside US (CORRECTED: P12_Line26c)
-    set_yes_no("form1[0].#subform[9].P12_Line26c", data.get("q_stationed_outside_us", ""))
-    # Q26.d - Former military outside US (CORRECTED: P11_Line26d)
-    set_yes_no("form1[0].#subform[9].P11_Line26d", data.get("q_former_military_outside_us", ""))
-
-    # Q27 - Court martialed (P12_Line27: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line27", data.get("q_court_martialed", ""), yes_idx=0, no_idx=1)
-    # Q28 - Discharged because alien (P12_Line28: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line28", data.get("q_discharged_because_alien", ""), yes_idx=0, no_idx=1)
-    # Q29 - Deserted (P9_Line29)
-    set_yes_no("form1[0].#subform[9].P9_Line29", data.get("q_deserted_military", ""))
-
-    # Q30.a - Title of nobility (P12_Line30a: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line30a", data.get("q_title_of_nobility", ""), yes_idx=0, no_idx=1)
-    # Q30.b - Willing to give up titles (P12_Line30b: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line30b", data.get("q_willing_to_give_up_titles", ""), yes_idx=0, no_idx=1)
-    if data.get("q_titles_list"):
-        fields["form1[0].#subform[9].P9_NobilityTitles[0]"] = data["q_titles_list"]
-    # The question on the form combines 30.a and 30.b with the titles list inline
-
-    # Q31 - Support constitution (P12_Line31)
-    set_yes_no("form1[0].#subform[9].P12_Line31", data.get("q_support_constitution", ""))
-    # Q32 - Understand oath (P12_Line32: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line32", data.get("q_understand_oath", ""), yes_idx=0, no_idx=1)
-    # Q33 - Unable to take Oath because of disability (P12_Line33: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line33", data.get("q_unable_oath_disability", ""), yes_idx=0, no_idx=1)
-    # Q34 - Willing to take full Oath (P12_Line34[0]=No, [1]=Yes)
-    set_yes_no("form1[0].#subform[9].P12_Line34", data.get("q_willing_take_oath", ""))
-    # Q35 - Willing to bear arms (P12_Line35: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line35", data.get("q_willing_bear_arms", ""), yes_idx=0, no_idx=1)
-    # Q36 - Willing to perform noncombatant services (P12_Line36[0]=No, [1]=Yes)
-    set_yes_no("form1[0].#subform[9].P12_Line36", data.get("q_willing_noncombatant", ""))
-    # Q37 - Willing to perform work of national importance (P12_Line37: [0]=Yes, [1]=No)
-    set_yes_no("form1[0].#subform[9].P12_Line37", data.get("q_willing_work_national_importance", ""), yes_idx=0, no_idx=1)
-
-    # Note: Moral character Q17 (prostitution, controlled substances, gambling, child support)
-    # are on subform[8] only (P11_Line17A/B/C, P12_Line17f/g), not duplicated on subform[9]
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 13: CONTACT INFO (Page 11)
-    # ═══════════════════════════════════════════════════════════════
-    if data.get("daytime_phone"):
-        fields["form1[0].#subform[10].P12_Line3_Telephone[0]"] = data["daytime_phone"]
-    if data.get("mobile_phone"):
-        fields["form1[0].#subform[10].P12_Line3_Mobile[0]"] = data["mobile_phone"]
-    if data.get("email"):
-        fields["form1[0].#subform[10].P12_Line5_Email[0]"] = data["email"]
-
-    # Part 11 - Signature and Date (always output if present)
-    signature_date = data.get("signature_date")
-    if signature_date:
-        fields["form1[0].#subform[10].P13_DateofSignature[0]"] = format_date(signature_date)
-    
-    applicant_signature = data.get("applicant_signature")
-    if applicant_signature:
-        fields["form1[0].#subform[10].P12_SignatureApplicant[0]"] = applicant_signature
-        # Part 15/16 duplicate signature blocks (Signature at Interview, Oath of Allegiance)
-        fields["form1[0].#subform[13].ApplicantsSignature[0]"] = applicant_signature
-        fields["form1[0].#subform[13].Part15ApplicantsSignature[0]"] = applicant_signature
-    if signature_date:
-        fields["form1[0].#subform[13].Part15DateofSignature[0]"] = format_date(signature_date)
-        fields["form1[0].#subform[13].Part15DateofSignature[1]"] = format_date(signature_date)
-
-    # Fee Reduction (P10_Line1_Citizen: [0]=No, [1]=Yes)
-    if data.get("fee_reduction_requested") == "yes":
-        fields["form1[0].#subform[10].P10_Line1_Citizen[1]"] = "/Y"
-    elif data.get("fee_reduction_requested") == "no":
-        fields["form1[0].#subform[10].P10_Line1_Citizen[0]"] = "/N"
-
-    if data.get("household_income"):
-        fields["form1[0].#subform[10].P10_Line2_TotalHouseholdIn[0]"] = data["household_income"]
-    if data.get("household_size"):
-        fields["form1[0].#subform[10].P10_Line3_HouseHoldSize[0]"] = str(data["household_size"])
-    if data.get("household_income_earners"):
-        # Q4 "Total number of household members earning income" = P11_Line1_TotalChildren[1] on subform[10]
-        fields["form1[0].#subform[10].P11_Line1_TotalChildren[1]"] = str(data["household_income_earners"])
-    # Q5 "I reside in a household" (P10_Line5a: [0]=No, [1]=Yes)
-    if data.get("is_head_of_household") == "yes":
-        fields["form1[0].#subform[10].P10_Line5a[1]"] = "/Y"
-    elif data.get("is_head_of_household") == "no":
-        fields["form1[0].#subform[10].P10_Line5a[0]"] = "/N"
-    if data.get("head_of_household_name"):
-        fields["form1[0].#subform[10].P10_Line5b_NameOfHousehold[0]"] = data["head_of_household_name"]
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 12: INTERPRETER (Page 12)
-    # ═══════════════════════════════════════════════════════════════
-    if data.get("used_interpreter") == "yes":
-        if data.get("interpreter_last_name"):
-            fields["form1[0].#subform[11].P14_Line1_nterpreterFamilyName[0]"] = data["interpreter_last_name"]
-        if data.get("interpreter_first_name"):
-            fields["form1[0].#subform[11].P14_Line1_nterpreterGivenName[0]"] = data["interpreter_first_name"]
-        if data.get("interpreter_business_name"):
-            fields["form1[0].#subform[11].P14_Line2_NameofBusinessorOrgName[0]"] = data["interpreter_business_name"]
-        if data.get("interpreter_phone"):
-            fields["form1[0].#subform[11].P14_Line4_Telephone[0]"] = data["interpreter_phone"]
-        if data.get("interpreter_mobile"):
-            fields["form1[0].#subform[11].P14_Line5_Mobile[0]"] = data["interpreter_mobile"]
-        if data.get("interpreter_email"):
-            fields["form1[0].#subform[11].P14_Line5_EmailAddress[0]"] = data["interpreter_email"]
-        if data.get("interpreter_language"):
-            fields["form1[0].#subform[11].P14_NameOfLanguage[0]"] = data["interpreter_language"]
-        if data.get("interpreter_signature"):
-            fields["form1[0].#subform[11].P12_SignatureApplicant[1]"] = data["interpreter_signature"]
-        if data.get("interpreter_signature_date"):
-            fields["form1[0].#subform[11].P14_DateofSignature[0]"] = format_date(data["interpreter_signature_date"])
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 13: PREPARER (Page 12)
-    # ═══════════════════════════════════════════════════════════════
-    if data.get("used_preparer") == "yes":
-        if data.get("preparer_last_name"):
-            fields["form1[0].#subform[11].P15_Line1_PreparerFamilyName[0]"] = data["preparer_last_name"]
-        if data.get("preparer_first_name"):
-            fields["form1[0].#subform[11].P15_Line1_PreparerGivenName[0]"] = data["preparer_first_name"]
-        if data.get("preparer_business_name"):
-            fields["form1[0].#subform[11].P15_Line2_NameofBusinessorOrgName[0]"] = data["preparer_business_name"]
-        if data.get("preparer_phone"):
-            fields["form1[0].#subform[11].P15_Line4_Telephone[0]"] = data["preparer_phone"]
-        if data.get("preparer_mobile"):
-            fields["form1[0].#subform[11].P15_Line5_Mobile[0]"] = data["preparer_mobile"]
-        if data.get("preparer_email"):
-            fields["form1[0].#subform[11].P15_Line6_Email[0]"] = data["preparer_email"]
-        if data.get("preparer_signature"):
-            fields["form1[0].#subform[11].P12_SignatureApplicant[2]"] = data["preparer_signature"]
-        if data.get("preparer_signature_date"):
-            fields["form1[0].#subform[11].P15_DateofSignature[0]"] = format_date(data["preparer_signature_date"])
-
-    # ═══════════════════════════════════════════════════════════════
-    # PART 16: ADDITIONAL INFORMATION (Pages 13-14)
-    # ═══════════════════════════════════════════════════════════════
-    additional_entries = safe_get_array(data, "additional_information", [])
-    additional_field_sets = [
-        ("P11_Line3A", "P11_Line3B", "P11_Line3C", "P11_Line3D"),
-        ("P11_Line4A", "P11_Line4B", "P11_Line4C", "P11_Line4D"),
-        ("P11_Line5A", "P11_Line5B", "P11_Line5C", "P11_Line5D"),
-        ("P11_Line6A", "P11_Line6B", "P11_Line6C", "P11_Line6D"),
-    ]
-    for idx, entry in enumerate(additional_entries[:4]):
-        if not isinstance(entry, dict):
-            continue
-        page_field, part_field, item_field, explanation_field = additional_field_sets[idx]
-        if entry.get("page_number"):
-            fields[f"form1[0].#subform[12].{page_field}[0]"] = entry["page_number"]
-        if entry.get("part_number"):
-            fields[f"form1[0].#subform[12].{part_field}[0]"] = entry["part_number"]
-        if entry.get("item_number"):
-            fields[f"form1[0].#subform[12].{item_field}[0]"] = entry["item_number"]
-        if entry.get("explanation"):
-            fields[f"form1[0].#subform[12].{explanation_field}[0]"] = entry["explanation"]
-
-    return fields
-
-
-def fill_pdf(template_path: str, field_data: dict) -> bytes:
+    if not os.path.exists(TEMPLATE_PATH):
+        return
+    start = time.perf_counter()
+    fill_pdf(TEMPLATE_PATH, map_form_data_to_pdf_fields({"first_name": "Maria", "last_name": "Rodriguez"}))
+    if SIZE_DEFAULT:
+        compact_base(get_template(TEMPLATE_PATH), SIZE_DEFAULT)
+    logger.info("warmed up", extra={"warm_ms": round((time.perf_counter() - start) * 1000, 2)})
+
+
+def fill_page_chunks(template_path: str, field_data: dict, page_index: int,
+                     timer: Optional[RequestTimer] = None) -> PdfChunks:
     """
-    Fill PDF with form data and return bytes.
+    Fill and flatten one page of the template and return it as a one-page PdfChunks.
 
-    This mirrors the working logic from scripts/fill-pdf.py:
-    - Decrypts if needed
-    - Sets /NeedAppearances so viewers render updated fields
-    - Applies all fields across all pages via update_page_form_field_values
+    Only the widgets on that page are filled, and only the objects the page
+    reaches are written (see WorkingCopy.write_page_chunks).
     """
-    print(f"📄 Loading PDF from: {template_path}")
+    timer = timer or RequestTimer()
+    with timer.stage("template"):
+        template = get_template(template_path)
+    if not 0 <= page_index < template.page_count:
+        raise IndexError(f"page must be between 1 and {template.page_count}")
+    writer = template.working_copy()
+    with timer.stage("fill"):
+        timer.fields["filled_widgets"] = writer.update_widgets(field_data, page_index=page_index)
+    with timer.stage("flatten"):
+        writer.flatten(page_index=page_index)
+    with timer.stage("serialize"):
+        return writer.write_page_chunks(page_index)
+
+
+def pdf_response(pdf: PdfChunks, filename: str, disposition: str = "attachment") -> Response:
+    """
+    Stream a filled PDF as an attachment (or inline) with an exact Content-Length.
 
-    reader = PdfReader(template_path)
+    Same headers send_file sets for an in-memory file, but the body is
+    copied out of the chunks 64 KB at a time instead of being joined first.
+    """
+    response = Response(pdf.iter_bytes(), mimetype="application/pdf")
+    response.headers["Content-Length"] = str(len(pdf))
+    response.headers["Cache-Control"] = "no-cache"
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+        names = {"filename": simple, "filename*": f"UTF-8''{quote(filename, safe='')}"}
+    else:
+        names = {"filename": filename}
+    response.headers.set("Content-Disposition", disposition, **names)
+    return response
 
-    # Decrypt if needed
-    if reader.is_encrypted:
-        reader.decrypt('')
-        print("✓ Decrypted PDF")
 
-    writer = PdfWriter()
-    writer.append(reader)
+def wants_incremental() -> bool:
+    """Whether this request asked for incremental-update output (see fill_pdf)."""
+    return request.args.get("incremental", "1" if INCREMENTAL_DEFAULT else "0") == "1"
 
-    # Hint to PDF viewers that they should regenerate appearances
-    try:
-        if "/AcroForm" in writer._root_object:
-            acro_form = writer._root_object["/AcroForm"]
-            acro_form.update(
-                {NameObject("/NeedAppearances"): BooleanObject(True)}
-            )
-    except Exception as e:
-        print(f"⚠️ Could not set NeedAppearances: {e}")
 
-    # Get all field names for reference
-    fields = reader.get_fields() or {}
-    print(f"✓ Found {len(fields)} fields in PDF\n")
+def wants_flatten() -> bool:
+    """Whether this request asked for flattened output (see fill_pdf)."""
+    return request.args.get("flatten", "1" if FLATTEN_DEFAULT else "0") == "1"
 
-    print("Filling fields on all pages:")
-    filled_count = 0
 
-    # Apply mapping on every page
-    for page_index, page in enumerate(writer.pages):
-        try:
-            writer.update_page_form_field_values(
-                page,
-                field_data,
-                auto_regenerate=True,
-            )
-            print(f"  ✓ Applied mapping on page {page_index + 1}")
-        except Exception as e:
-            print(f"  ✗ Error applying fields on page {page_index + 1}: {e}")
+def wants_size_modes(incremental: bool) -> FrozenSet[str]:
+    """The size modes this request asked for (see fill_pdf); ValueError on unknown names."""
+    if incremental:
+        return frozenset()
+    if "size" not in request.args:
+        return SIZE_DEFAULT
+    return parse_size_modes(request.args["size"])
+
+
+def pdf_filename(data: dict) -> str:
+    last_name = data.get("last_name", "Unknown")
+    first_name = data.get("first_name", "Applicant")
+    return f"N-400_{last_name}_{first_name}.pdf".replace(" ", "_")
+
+
+class ChunkSink:
+    """Write-only target for zipfile that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
 
-    # Count how many of our target fields exist in the PDF
-    for field_name in field_data.keys():
-        if field_name in fields:
-            filled_count += 1
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
 
-    print(f"Filled up to {filled_count} of {len(field_data)} mapped fields")
+    def flush(self) -> None:
+        pass
 
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
 
-    return output.getvalue()
+
+def stream_batch_zip(items, incremental: bool = False, flatten: bool = False,
+                     size_modes: FrozenSet[str] = frozenset()):
+    """
+    Fill one PDF per (payload, error) item and yield the ZIP archive in pieces.
+
+    Each PDF is yielded as soon as it has been filled, so only one document is
+    held in memory at a time. manifest.json, written last, records the outcome
+    of every item; a failed item is reported there instead of failing the batch.
+    """
+    timer = RequestTimer()
+    sink = ChunkSink()
+    manifest = []
+    # ZIP_STORED: the PDF streams are already compressed
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for index, (data, error) in enumerate(items):
+            entry = {"index": index}
+            try:
+                if error:
+                    raise ValueError(error)
+                if not isinstance(data, dict) or not data:
+                    raise ValueError("No data provided")
+                data = decode_arrays(data)
+                violations = validate(data) if VALIDATE_DEFAULT else []
+                if violations:
+                    entry["violations"] = violations
+                    raise ValueError("Invalid intake payload")
+                field_data = map_form_data_to_pdf_fields(data)
+                pdf_bytes = fill_pdf(TEMPLATE_PATH, field_data, incremental=incremental, flatten=flatten,
+                                     size_modes=size_modes)
+                filename = f"{index + 1:04d}_{pdf_filename(data)}"
+                archive.writestr(filename, pdf_bytes)
+                entry.update({"status": "ok", "file": filename, "mapped_fields": len(field_data)})
+            except Exception as e:
+                logger.warning("batch item failed", extra={"index": index, "error": str(e)})
+                entry.update({"status": "error", "error": str(e)})
+            manifest.append(entry)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        succeeded = sum(1 for entry in manifest if entry["status"] == "ok")
+        timer.emit("generate_batch", total=len(manifest), failed=len(manifest) - succeeded)
+        archive.writestr("manifest.json", json.dumps({
+            "total": len(manifest),
+            "succeeded": succeeded,
+            "failed": len(manifest) - succeeded,
+            "items": manifest,
+        }, indent=2))
+    yield sink.drain()
 
 
 @app.route("/health", methods=["GET"])
 def health():
     template_exists = os.path.exists(TEMPLATE_PATH)
-    return jsonify({"status": "healthy", "template_exists": template_exists})
+    cache = get_pdf_cache()
+    return jsonify({
+        "status": "healthy",
+        "template_exists": template_exists,
+        "json_decoder": JSON_DECODER,
+        "pdf_cache": cache.stats() if cache is not None else None,
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition of this worker's metrics (see metrics.py)."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/debug/profiles", methods=["GET"])
+def debug_profiles():
+    """List recorded fill profiles, newest first (404 unless PDF_PROFILE_DIR is set, 403 unless authorized)."""
+    if profile_dir() is None:
+        abort(404)
+    if not profile_authorized(request.headers, request.remote_addr):
+        abort(403)
+    return jsonify({"profiles": list_profiles()})
+
+
+@app.route("/debug/profiles/<name>", methods=["GET"])
+def debug_profile(name: str):
+    if profile_dir() is None or not name.endswith(PROFILE_SUFFIXES):
+        abort(404)
+    if not profile_authorized(request.headers, request.remote_addr):
+        abort(403)
+    return send_from_directory(profile_dir(), name, mimetype="text/plain" if name.endswith(".folded") else None)
 
 
 @app.route("/generate", methods=["POST"])
-def generate_pdf():
+@instrumented("generate")
+def generate_pdf(timer: RequestTimer):
     try:
-        data = request.get_json()
+        try:
+            with timer.stage("parse"):
+                data = read_intake(request.stream, request.content_length)
+        except PayloadError as e:
+            timer.emit("generate", level=logging.WARNING, status=e.status, error=str(e))
+            return jsonify({"error": str(e)}), e.status
 
         if not data:
+            timer.emit("generate", level=logging.WARNING, status=400, error="No data provided")
             return jsonify({"error": "No data provided"}), 400
 
+        # Fail fast, before the template or the mapping is touched (see intake_schema.py)
+        if VALIDATE_DEFAULT:
+            with timer.stage("validate"):
+                violations = validate(data)
+            if violations:
+                timer.emit("generate", level=logging.WARNING, status=422, error="Invalid intake payload",
+                           violations=len(violations))
+                return jsonify({"error": "Invalid intake payload", "violations": violations}), 422
+
         if not os.path.exists(TEMPLATE_PATH):
+            timer.emit("generate", level=logging.ERROR, status=500, error="PDF template not found")
             return jsonify({"error": "PDF template not found"}), 500
 
-        print(f"Received {len(data)} fields from form")
-
-        field_data = map_form_data_to_pdf_fields(data)
-        print(f"Mapped to {len(field_data)} PDF fields")
+        with timer.stage("map"):
+            field_data = map_form_data_to_pdf_fields(data)
+        timer.fields.update(input_fields=len(data), mapped_fields=len(field_data))
 
-        pdf_bytes = fill_pdf(TEMPLATE_PATH, field_data)
-
-        last_name = data.get("last_name", "Unknown")
-        first_name = data.get("first_name", "Applicant")
-        filename = f"N-400_{last_name}_{first_name}.pdf".replace(" ", "_")
-
-        return send_file(
-            io.BytesIO(pdf_bytes),
-            mimetype="application/pdf",
-            as_attachment=True,
-            download_name=filename
+        incremental = wants_incremental()
+        flatten = wants_flatten()
+        try:
+            size_modes = wants_size_modes(incremental)
+        except ValueError as e:
+            timer.emit("generate", level=logging.WARNING, status=400, error=str(e))
+            return jsonify({"error": str(e)}), 400
+        # Profiled requests always fill, in this thread, so the profile sees pypdf
+        profile = profile_requested(request.headers, request.remote_addr)
+        profile_name = None
+        cache = get_pdf_cache()
+        cached = None
+        pooled = False
+        if cache is not None:
+            with timer.stage("cache"):
+                key = cache_key(field_data, TEMPLATE_PATH, incremental, flatten, size_modes)
+                if not profile:
+                    cached = cache.get(key)
+
+        if cached is not None:
+            pdf = cached
+        else:
+            pool = get_fill_pool(TEMPLATE_PATH)
+            pooled = pool is not None and not profile
+            if pooled:
+                # Fill and serialize both happen in the pool process
+                with timer.stage("fill"):
+                    pdf = PdfChunks()
+                    pdf.write(memoryview(pool.fill(field_data, incremental=incremental, flatten=flatten,
+                                                   size_modes=size_modes)))
+            else:
+                # A profiled fill still holds a pool slot, so it can't exceed PDF_FILL_QUEUE
+                with pool.slot() if pool is not None else nullcontext():
+                    with maybe_profile(profile, "generate") as profile_name:
+                        pdf = fill_pdf_chunks(TEMPLATE_PATH, field_data, incremental=incremental,
+                                              flatten=flatten, timer=timer, size_modes=size_modes)
+            if cache is not None:
+                with timer.stage("cache"):
+                    cache.put(key, pdf)
+
+        response = pdf_response(pdf, pdf_filename(data))
+        if cache is not None:
+            response.headers["X-PDF-Cache"] = "hit" if cached is not None else "miss"
+        if profile_name:
+            response.headers[PROFILE_HEADER] = profile_name
+        timer.emit(
+            "generate",
+            status=200,
+            bytes=len(pdf),
+            incremental=incremental,
+            flatten=flatten,
+            size=",".join(sorted(size_modes)) or None,
+            cache=response.headers.get("X-PDF-Cache"),
+            pool=pooled,
+            profile=profile_name,
         )
+        return response
+
+    except PoolBusy as e:
+        timer.emit("generate", level=logging.WARNING, status=503, error=str(e))
+        response = jsonify({"error": "Server busy, retry shortly"})
+        response.status_code = 503
+        response.headers["Retry-After"] = FILL_RETRY_AFTER
+        return response
 
     except Exception as e:
-        print(f"Error generating PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        timer.emit("generate", level=logging.ERROR, exc_info=True, status=500, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/preview", methods=["GET", "POST"])
+@instrumented("preview")
+def preview_page(timer: RequestTimer):
+    """
+    One page of the filled form, flattened, for a live preview while editing.
+
+    ``page`` is 1-based. POST the intake payload as for /generate; GET (or an
+    empty body) previews the blank page.
+    """
+    try:
+        page_index = int(request.args.get("page", "")) - 1
+    except ValueError:
+        return jsonify({"error": "page must be a page number"}), 400
+
+    try:
+        with timer.stage("parse"):
+            data = read_intake(request.stream, request.content_length) if request.method == "POST" else None
+    except PayloadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    if not os.path.exists(TEMPLATE_PATH):
+        return jsonify({"error": "PDF template not found"}), 500
+
+    with timer.stage("map"):
+        field_data = map_form_data_to_pdf_fields(data) if data else {}
+    try:
+        pdf = fill_page_chunks(TEMPLATE_PATH, field_data, page_index, timer=timer)
+    except IndexError as e:
+        return jsonify({"error": str(e)}), 400
+
+    timer.emit("preview", status=200, page=page_index + 1, bytes=len(pdf))
+    return pdf_response(pdf, f"N-400_page{page_index + 1}.pdf", disposition="inline")
+
+
+@app.route("/generate/batch", methods=["POST"])
+def generate_batch():
+    """
+    Generate a PDF for each intake payload and stream them back as a ZIP.
+
+    The body is a JSON array of payloads, or NDJSON (one payload per line)
+    when sent as application/x-ndjson, which is read as the archive is written.
+    Both are decoded and capped by intake.py.
+    """
+    if not os.path.exists(TEMPLATE_PATH):
+        return jsonify({"error": "PDF template not found"}), 500
+
+    if request.mimetype == "application/x-ndjson":
+        items = iter_ndjson(request.stream)
+    else:
+        try:
+            data = read_batch(request.stream, request.content_length)
+        except PayloadError as e:
+            return jsonify({"error": str(e)}), e.status
+        items = ((payload, None) for payload in data)
+
+    incremental = wants_incremental()
+    try:
+        size_modes = wants_size_modes(incremental)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return Response(
+        stream_with_context(stream_batch_zip(items, incremental=incremental, flatten=wants_flatten(),
+                                             size_modes=size_modes)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="N-400_batch.zip"'},
+    )
+
+
 @app.route("/fields", methods=["GET"])
 def list_fields():
+    """
+    The template's field catalog (see ParsedTemplate.field_catalog).
+
+    ``?q=`` keeps fields whose name or tooltip contains it (case-insensitive)
+    and ``?type=Tx|Btn|Ch`` one field type. Responses carry a strong ETag
+    and are answered with 304 when the client already has them.
+    """
     if not os.path.exists(TEMPLATE_PATH):
         return jsonify({"error": "Template not found"}), 404
 
-    reader = PdfReader(TEMPLATE_PATH)
-    if reader.is_encrypted:
-        reader.decrypt('')
+    catalog = get_template(TEMPLATE_PATH).field_catalog()
+    query = request.args.get("q", "").strip()
+    field_type = request.args.get("type") or None
+    if query or field_type:
+        body = catalog_body(catalog.search(query, field_type))
+        etag = hashlib.sha256(body).hexdigest()[:32]
+    else:
+        body, etag = catalog.body, catalog.etag
 
-    fields = reader.get_fields()
-    field_names = list(fields.keys()) if fields else []
-
-    return jsonify({
-        "total_fields": len(field_names),
-        "fields": field_names[:200],
-    })
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = FIELDS_CACHE_CONTROL
+    return response.make_conditional(request)
 
 
 @app.route("/test", methods=["GET"])
@@ -1058,14 +592,7 @@ def test_pdf():
     }
 
     field_data = map_form_data_to_pdf_fields(sample_data)
-    pdf_bytes = fill_pdf(TEMPLATE_PATH, field_data)
-
-    return send_file(
-        io.BytesIO(pdf_bytes),
-        mimetype="application/pdf",
-        as_attachment=True,
-        download_name="N-400_TEST.pdf"
-    )
+    return pdf_response(fill_pdf_chunks(TEMPLATE_PATH, field_data), "N-400_TEST.pdf")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,315 @@
+"""
+Appearance streams for filled text fields.
+
+pypdf's auto_regenerate re-derives a widget's rectangle, /DA font and
+font encoding on every fill, and /NeedAppearances then asks the viewer to do
+the same work again. AppearanceGenerator does that lookup once per widget of
+a parsed template (``TextLayout``: box size, font, size, comb/MaxLen,
+multiline, alignment) and renders ``/AP /N`` for a value directly.
+
+Rendered appearances are kept in an LRU keyed by (layout, value), so the
+values that repeat across applicants ("United States", "N/A", state codes,
+dates) are rendered once per worker. The cached objects are shared by every
+request: they serialize to fixed bytes and are never modified.
+
+Fonts are looked up by the /DA font name in the AcroForm /DR, then in the
+/DR of the widget or its parent fields, so a field can bring fonts the
+document-wide resources don't have.
+
+PDF_APPEARANCE_CACHE sets the LRU size in entries (default 4096, 0 disables).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from pypdf._cmap import build_char_map_from_dict
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+)
+
+from request_log import logger
+
+# Field flags (/Ff) and the widths used to lay out text
+_MULTILINE = 1 << 12
+_COMBO = 1 << 17
+_COMB = 1 << 24
+# Average glyph width in em; the template's fields all use Courier faces (0.6 em)
+_CHAR_WIDTH = 0.6
+_LINE_HEIGHT = 1.15
+_PADDING = 2.0
+
+
+class TextLayout(NamedTuple):
+    """Everything about a text widget that its appearance depends on, other than the value."""
+    width: float
+    height: float
+    font_name: str
+    font_size: float  # 0 = fit the box
+    # /DA with the font size left as {size}, e.g. "/CourierStd {size} Tf 0 g"
+    da_format: str
+    comb: bool
+    max_len: int  # 0 = no limit
+    multiline: bool
+    quadding: int  # 0 left, 1 centre, 2 right
+    # 0 = the AcroForm /DR font; else the key of a widget /DR font in AppearanceGenerator._widget_fonts
+    font_id: int = 0
+
+
+class Appearance(DecodedStreamObject):
+    """
+    A form XObject rendered for one (layout, value), shared between requests.
+
+    pypdf's StreamObject.write_to_stream sets and deletes /Length on the
+    object while writing it, which is not safe when several requests write the
+    same object at once; this one writes bytes serialized when it was built.
+    """
+
+    def freeze(self) -> "Appearance":
+        buffer = BytesIO()
+        header = DictionaryObject(self)
+        header[NameObject("/Length")] = NumberObject(len(self._data))
+        header.write_to_stream(buffer)
+        buffer.write(b"\nstream\n")
+        buffer.write(self._data)
+        buffer.write(b"\nendstream")
+        self._serialized = buffer.getvalue()
+        return self
+
+    def write_to_stream(self, stream, encryption_key=None) -> None:
+        stream.write(self._serialized)
+
+
+def inherited(annot: DictionaryObject, key: str):
+    """``key`` from the widget or the nearest field above it that has it (inheritable field attributes)."""
+    node = annot
+    while node is not None:
+        if key in node:
+            return node[key]
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    return None
+
+
+def _escape(text: bytes) -> bytes:
+    return text.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class AppearanceGenerator:
+    """Per-template text appearance renderer with a shared LRU of rendered streams."""
+
+    def __init__(self, root_object: DictionaryObject, default_da: str, max_entries: int):
+        acro_form = root_object["/AcroForm"]
+        fonts = acro_form.get("/DR", DictionaryObject()).get_object().get("/Font", DictionaryObject())
+        self._fonts: DictionaryObject = fonts.get_object()
+        # font_id -> font (reference) from a widget's or field's own /DR
+        self._widget_fonts: Dict[int, object] = {}
+        self._default_da = str(default_da)
+        self._layouts: Dict[int, Optional[TextLayout]] = {}
+        self._encodings: Dict[Tuple[str, int], Dict[str, bytes]] = {}
+        self._cache: "OrderedDict[Tuple[TextLayout, str], Appearance]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def layout(self, idnum: int, annot: DictionaryObject) -> Optional[TextLayout]:
+        """The widget's TextLayout, or None when it needs pypdf's generator (list boxes)."""
+        if idnum in self._layouts:
+            return self._layouts[idnum]
+        flags = int(inherited(annot, "/Ff") or 0)
+        layout = None
+        if inherited(annot, "/FT") == "/Tx" or flags & _COMBO:
+            rect = [float(v) for v in annot["/Rect"]]
+            da = str(inherited(annot, "/DA") or self._default_da)
+            tokens = da.replace("\r", " ").replace("\n", " ").split()
+            tf = tokens.index("Tf")
+            font_name, font_size = tokens[tf - 2], float(tokens[tf - 1])
+            tokens[tf - 1] = "{size}"
+            max_len = int(inherited(annot, "/MaxLen") or 0)
+            layout = TextLayout(
+                width=abs(rect[2] - rect[0]),
+                height=abs(rect[3] - rect[1]),
+                font_name=font_name,
+                font_size=font_size,
+                da_format=" ".join(tokens),
+                comb=bool(flags & _COMB) and max_len > 0,
+                max_len=max_len,
+                multiline=bool(flags & _MULTILINE),
+                quadding=int(inherited(annot, "/Q") or 0),
+                font_id=self._widget_font(annot, font_name),
+            )
+        self._layouts[idnum] = layout
+        return layout
+
+    def _widget_font(self, annot: DictionaryObject, font_name: str) -> int:
+        """0 when the AcroForm /DR has ``font_name``, else the font_id of the widget /DR font (0 if none)."""
+        if font_name in self._fonts:
+            return 0
+        resources = inherited(annot, "/DR")
+        fonts = resources.get_object().get("/Font") if resources is not None else None
+        fonts = fonts.get_object() if fonts is not None else None
+        if fonts is None or font_name not in fonts:
+            return 0
+        ref = fonts.raw_get(font_name)
+        # Object number for the usual indirect font, so fields sharing it share appearances
+        font_id = ref.idnum if isinstance(ref, IndirectObject) else -id(ref)
+        self._widget_fonts[font_id] = ref
+        return font_id
+
+    def _font(self, layout: TextLayout):
+        """The layout's font as stored in its /DR (usually a reference), or None."""
+        if layout.font_id:
+            return self._widget_fonts[layout.font_id]
+        return self._fonts.raw_get(layout.font_name) if layout.font_name in self._fonts else None
+
+    def appearance(self, layout: TextLayout, value: str) -> Appearance:
+        """The cached appearance for ``value`` in ``layout``, rendering it on a miss."""
+        key = (layout, value)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        rendered = self.render(layout, value)
+        if self.max_entries > 0:
+            with self._lock:
+                self._cache[key] = rendered
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return rendered
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+    def _encoding(self, layout: TextLayout) -> Dict[str, bytes]:
+        """Unicode character -> font code, built once per font like pypdf's _update_text_field."""
+        font_name = layout.font_name
+        encoding = self._encodings.get((font_name, layout.font_id))
+        if encoding is None:
+            encoding = {}
+            font = self._font(layout)
+            if font is not None:
+                try:
+                    _, _, font_encoding, font_map = build_char_map_from_dict(200, font.get_object())
+                    font_map.pop(-1, None)
+                    if isinstance(font_encoding, str):
+                        encoding = {v: k.encode(font_encoding) for k, v in font_map.items()}
+                    else:
+                        encoding = {v: bytes((k,)) for k, v in font_encoding.items()}
+                        reverse = dict(encoding)
+                        for k, v in font_map.items():
+                            encoding[v] = reverse.get(k, k)
+                except Exception as e:
+                    logger.warning("could not read font encoding", extra={"font": font_name, "error": str(e)})
+            self._encodings[(font_name, layout.font_id)] = encoding
+        return encoding
+
+    def _show(self, text: str, encoding: Dict[str, bytes]) -> bytes:
+        codes = [encoding.get(c) or c.encode("utf-16-be") for c in text]
+        if any(len(code) >= 2 for code in codes):
+            return b"<" + b"".join(codes).hex().encode() + b"> Tj\n"
+        return b"(" + _escape(b"".join(codes)) + b") Tj\n"
+
+    def render(self, layout: TextLayout, value: str) -> Appearance:
+        width, height = layout.width, layout.height
+        if layout.max_len:
+            value = value[:layout.max_len]
+        lines = value.replace("\r\n", "\n").replace("\r", "\n").split("\n") if layout.multiline else [
+            value.replace("\r", " ").replace("\n", " ")
+        ]
+
+        size = layout.font_size
+        if size == 0:
+            # Auto size: as large as fits the box height (one line) and the longest line
+            longest = max((len(line) for line in lines), default=1) or 1
+            size = min(12.0, height - 2 * _PADDING) if not layout.multiline else 10.0
+            if not layout.comb:
+                size = min(size, (width - 2 * _PADDING) / (longest * _CHAR_WIDTH))
+            size = max(size, 4.0)
+        if layout.multiline:
+            lines = self._wrap(lines, (width - 2 * _PADDING) / (size * _CHAR_WIDTH))
+
+        encoding = self._encoding(layout)
+        da = layout.da_format.format(size=f"{size:g}")
+        ops = [f"/Tx BMC\nq\n1 1 {width - 2:g} {height - 2:g} re W n\nBT\n{da}\n".encode()]
+        if layout.comb:
+            cell = width / layout.max_len
+            glyph = size * _CHAR_WIDTH
+            y = (height - size) / 2 + 0.22 * size
+            x_prev = 0.0
+            for i, char in enumerate(value):
+                x = cell * i + (cell - glyph) / 2
+                ops.append(f"{x - x_prev:g} {y if i == 0 else 0:g} Td\n".encode())
+                ops.append(self._show(char, encoding))
+                x_prev = x
+        else:
+            line_height = size * _LINE_HEIGHT
+            if layout.multiline:
+                y = height - _PADDING - size * 0.78
+            else:
+                y = (height - size) / 2 + 0.22 * size
+            x_prev, y_prev = 0.0, 0.0
+            for line in lines:
+                text_width = len(line) * size * _CHAR_WIDTH
+                if layout.quadding == 1:
+                    x = (width - text_width) / 2
+                elif layout.quadding == 2:
+                    x = width - _PADDING - text_width
+                else:
+                    x = _PADDING
+                ops.append(f"{x - x_prev:g} {y - y_prev:g} Td\n".encode())
+                ops.append(self._show(line, encoding))
+                x_prev, y_prev = x, y
+                y -= line_height
+        ops.append(b"ET\nQ\nEMC\n")
+
+        appearance = Appearance()
+        appearance.set_data(b"".join(ops))
+        appearance[NameObject("/Type")] = NameObject("/XObject")
+        appearance[NameObject("/Subtype")] = NameObject("/Form")
+        appearance[NameObject("/BBox")] = ArrayObject(
+            [NumberObject(0), NumberObject(0), FloatObject(width), FloatObject(height)]
+        )
+        font_ref = self._font(layout)
+        if font_ref is not None:
+            appearance[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/Font"): DictionaryObject({NameObject(layout.font_name): font_ref}),
+            })
+        return appearance.freeze()
+
+    @staticmethod
+    def _wrap(lines, max_chars: float):
+        max_chars = max(1, int(max_chars))
+        wrapped = []
+        for line in lines:
+            words = line.split(" ")
+            current = ""
+            for word in words:
+                candidate = f"{current} {word}" if current else word
+                if len(candidate) <= max_chars:
+                    current = candidate
+                    continue
+                if current:
+                    wrapped.append(current)
+                while len(word) > max_chars:
+                    wrapped.append(word[:max_chars])
+                    word = word[max_chars:]
+                current = word
+            wrapped.append(current)
+        return wrapped
+
+
+def cache_size_from_env() -> int:
+    return int(os.environ.get("PDF_APPEARANCE_CACHE", "4096"))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Fill pool load test.
+
+Drives fill_pdf from concurrent client threads, first in-process (what the
+request thread does without the pool) and then through FillPool at 1, 2, 4, ...
+worker processes up to the core count, and reports throughput per setting.
+
+Run with: python3 bench_fill_pool.py [requests_per_setting]
+"""
+
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import TEMPLATE_PATH, fill_pdf, map_form_data_to_pdf_fields
+from fill_pool import FillPool, PoolBusy
+from request_log import logger
+from template_cache import get_template
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+
+def run_load(fill, clients: int, requests: int):
+    latencies = []
+    rejected = 0
+
+    def one_request(_):
+        start = time.perf_counter()
+        try:
+            fill()
+        except PoolBusy:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as clients_pool:
+        for latency in clients_pool.map(one_request, range(requests)):
+            if latency is None:
+                rejected += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies, rejected
+
+
+def report(label: str, throughput: float, latencies: list, rejected: int) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<18}{throughput:>9.2f}{statistics.median(ordered) * 1000:>10.0f}"
+          f"{p95 * 1000:>10.0f}{rejected:>10}")
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.WARNING)  # one record per fill would drown the table
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    cores = os.cpu_count() or 1
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+    get_template(TEMPLATE_PATH)
+
+    print(f"{cores} cores, {requests} requests per setting, 2 clients per worker")
+    print(f"{'engine':<18}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'503s':>10}")
+    result = run_load(lambda: fill_pdf(TEMPLATE_PATH, field_data), 2, requests)
+    report("in-process", *result)
+
+    workers = 1
+    while True:
+        # Queue sized so the clients never see a 503 while measuring throughput
+        pool = FillPool(TEMPLATE_PATH, workers, max_pending=workers * 2)
+        pool.fill(field_data)  # wait for the workers to finish warming up
+        result = run_load(lambda: pool.fill(field_data), workers * 2, requests)
+        pool.shutdown()
+        report(f"pool x{workers}", *result)
+        if workers >= cores:
+            break
+        workers = min(workers * 2, cores)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Full re-serialization vs incremental update benchmark.
+
+Times and measures peak allocations of writing a filled working copy with
+PdfWriter.write against writing only the incremental update tail.
+
+Run with: python3 bench_incremental.py [iterations]
+"""
+
+import io
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+
+from app import TEMPLATE_PATH, map_form_data_to_pdf_fields
+from request_log import logger
+from template_cache import get_template
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+
+def filled_copy(template, field_data):
+    writer = template.working_copy()
+    writer.update_widgets(field_data)
+    return writer
+
+
+def full_write(writer) -> int:
+    output = io.BytesIO()
+    writer.write(output)
+    return len(output.getvalue())
+
+
+def incremental_write(writer) -> int:
+    return len(writer.template.base.data) + len(writer.incremental_tail())
+
+
+def measure(template, field_data, write, iterations: int):
+    timings = []
+    size = 0
+    for _ in range(iterations):
+        writer = filled_copy(template, field_data)
+        start = time.perf_counter()
+        size = write(writer)
+        timings.append(time.perf_counter() - start)
+
+    # Separate pass: tracemalloc slows everything down too much to time under it
+    writer = filled_copy(template, field_data)
+    tracemalloc.start()
+    write(writer)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak, size
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.WARNING)  # one record per fill would drown the table
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+    template = get_template(TEMPLATE_PATH)
+
+    print(f"{'mode':<14}{'p50 ms':>10}{'peak alloc KB':>16}{'output KB':>12}")
+    for label, write in (("full", full_write), ("incremental", incremental_write)):
+        p50, peak, size = measure(template, field_data, write, iterations)
+        print(f"{label:<14}{p50 * 1000:>10.1f}{peak / 1024:>16.0f}{size / 1024:>12.0f}")
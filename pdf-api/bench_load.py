@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Load test against a local gunicorn running app.py.
+
+Stands in for the Next.js route (app/api/generate-n400/route.ts): builds
+randomized intake payloads the way Supabase stores them, with array answers
+as JSON strings, then normalizes them the way the route does and POSTs them to
+/generate. The payloads are COMPREHENSIVE_TEST_DATA with fresh names and
+a random number of trips, crimes, children, addresses and jobs, so
+the generated-PDF cache misses as it would for different applicants.
+
+Requests are sent open-loop at --rps for --duration seconds per gunicorn
+worker count. Latency is measured from when each request was due, not when a
+free client thread sent it, so a server that falls behind shows up as
+latency instead of as a lower send rate.
+
+Run with:
+  python3 bench_load.py --workers 1,2,4 --rps 8 --duration 30
+  python3 bench_load.py --url http://localhost:5000 --rps 4   # an already running server
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+# Same list as route.ts: stored as JSON strings in Supabase, sent as arrays
+ARRAY_FIELDS = (
+    "other_names",
+    "residence_addresses",
+    "employment_history",
+    "trips",
+    "children",
+    "crimes",
+    "additional_information",
+)
+
+FIRST_NAMES = ("Maria", "Jose", "Wei", "Aisha", "Dmitri", "Priya", "Kwame", "Lucia", "Hiroshi", "Fatima")
+LAST_NAMES = ("Rodriguez", "Nguyen", "Okafor", "Kowalski", "Haddad", "Singh", "Silva", "Kim", "Ivanova")
+COUNTRIES = ("Mexico", "Canada", "India", "Philippines", "Nigeria", "Poland", "Brazil", "Japan")
+CITIES = (("Houston", "TX", "77002"), ("Chicago", "IL", "60601"), ("Miami", "FL", "33101"),
+          ("Seattle", "WA", "98101"), ("Newark", "NJ", "07102"))
+
+
+def random_date(rng: random.Random, start_year: int, end_year: int) -> str:
+    return f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(start_year, end_year)}"
+
+
+def stored_payload(rng: random.Random) -> dict:
+    """One applicant as the n400_forms row holds it: arrays serialized as JSON strings."""
+    payload = copy.deepcopy(COMPREHENSIVE_TEST_DATA)
+    payload["first_name"] = rng.choice(FIRST_NAMES)
+    payload["last_name"] = rng.choice(LAST_NAMES)
+    payload["a_number"] = f"{rng.randint(10000000, 999999999)}"
+    payload["date_of_birth"] = random_date(rng, 1950, 2000)
+
+    # Up to one past each form limit, so truncation is exercised too
+    payload["trips"] = [
+        {
+            "date_left_us": random_date(rng, 2019, 2024),
+            "date_returned_us": random_date(rng, 2019, 2024),
+            "countries_traveled": rng.choice(COUNTRIES),
+        }
+        for _ in range(rng.randint(0, 7))
+    ]
+    payload["crimes"] = [
+        {
+            "crime_description": "Traffic violation",
+            "date_of_crime": random_date(rng, 2005, 2020),
+            "date_of_conviction": random_date(rng, 2005, 2020),
+            "place_of_crime": f"{rng.choice(CITIES)[0]}, USA",
+            "result_disposition": "Fine paid",
+            "sentence": "None",
+        }
+        for _ in range(rng.choice((0, 0, 0, 1, 2, 6)))
+    ]
+    payload["children"] = [
+        {
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": payload["last_name"],
+            "date_of_birth": random_date(rng, 2000, 2020),
+            "residence": "resides_with_me",
+            "relationship": "biological_child",
+        }
+        for _ in range(rng.randint(0, 4))
+    ]
+    payload["total_children"] = str(len(payload["children"]))
+    payload["residence_addresses"] = [
+        {
+            "street_address": f"{rng.randint(1, 9999)} Main St",
+            "city": city,
+            "state": state,
+            "zip_code": zip_code,
+            "country": "USA",
+            "dates_from": random_date(rng, 2010, 2018),
+            "dates_to": random_date(rng, 2018, 2024),
+        }
+        for city, state, zip_code in (rng.choice(CITIES) for _ in range(rng.randint(1, 4)))
+    ]
+    payload["employment_history"] = [
+        {
+            "employer_or_school": f"Employer {rng.randint(1, 500)}",
+            "occupation_or_field": "Nurse",
+            "city": city,
+            "state": state,
+            "zip_code": zip_code,
+            "country": "USA",
+            "dates_from": random_date(rng, 2010, 2018),
+            "dates_to": random_date(rng, 2018, 2024),
+        }
+        for city, state, zip_code in (rng.choice(CITIES) for _ in range(rng.randint(1, 4)))
+    ]
+
+    for key in ARRAY_FIELDS:
+        if key in payload:
+            payload[key] = json.dumps(payload[key])
+    return payload
+
+
+def normalize_payload(stored: dict) -> dict:
+    """What route.ts does before calling /generate: parse JSON-string array fields."""
+    payload = dict(stored)
+    for key in ARRAY_FIELDS:
+        value = payload.get(key)
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                continue
+            if isinstance(parsed, list):
+                payload[key] = parsed
+    return payload
+
+
+def post(url: str, body: bytes, timeout: float):
+    """POST one payload; returns (status, error). Status 0 means no HTTP response."""
+    req = urllib.request.Request(f"{url}/generate", data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status, None
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, None
+    except (urllib.error.URLError, OSError) as e:
+        return 0, type(e).__name__
+
+
+def run_load(url: str, rps: float, duration: float, bodies: list, clients: int, timeout: float) -> dict:
+    total = max(1, int(rps * duration))
+    results = []
+    results_lock = threading.Lock()
+
+    def one_request(i: int, due: float):
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        status, error = post(url, bodies[i % len(bodies)], timeout)
+        with results_lock:
+            results.append((time.perf_counter() - due, status, error))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for i in range(total):
+            pool.submit(one_request, i, start + i / rps)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, status, _ in results if status == 200)
+    outcomes = Counter(str(status) if status else error for _, status, error in results)
+    errors = total - len(latencies)
+
+    def pct(p):
+        if not latencies:
+            return None
+        return round(latencies[max(0, -(-len(latencies) * p // 100) - 1)] * 1000, 1)
+
+    return {
+        "target_rps": rps,
+        "requests": total,
+        "ok": len(latencies),
+        "error_rate": round(errors / total, 4),
+        "outcomes": dict(outcomes),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+def wait_healthy(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not become healthy within {timeout:.0f}s")
+
+
+def start_gunicorn(workers: int, threads: int, port: int, extra_args: list) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("PDF_LOG_LEVEL", "WARNING")
+    command = [
+        "gunicorn", "app:app",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--bind", f"127.0.0.1:{port}",
+        "--timeout", "120",
+    ] + extra_args
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def report(label: str, result: dict) -> None:
+    def ms(value):
+        return f"{value:>9.0f}" if value is not None else f"{'-':>9}"
+    print(f"{label:<10}{result['target_rps']:>8g}{result['throughput_rps']:>9.2f}"
+          f"{ms(result['p50_ms'])}{ms(result['p95_ms'])}{ms(result['p99_ms'])}"
+          f"{result['error_rate'] * 100:>8.1f}%  {result['outcomes']}", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test /generate on a local gunicorn.")
+    parser.add_argument("--workers", default="1,2",
+                        help="comma-separated gunicorn worker counts to test (default: 1,2)")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn --threads per worker")
+    parser.add_argument("--rps", type=float, default=4, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per worker count")
+    parser.add_argument("--clients", type=int, default=64, help="max requests in flight from this script")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--payloads", type=int, default=200, help="distinct randomized applicants")
+    parser.add_argument("--seed", type=int, default=1, help="payload RNG seed")
+    parser.add_argument("--port", type=int, default=5055, help="port for the gunicorn started here")
+    parser.add_argument("--url", help="test this server instead of starting gunicorn (ignores --workers)")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("gunicorn_args", nargs="*", help="extra gunicorn arguments, after --")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    bodies = [json.dumps(normalize_payload(stored_payload(rng))).encode() for _ in range(args.payloads)]
+    sizes = sorted(len(body) for body in bodies)
+    print(f"{len(bodies)} payloads, {sizes[0]}-{sizes[-1]} bytes; {args.rps:g} rps for {args.duration:g}s each",
+          file=sys.stderr)
+    print(f"{'workers':<10}{'rps':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}",
+          file=sys.stderr)
+
+    results = {}
+    if args.url:
+        wait_healthy(args.url, 10)
+        results["external"] = run_load(args.url, args.rps, args.duration, bodies, args.clients, args.timeout)
+        report("external", results["external"])
+    else:
+        for workers in (int(w) for w in args.workers.split(",")):
+            url = f"http://127.0.0.1:{args.port}"
+            process = start_gunicorn(workers, args.threads, args.port, args.gunicorn_args)
+            try:
+                wait_healthy(url, 60)
+                # Warm every worker's template cache before measuring
+                run_load(url, workers, 2, bodies[-workers * 2:], args.clients, args.timeout)
+                result = run_load(url, args.rps, args.duration, bodies, args.clients, args.timeout)
+            finally:
+                stop(process)
+            result["workers"] = workers
+            result["threads"] = args.threads
+            results[str(workers)] = result
+            report(str(workers), result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rps": args.rps, "duration": args.duration, "results": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Field mapping micro-benchmark.
+
+Measures map_form_data_to_pdf_fields calls per second on
+COMPREHENSIVE_TEST_DATA (best of several timeit repeats), so a slower mapping
+spec or compiler shows up before it reaches a fill.
+
+Run with: python3 bench_mapping.py [calls_per_repeat]
+"""
+
+import sys
+import timeit
+
+from field_mapping import map_form_data_to_pdf_fields
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    fields = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+    timings = timeit.repeat(
+        lambda: map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA),
+        number=calls,
+        repeat=5,
+    )
+    best = min(timings) / calls
+    print(f"{len(fields)} fields per call, {calls} calls x 5 repeats")
+    print(f"{'calls/s':>10}{'us/call':>10}")
+    print(f"{1 / best:>10.0f}{best * 1e6:>10.1f}")
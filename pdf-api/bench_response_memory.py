@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Response memory benchmark.
+
+Peak Python allocations while producing and sending one /generate response:
+"buffered" is the old path (fill_pdf bytes wrapped in a BytesIO for
+send_file), "streamed" is fill_pdf_chunks + pdf_response. The response body
+is consumed chunk by chunk and discarded, as a WSGI server would send it.
+
+Run with: python3 bench_response_memory.py [iterations]
+"""
+
+import io
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+
+from flask import send_file
+
+from app import TEMPLATE_PATH, app, fill_pdf, fill_pdf_chunks, map_form_data_to_pdf_fields, pdf_response
+from request_log import logger
+from template_cache import get_template
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+
+def buffered(field_data, incremental):
+    return send_file(
+        io.BytesIO(fill_pdf(TEMPLATE_PATH, field_data, incremental=incremental)),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name="N-400.pdf",
+    )
+
+
+def streamed(field_data, incremental):
+    return pdf_response(fill_pdf_chunks(TEMPLATE_PATH, field_data, incremental=incremental), "N-400.pdf")
+
+
+def send(make_response, field_data, incremental) -> int:
+    with app.test_request_context():
+        response = make_response(field_data, incremental)
+        response.direct_passthrough = False
+        sent = sum(len(chunk) for chunk in response.iter_encoded())
+        response.close()
+    return sent
+
+
+def measure(make_response, field_data, incremental, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        size = send(make_response, field_data, incremental)
+        timings.append(time.perf_counter() - start)
+
+    # Separate pass: tracemalloc slows everything down too much to time under it
+    tracemalloc.start()
+    send(make_response, field_data, incremental)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak, size
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.WARNING)  # one record per fill would drown the table
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+
+    print(f"{'response':<24}{'p50 ms':>10}{'peak alloc KB':>16}{'sent KB':>10}")
+    get_template(TEMPLATE_PATH)
+    for incremental in (False, True):
+        for label, make_response in (("buffered", buffered), ("streamed", streamed)):
+            p50, peak, size = measure(make_response, field_data, incremental, iterations)
+            label = f"{label} ({'incremental' if incremental else 'full'})"
+            print(f"{label:<24}{p50 * 1000:>10.1f}{peak / 1024:>16.0f}{size / 1024:>10.0f}")
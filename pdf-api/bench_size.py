@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Output size modes benchmark (see compact.py).
+
+For each mode set, fills COMPREHENSIVE_TEST_DATA and reports the one-time
+cost of compacting the template, the per-request serialize p50, the output
+size and how much of the plain output it saves, plus the gzipped size (what
+a client with Accept-Encoding: gzip would have downloaded anyway). Every
+output is read back with a strict PdfReader and its field values compared
+with the plain output's.
+
+Run with:
+  python3 bench_size.py
+  python3 bench_size.py --modes xref,objstm,all --flatten --output size.json
+"""
+
+import argparse
+import gzip
+import io
+import json
+import logging
+import statistics
+import sys
+import time
+
+from pypdf import PdfReader
+
+from app import TEMPLATE_PATH, map_form_data_to_pdf_fields
+from compact import SIZE_MODES, compact_base, parse_size_modes, write_compact
+from request_log import logger
+from template_cache import get_template
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+MODE_SETS = ("",) + SIZE_MODES + ("objstm,dedupe", "all")
+
+
+def field_values(pdf: bytes) -> dict:
+    return {name: field.get("/V") for name, field in (PdfReader(io.BytesIO(pdf), strict=True).get_fields() or {}).items()}
+
+
+def measure(template, field_data, modes, flatten: bool, iterations: int):
+    build = 0.0
+    if modes:
+        start = time.perf_counter()
+        compact_base(template, modes)
+        build = time.perf_counter() - start
+    timings = []
+    pdf = b""
+    for _ in range(iterations):
+        writer = template.working_copy()
+        writer.update_widgets(field_data)
+        if flatten:
+            writer.flatten()
+        start = time.perf_counter()
+        pdf = (write_compact(writer, modes) if modes else writer.write_chunks()).getvalue()
+        timings.append(time.perf_counter() - start)
+    return build, statistics.median(timings), pdf
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare output size modes.")
+    parser.add_argument("--modes", default=";".join(MODE_SETS),
+                        help="semicolon-separated mode sets, each as for ?size= (empty = plain)")
+    parser.add_argument("--iterations", type=int, default=5, help="serializations per mode set")
+    parser.add_argument("--flatten", action="store_true", help="measure flattened output")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)  # one record per fill would drown the table
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+    template = get_template(TEMPLATE_PATH)
+    _, _, plain = measure(template, field_data, frozenset(), args.flatten, 1)
+    expected = field_values(plain)
+
+    results = {}
+    print(f"{'modes':<30}{'build ms':>10}{'write ms':>10}{'KB':>8}{'saved':>8}{'gzip KB':>9}", file=sys.stderr)
+    for value in args.modes.split(";"):
+        modes = parse_size_modes(value)
+        build, p50, pdf = measure(template, field_data, modes, args.flatten, args.iterations)
+        if field_values(pdf) != expected:
+            raise SystemExit(f"{value or 'plain'}: field values differ from the plain output")
+        label = ",".join(sorted(modes)) or "plain"
+        results[label] = {
+            "build_ms": round(build * 1000, 1),
+            "serialize_p50_ms": round(p50 * 1000, 1),
+            "bytes": len(pdf),
+            "saved_pct": round((1 - len(pdf) / len(plain)) * 100, 1),
+            "gzip_bytes": len(gzip.compress(pdf, 6)),
+        }
+        result = results[label]
+        print(f"{label:<30}{result['build_ms']:>10.0f}{result['serialize_p50_ms']:>10.1f}"
+              f"{result['bytes'] / 1024:>8.0f}{result['saved_pct']:>7.1f}%{result['gzip_bytes'] / 1024:>9.0f}",
+              file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"flatten": args.flatten, "iterations": args.iterations, "results": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
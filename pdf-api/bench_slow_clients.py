@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Throughput of normal clients while slow clients hold connections open.
+
+For each serving mode (PDF_SERVING in gunicorn.conf.py) this starts gunicorn
+with the same number of worker processes, then runs two kinds of client at
+once for --duration seconds:
+
+  slow  --slow connections that each trickle a payload up over --upload
+        seconds and read the PDF back 4 KB every --read-delay seconds, over
+        and over (a phone on a bad network)
+  fast  open-loop /generate requests at --rps, as in bench_load.py
+
+Sync workers are held by the slow uploads and downloads, so fast requests
+queue behind them; gthread workers park slow connections on threads and keep
+filling. The table shows the fast clients' throughput, latency and errors.
+
+Run with:
+  python3 bench_slow_clients.py --workers 2 --slow 4 --rps 2 --duration 20
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from bench_load import normalize_payload, run_load, stop, stored_payload, wait_healthy
+
+MODES = ("sync", "gthread")
+
+
+def start_server(mode: str, workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({"PDF_SERVING": mode, "PDF_LOG_LEVEL": "WARNING", "PDF_CACHE_MB": "0"})
+    command = ["gunicorn", "app:app", "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "--timeout", "120"]
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+
+def slow_client(port: int, body: bytes, upload: float, read_delay: float, stop_at: float, done: list) -> None:
+    """Upload ``body`` over ``upload`` seconds, read the reply slowly, repeat until ``stop_at``."""
+    head = (f"POST /generate HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+    pieces = 20
+    step = -(-len(body) // pieces)
+    while time.monotonic() < stop_at:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=120) as sock:
+                sock.sendall(head)
+                for start in range(0, len(body), step):
+                    time.sleep(upload / pieces)
+                    sock.sendall(body[start:start + step])
+                reply = sock.recv(4096)
+                status = reply.split(b" ", 2)[1].decode() if reply.startswith(b"HTTP/") else "?"
+                while sock.recv(4096):
+                    time.sleep(read_delay)
+            done.append(status)
+        except OSError:
+            time.sleep(0.1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare serving modes under slow clients.")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated PDF_SERVING values")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes per mode")
+    parser.add_argument("--slow", type=int, default=4, help="concurrent slow clients")
+    parser.add_argument("--upload", type=float, default=4, help="seconds each slow upload takes")
+    parser.add_argument("--read-delay", type=float, default=0.02, help="pause between 4 KB reads")
+    parser.add_argument("--rps", type=float, default=2, help="fast client requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per mode")
+    parser.add_argument("--timeout", type=float, default=60, help="fast request timeout in seconds")
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    bodies = [json.dumps(normalize_payload(stored_payload(rng))).encode() for _ in range(50)]
+    url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    print(f"{'mode':<10}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'errors':>9}  slow clients", file=sys.stderr)
+    for mode in args.modes.split(","):
+        process = start_server(mode, args.workers, args.port)
+        try:
+            wait_healthy(url, 60)
+            stop_at = time.monotonic() + args.duration
+            done = []
+            slow = [
+                threading.Thread(target=slow_client, daemon=True,
+                                 args=(args.port, bodies[i % len(bodies)], args.upload, args.read_delay, stop_at, done))
+                for i in range(args.slow)
+            ]
+            for thread in slow:
+                thread.start()
+            time.sleep(0.5)  # let the slow clients take their connections first
+            result = run_load(url, args.rps, args.duration, bodies, 64, args.timeout)
+            for thread in slow:
+                thread.join()
+        finally:
+            stop(process)
+        result["slow_outcomes"] = dict(Counter(done))
+        results[mode] = result
+        p50 = f"{result['p50_ms']:>9.0f}" if result["p50_ms"] is not None else f"{'-':>9}"
+        p95 = f"{result['p95_ms']:>9.0f}" if result["p95_ms"] is not None else f"{'-':>9}"
+        print(f"{mode:<10}{result['throughput_rps']:>8.2f}{p50}{p95}"
+              f"{result['error_rate'] * 100:>8.1f}%  {result['slow_outcomes']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"workers": args.workers, "slow": args.slow, "rps": args.rps, "results": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
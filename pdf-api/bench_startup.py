@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Time to first byte after boot.
+
+Starts gunicorn in each startup mode, sends one POST /generate as soon as the
+port accepts connections, and records how long after launch the response
+headers arrived, plus that request's own latency:
+
+  baseline   no gunicorn.conf.py: the first request parses the template
+  worker     PDF_PRELOAD=0: each worker warms itself before accepting
+  preload    PDF_PRELOAD=1: the master warms once, workers fork from it
+  snapshot   preload, with the template loaded from PDF_TEMPLATE_SNAPSHOT_DIR
+             (written by an untimed boot first)
+
+Run with:
+  python3 bench_startup.py --runs 3
+  python3 bench_startup.py --modes baseline,snapshot --workers 2 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from bench_load import stop
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+MODES = ("baseline", "worker", "preload", "snapshot")
+
+
+def launch(mode: str, workers: int, port: int, snapshot_dir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({"PDF_LOG_LEVEL": "WARNING", "PDF_CACHE_MB": "0"})
+    env.pop("PDF_TEMPLATE_SNAPSHOT_DIR", None)
+    command = ["gunicorn", "app:app", "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "--timeout", "120"]
+    if mode == "baseline":
+        command += ["--config", os.devnull]
+    else:
+        env["PDF_PRELOAD"] = "0" if mode == "worker" else "1"
+    if mode == "snapshot":
+        env["PDF_TEMPLATE_SNAPSHOT_DIR"] = snapshot_dir
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_listening(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError(f"port {port} did not open within {timeout:.0f}s")
+
+
+def first_request(port: int, body: bytes) -> float:
+    """POST /generate and return the seconds until the response headers arrived."""
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/generate", data=body,
+                                 headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=120) as response:
+        ttfb = time.perf_counter() - start
+        if response.status != 200:
+            raise RuntimeError(f"/generate returned {response.status}")
+        response.read()
+    return ttfb
+
+
+def boot_once(mode: str, workers: int, port: int, snapshot_dir: str, body: bytes) -> dict:
+    start = time.perf_counter()
+    process = launch(mode, workers, port, snapshot_dir)
+    try:
+        wait_listening(port, 60)
+        listening = time.perf_counter() - start
+        request_start = time.perf_counter()
+        request_ttfb = first_request(port, body)
+        boot_to_first_byte = request_start - start + request_ttfb
+    finally:
+        stop(process)
+    return {"listening_s": listening, "first_request_ms": request_ttfb * 1000,
+            "boot_to_first_byte_s": boot_to_first_byte}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure time to first byte after gunicorn boots.")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--runs", type=int, default=3, help="boots per mode (median reported)")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    body = json.dumps(COMPREHENSIVE_TEST_DATA).encode()
+    results = {}
+    print(f"{'mode':<10}{'listen s':>10}{'1st req ms':>12}{'boot→TTFB s':>13}", file=sys.stderr)
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        for mode in args.modes.split(","):
+            if mode not in MODES:
+                parser.error(f"unknown mode {mode!r}")
+            if mode == "snapshot":
+                boot_once(mode, 1, args.port, snapshot_dir, body)  # writes the snapshot
+            runs = [boot_once(mode, args.workers, args.port, snapshot_dir, body) for _ in range(args.runs)]
+            result = {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+            result["runs"] = args.runs
+            results[mode] = result
+            print(f"{mode:<10}{result['listening_s']:>10.2f}{result['first_request_ms']:>12.0f}"
+                  f"{result['boot_to_first_byte_s']:>13.2f}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"workers": args.workers, "results": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
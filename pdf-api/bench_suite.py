@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+PDF pipeline benchmark suite.
+
+Times each stage of the pipeline for three payloads:
+
+  small          a handful of intake answers
+  comprehensive  COMPREHENSIVE_TEST_DATA (test_comprehensive.py)
+  worst          every field in the template, from build_full_sample_data in
+                 scripts/fill-pdf.py (already PDF field names, so it has no
+                 mapping or /generate case)
+
+Stages: mapping, cold fill (template parse included), warm fill (widgets
+only), flatten (appearances drawn into the pages), serialize, and end-to-end
+POST /generate through the Flask test client with the generated-PDF cache and
+fill pool turned off. Each result has p50, p95 and p99 in ms, the tracemalloc
+peak of one extra untimed run, and the process's peak RSS so far.
+
+Results are written as JSON. With --baseline, p50 and allocation peaks are
+compared against an earlier run and the script exits 1 when any of them is
+more than --threshold percent worse.
+
+Run with:
+  python3 bench_suite.py --output bench-results.json
+  python3 bench_suite.py --baseline bench-results.json --threshold 25
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+# Measure fills, not cache hits or pool round trips
+os.environ["PDF_CACHE_MB"] = "0"
+os.environ.pop("PDF_FILL_WORKERS", None)
+os.environ.pop("PDF_PROFILE_DIR", None)
+
+import pypdf
+from pypdf import PdfReader
+
+import template_cache
+from app import TEMPLATE_PATH, app, fill_pdf, map_form_data_to_pdf_fields
+from request_log import logger
+from template_cache import get_template
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+SMALL_PAYLOAD = {
+    "first_name": "Maria",
+    "last_name": "Rodriguez",
+    "date_of_birth": "1985-03-15",
+    "a_number": "123456789",
+    "country_of_birth": "Mexico",
+}
+
+# Metrics compared against a baseline; lower is better for both
+COMPARED = ("p50_ms", "alloc_peak_kb")
+
+
+def load_fill_script():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "fill-pdf.py")
+    spec = importlib.util.spec_from_file_location("fill_pdf_script", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def worst_case_fields() -> dict:
+    reader = PdfReader(TEMPLATE_PATH)
+    if reader.is_encrypted:
+        reader.decrypt("")
+    return load_fill_script().build_full_sample_data(reader)
+
+
+def percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)]
+
+
+def peak_rss_kb() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # bytes on macOS, KB elsewhere
+
+
+def measure(run, iterations: int, setup=None) -> dict:
+    """Time ``run(setup())`` ``iterations`` times; setup is untimed."""
+    timings = []
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        run(arg)
+        timings.append(time.perf_counter() - start)
+
+    # Separate pass: tracemalloc slows everything down too much to time under it
+    arg = setup() if setup else None
+    tracemalloc.start()
+    run(arg)
+    alloc_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    ordered = sorted(timings)
+    return {
+        "n": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "alloc_peak_kb": round(alloc_peak / 1024, 1),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run_suite(iterations: int, cold_iterations: int) -> dict:
+    payloads = {"small": SMALL_PAYLOAD, "comprehensive": COMPREHENSIVE_TEST_DATA}
+    fields = {name: map_form_data_to_pdf_fields(payload) for name, payload in payloads.items()}
+    fields["worst"] = worst_case_fields()
+    client = app.test_client()
+    results = {}
+
+    def record(name, result):
+        results[name] = result
+        print(f"{name:<28}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+              f"{result['alloc_peak_kb']:>12.0f}{result['peak_rss_kb']:>12}", file=sys.stderr)
+
+    print(f"{'benchmark':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'alloc KB':>12}{'RSS KB':>12}",
+          file=sys.stderr)
+
+    for name, payload in payloads.items():
+        record(f"mapping/{name}", measure(lambda _: map_form_data_to_pdf_fields(payload), iterations * 10))
+
+    for name, field_data in fields.items():
+        record(f"cold_fill/{name}", measure(
+            lambda _: fill_pdf(TEMPLATE_PATH, field_data), cold_iterations,
+            setup=template_cache._caches.clear,
+        ))
+
+    template = get_template(TEMPLATE_PATH)
+    for name, field_data in fields.items():
+        record(f"warm_fill/{name}", measure(
+            lambda writer: writer.update_widgets(field_data), iterations, setup=template.working_copy,
+        ))
+
+    for name, field_data in fields.items():
+        def filled_copy():
+            writer = template.working_copy()
+            writer.update_widgets(field_data)
+            return writer
+        record(f"flatten/{name}", measure(lambda writer: writer.flatten(), iterations, setup=filled_copy))
+
+    for name, field_data in fields.items():
+        def filled_copy():
+            writer = template.working_copy()
+            writer.update_widgets(field_data)
+            return writer
+        record(f"serialize/{name}", measure(lambda writer: writer.write_chunks(), iterations, setup=filled_copy))
+
+    for name, payload in payloads.items():
+        def post(_):
+            response = client.post("/generate", json=payload)
+            if response.status_code != 200:
+                raise RuntimeError(f"/generate returned {response.status_code}")
+            response.get_data()
+        record(f"generate/{name}", measure(post, iterations))
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Baseline metrics that got more than ``threshold`` percent worse."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        current = results.get(name)
+        if current is None:
+            continue
+        for metric in COMPARED:
+            before, after = base.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            if change > threshold:
+                regressions.append(f"{name} {metric}: {before} -> {after} (+{change:.0f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20, help="timed runs per warm benchmark")
+    parser.add_argument("--cold-iterations", type=int, default=3, help="timed runs per cold fill")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("BENCH_THRESHOLD", "20")),
+                        help="allowed regression in percent (default: 20, or BENCH_THRESHOLD)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)  # one record per fill would drown the table
+    results = run_suite(args.iterations, args.cold_iterations)
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pypdf": pypdf.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "iterations": args.iterations,
+            "cold_iterations": args.cold_iterations,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:g}%:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:g}% against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Template cache benchmark.
+
+Times fill_pdf with the parsed-template cache cleared before every call (the
+old parse-per-request behaviour) against fill_pdf reusing the cached template.
+
+Run with: python3 bench_template_cache.py [iterations]
+"""
+
+import logging
+import statistics
+import sys
+import time
+
+import template_cache
+from app import TEMPLATE_PATH, map_form_data_to_pdf_fields, fill_pdf
+from request_log import logger
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+
+def time_fill(field_data: dict, iterations: int, cold: bool) -> list:
+    timings = []
+    for _ in range(iterations):
+        if cold:
+            template_cache._caches.clear()
+        start = time.perf_counter()
+        fill_pdf(TEMPLATE_PATH, field_data)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<28} p50 {statistics.median(ordered) * 1000:8.1f} ms"
+          f"   p95 {p95 * 1000:8.1f} ms   n={len(ordered)}")
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.WARNING)  # one record per fill would drown the table
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+
+    cold = time_fill(field_data, iterations, cold=True)
+    # One untimed call so the warm run starts from a loaded cache
+    time_fill(field_data, 1, cold=False)
+    warm = time_fill(field_data, iterations, cold=False)
+
+    print(f"fill_pdf, {len(field_data)} mapped fields")
+    report("before (parse per request)", cold)
+    report("after (cached template)", warm)
+    print(f"speedup: {statistics.median(cold) / statistics.median(warm):.1f}x")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Intake validation cost against a fill (see intake_schema.py).
+
+Times validate() on COMPREHENSIVE_TEST_DATA and on the same payload with a
+bad date of birth, a bad date in every trip and a child that isn't an object, against fill_pdf on the valid payload,
+and the 422 an invalid POST /generate gets against the 200 of a valid one
+(Flask test client, generated-PDF cache and fill pool off). Exits 1 when
+validation costs --budget percent of a fill or more (default 1).
+
+Run with:
+  python3 bench_validation.py
+  python3 bench_validation.py --iterations 2000 --output validation.json
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+# Measure fills, not cache hits or pool round trips
+os.environ["PDF_CACHE_MB"] = "0"
+os.environ.pop("PDF_FILL_WORKERS", None)
+
+from app import TEMPLATE_PATH, app, fill_pdf, map_form_data_to_pdf_fields
+from intake_schema import INTAKE_CHECKS, validate
+from request_log import logger
+from test_comprehensive import COMPREHENSIVE_TEST_DATA
+
+
+def p50(fn, iterations: int) -> float:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def invalid_payload() -> dict:
+    payload = copy.deepcopy(COMPREHENSIVE_TEST_DATA)
+    payload["date_of_birth"] = "March 15th"
+    for trip in payload["trips"]:
+        trip["date_left_us"] = "last summer"
+    payload["children"].append("not an object")
+    return payload
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure intake validation against a fill.")
+    parser.add_argument("--iterations", type=int, default=1000, help="validate() calls per payload")
+    parser.add_argument("--fills", type=int, default=20, help="fills and requests per case")
+    parser.add_argument("--budget", type=float, default=1.0, help="max validation cost, percent of a fill")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)  # one record per fill or 422 would drown the table
+    valid = COMPREHENSIVE_TEST_DATA
+    invalid = invalid_payload()
+    if validate(valid) or not validate(invalid):
+        raise SystemExit("the benchmark payloads no longer validate as expected")
+    field_data = map_form_data_to_pdf_fields(valid)
+    fill_pdf(TEMPLATE_PATH, field_data)  # parse the template outside the timings
+
+    client = app.test_client()
+    results = {
+        "checked_keys": len(INTAKE_CHECKS),
+        "validate_valid_us": p50(lambda: validate(valid), args.iterations) * 1e6,
+        "validate_invalid_us": p50(lambda: validate(invalid), args.iterations) * 1e6,
+        "fill_ms": p50(lambda: fill_pdf(TEMPLATE_PATH, field_data), args.fills) * 1000,
+        "generate_200_ms": p50(lambda: client.post("/generate", json=valid).get_data(), args.fills) * 1000,
+        "generate_422_ms": p50(lambda: client.post("/generate", json=invalid).get_data(), args.fills) * 1000,
+    }
+    results["validate_pct_of_fill"] = results["validate_valid_us"] / 1000 / results["fill_ms"] * 100
+
+    print(f"keys checked          {results['checked_keys']:>10}", file=sys.stderr)
+    print(f"validate, valid       {results['validate_valid_us']:>10.1f} µs", file=sys.stderr)
+    print(f"validate, invalid     {results['validate_invalid_us']:>10.1f} µs", file=sys.stderr)
+    print(f"fill_pdf              {results['fill_ms']:>10.1f} ms", file=sys.stderr)
+    print(f"validation / fill     {results['validate_pct_of_fill']:>10.2f} %", file=sys.stderr)
+    print(f"POST /generate 200    {results['generate_200_ms']:>10.1f} ms", file=sys.stderr)
+    print(f"POST /generate 422    {results['generate_422_ms']:>10.2f} ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({key: round(value, 3) for key, value in results.items()}, f, indent=2)
+            f.write("\n")
+    if results["validate_pct_of_fill"] >= args.budget:
+        print(f"validation is over {args.budget}% of a fill", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Size-oriented output modes.
+
+A filled N-400 written the normal way is as large as the decrypted template
+(~1 MB): every dictionary is plain text, some streams are stored without a
+filter, identical checkbox appearances are stored once per box and the xref
+table has a 20-byte line per object. The modes, which can be combined:
+
+  xref        a cross-reference stream instead of the xref table
+  objstm      non-stream objects packed into Flate-compressed object streams
+  recompress  Flate-compress the template streams stored without a filter
+  dedupe      write byte-identical template objects once and point every
+              reference at that copy
+
+objstm and dedupe leave gaps in the object numbering, which only a
+cross-reference stream can describe, so they imply xref.
+
+The work on template objects is done once per template and mode set
+(CompactBase, cached on the ParsedTemplate); a request only serializes the
+objects it changed. Object streams keep the template copies of the few
+dictionaries a request replaces, and the xref points at the new ones.
+Incremental output ignores the size modes.
+
+PDF_SIZE_MODES sets the default for /generate (comma-separated, or "all");
+?size= overrides it per request.
+"""
+
+import io
+import threading
+import time
+import zlib
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from pypdf.generic import ArrayObject, IndirectObject, NameObject, NumberObject, StreamObject
+
+from appearances import inherited
+from request_log import logger
+from template_cache import ParsedTemplate, PdfChunks, WorkingCopy, references, write_xref_stream
+
+SIZE_MODES = ("xref", "objstm", "recompress", "dedupe")
+# Objects per object stream: large enough to compress well, small enough that
+# a reader decompresses little to reach one object
+OBJSTM_SIZE = 100
+
+_build_lock = threading.Lock()
+
+
+def parse_size_modes(value: Optional[str]) -> FrozenSet[str]:
+    """``"objstm,recompress"`` -> the mode set, with implied modes added; ValueError on unknown names."""
+    names = {name.strip().lower() for name in (value or "").split(",") if name.strip()}
+    if "all" in names:
+        return frozenset(SIZE_MODES)
+    unknown = names - set(SIZE_MODES)
+    if unknown:
+        raise ValueError(f"unknown size mode: {', '.join(sorted(unknown))} (use {', '.join(SIZE_MODES)} or all)")
+    if names & {"objstm", "dedupe"}:
+        names.add("xref")
+    return frozenset(names)
+
+
+def remap(obj, canonical: Dict[int, int]):
+    """``obj`` with references to dropped duplicates pointed at their kept copy (shallow copies only where needed)."""
+    if isinstance(obj, IndirectObject):
+        target = canonical.get(obj.idnum)
+        return IndirectObject(target, 0, obj.pdf) if target is not None else obj
+    if not canonical or not isinstance(obj, (dict, list)) or not any(r in canonical for r in references(obj)):
+        return obj
+    if isinstance(obj, list):
+        return ArrayObject(remap(item, canonical) for item in obj)
+    copy = obj.__class__.__new__(obj.__class__)
+    copy.__dict__.update(obj.__dict__)
+    for key, value in obj.items():
+        dict.__setitem__(copy, key, remap(value, canonical))
+    return copy
+
+
+def _protected(template: ParsedTemplate) -> Set[int]:
+    """
+    Template objects a working copy may replace or that rendered appearances refer to.
+
+    They must be neither dropped nor kept as the copy of another object:
+    the catalog and page tree, the widgets, text widgets' /AP and /AP /N
+    (replaced by filled appearances) and the AcroForm and widget /DR fonts
+    (referenced from the pre-serialized appearance streams).
+    """
+    writer = template.writer
+    objects = writer._objects
+    protected = {writer._root.idnum}
+    stack = [writer._root_object.raw_get("/Pages")]
+    while stack:
+        ref = stack.pop()
+        protected.add(ref.idnum)
+        stack.extend(ref.get_object().get("/Kids", ()))
+    for entries in template.widget_index.values():
+        for entry in entries:
+            protected.add(entry.idnum)
+            if entry.field_type == "/Btn":
+                continue
+            annot = objects[entry.idnum - 1]
+            ap = annot.raw_get("/AP") if "/AP" in annot else None
+            if isinstance(ap, IndirectObject):
+                protected.add(ap.idnum)
+            normal = ap.get_object().raw_get("/N") if ap is not None and "/N" in ap.get_object() else None
+            if isinstance(normal, IndirectObject):
+                protected.add(normal.idnum)
+            resources = inherited(annot, "/DR")
+            if resources is not None:
+                protected.update(_font_refs(resources.get_object().get("/Font")))
+    protected.update(_font_refs(template.appearances._fonts))
+    return protected
+
+
+def _font_refs(fonts) -> Set[int]:
+    """Object numbers of the indirect fonts in a /DR /Font dictionary (None for no fonts)."""
+    if fonts is None:
+        return set()
+    fonts = fonts.get_object()
+    return {fonts.raw_get(name).idnum for name in fonts if isinstance(fonts.raw_get(name), IndirectObject)}
+
+
+class CompactBase:
+    """The template's objects prepared once for one set of size modes."""
+
+    def __init__(self, template: ParsedTemplate, modes: FrozenSet[str]):
+        start = time.perf_counter()
+        self.modes = modes
+        base = template.base
+        master = template.writer._objects
+        offsets = base.object_offsets
+        # Dropped duplicate -> the object number kept in its place
+        self.canonical: Dict[int, int] = self._duplicates(template) if "dedupe" in modes else {}
+
+        # Template objects written as themselves, back to back in object order
+        direct = io.BytesIO()
+        self.direct: Dict[int, Tuple[int, int]] = {}
+        packed: List[Tuple[int, bytes]] = []
+        for idnum in range(1, len(master) + 1):
+            if idnum in self.canonical:
+                continue
+            obj = master[idnum - 1]
+            if "objstm" in modes and not isinstance(obj, StreamObject):
+                buffer = io.BytesIO()
+                remap(obj, self.canonical).write_to_stream(buffer)
+                packed.append((idnum, buffer.getvalue()))
+                continue
+            position = direct.tell()
+            rewritten = remap(obj, self.canonical)
+            if "recompress" in modes and isinstance(obj, StreamObject) and "/Filter" not in obj:
+                encoded = rewritten.flate_encode(level=9)
+                if len(encoded._data) < len(obj._data):
+                    rewritten = encoded
+            if rewritten is obj:
+                # Unchanged: the bytes the template was serialized to
+                direct.write(base.data[offsets[idnum - 1]:offsets[idnum]])
+            else:
+                # A copy, never the shared template object, which writing mutates
+                direct.write(f"{idnum} 0 obj\n".encode())
+                rewritten.write_to_stream(direct)
+                direct.write(b"\nendobj\n")
+            self.direct[idnum] = (position, direct.tell())
+        self.data = direct.getvalue()
+
+        # Object streams, serialized after their "N 0 obj" line (numbered per request)
+        self.object_streams: List[bytes] = []
+        # Packed object -> (index into object_streams, position in that stream)
+        self.packed: Dict[int, Tuple[int, int]] = {}
+        for group_start in range(0, len(packed), OBJSTM_SIZE):
+            group = packed[group_start:group_start + OBJSTM_SIZE]
+            header, body = [], io.BytesIO()
+            for position, (idnum, data) in enumerate(group):
+                header.append(f"{idnum} {body.tell()}")
+                body.write(data + b"\n")
+                self.packed[idnum] = (len(self.object_streams), position)
+            head = (" ".join(header) + "\n").encode()
+            stream = StreamObject()
+            stream._data = zlib.compress(head + body.getvalue(), 9)
+            stream.update({
+                NameObject("/Type"): NameObject("/ObjStm"),
+                NameObject("/N"): NumberObject(len(group)),
+                NameObject("/First"): NumberObject(len(head)),
+                NameObject("/Filter"): NameObject("/FlateDecode"),
+            })
+            buffer = io.BytesIO()
+            stream.write_to_stream(buffer)
+            buffer.write(b"\nendobj\n")
+            self.object_streams.append(buffer.getvalue())
+
+        self.build_seconds = time.perf_counter() - start
+        logger.info("compact template built", extra={
+            "modes": ",".join(sorted(modes)),
+            "duplicates": len(self.canonical),
+            "object_streams": len(self.object_streams),
+            "bytes": len(self.data) + sum(len(s) for s in self.object_streams),
+            "build_ms": round(self.build_seconds * 1000, 2),
+        })
+
+    @staticmethod
+    def _duplicates(template: ParsedTemplate) -> Dict[int, int]:
+        data = template.base.data
+        offsets = template.base.object_offsets
+        protected = _protected(template)
+        first: Dict[bytes, int] = {}
+        canonical = {}
+        for idnum in range(1, len(offsets)):
+            if idnum in protected:
+                continue
+            # The object's bytes after its "N 0 obj" line
+            body = data[data.index(b"\n", offsets[idnum - 1]) + 1:offsets[idnum]]
+            kept = first.setdefault(body, idnum)
+            if kept != idnum:
+                canonical[idnum] = kept
+        return canonical
+
+
+def compact_base(template: ParsedTemplate, modes: FrozenSet[str]) -> CompactBase:
+    """The template's CompactBase for ``modes``, built on first use."""
+    compact = template.compact_bases.get(modes)
+    if compact is None:
+        with _build_lock:
+            compact = template.compact_bases.get(modes)
+            if compact is None:
+                compact = template.compact_bases[modes] = CompactBase(template, modes)
+    return compact
+
+
+def write_compact(writer: WorkingCopy, modes: FrozenSet[str]) -> PdfChunks:
+    """Serialize a working copy with the given size modes (see the module docstring)."""
+    template = writer.template
+    compact = compact_base(template, modes)
+    objects = writer._objects
+    changed = writer.changed_objects()
+    changed_set = set(changed)
+    chunks = PdfChunks()
+    chunks.write(memoryview(template.base.data)[:template.base.object_offsets[0]])
+    positions: Dict[int, int] = {}
+
+    # Unchanged template objects, one slice per run between changed ones
+    data = memoryview(compact.data)
+    run_start = run_end = None
+    run_position = 0
+    for idnum, (start, end) in compact.direct.items():
+        if idnum in changed_set:
+            if run_start is not None:
+                chunks.write(data[run_start:run_end])
+                run_start = None
+            continue
+        if run_start is None:
+            run_start, run_position = start, chunks.tell()
+        positions[idnum] = run_position + start - run_start
+        run_end = end
+    if run_start is not None:
+        chunks.write(data[run_start:run_end])
+
+    for idnum in changed:
+        positions[idnum] = chunks.tell()
+        buffer = io.BytesIO()
+        buffer.write(f"{idnum} 0 obj\n".encode())
+        remap(objects[idnum - 1], compact.canonical).write_to_stream(buffer)
+        buffer.write(b"\nendobj\n")
+        chunks.write(buffer.getvalue())
+
+    first_stream = len(objects) + 1
+    for i, body in enumerate(compact.object_streams):
+        positions[first_stream + i] = chunks.tell()
+        chunks.write(f"{first_stream + i} 0 obj\n".encode())
+        chunks.write(memoryview(body))
+    compressed = {
+        idnum: (first_stream + stream_index, position)
+        for idnum, (stream_index, position) in compact.packed.items()
+        if idnum not in changed_set
+    }
+
+    if "xref" in modes:
+        write_xref_stream(chunks, positions, first_stream + len(compact.object_streams), {
+            "/Root": writer._root,
+            "/Info": writer._info,
+            "/ID": writer._ID,
+        }, compressed)
+    else:
+        xref_location = writer._write_xref_table(chunks, [positions[i] for i in range(1, len(objects) + 1)])
+        writer._write_trailer(chunks, xref_location)
+    return chunks
@@ -0,0 +1,1168 @@
+"""
+Declarative intake → N-400 PDF field mapping.
+
+MAPPING_SPEC describes, in form order, which intake keys fill which PDF fields
+and how values are transformed (dates, stripped dashes, yes/no checkbox pairs,
+enum → export value maps, repeat groups such as trips[:6] and crimes[:5]).
+It is compiled once at import into COMPILED_MAPPING, a flat list of
+operations; map_form_data_to_pdf_fields just runs them in order.
+
+Intake fields with no PDF equivalent in this N-400 template (not mapped):
+- request_disability_accommodations (form has no separate accommodation-request field)
+- employment_to for row 1 (PDF has no P7_To1; only rows 2/3 have To date)
+- total_days_outside_us, trips_over_6_months (no matching text/checkbox in this PDF)
+- spouse_is_us_citizen, spouse_country_of_birth (covered indirectly via 5a/5b)
+- q_failed_to_file_taxes (no "failed to file" question in this N-400; P9_Line3 is "owe taxes")
+- q_advocated_overthrow (q_served_military_police_unit maps with q_military_police_service to P9_Line8a)
+- q_willing_take_oath, q_willing_noncombatant, q_willing_work_national_importance
+  (oath items 34-37 share checkbox group; only bear arms/understand oath have distinct fields)
+- interpreter/preparer address (street, city, state, zip): PDF has name, biz, phone, email only
+- preparer_is_attorney, preparer_accredited_representative, preparer_bar_number (no fields in template)
+
+Template variable names may differ from intake names. See test-output/pdf_field_reference.json
+for all 488 PDF field names and their full descriptions (search "tu" for concepts).
+"""
+
+import json
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+Op = Callable[[dict, dict], None]
+RowOp = Callable[[dict, dict, dict], None]
+Keys = Union[str, Tuple[str, ...]]
+
+# Export values of the template's yes/no checkbox pairs (see check_export_values)
+YES = "/Y"
+NO = "/N"
+
+
+# ═══════════════════════════════════════════════════════════════
+# VALUE HELPERS
+# ═══════════════════════════════════════════════════════════════
+
+def format_date(date_str: str) -> str:
+    """Convert date to MM/DD/YYYY format."""
+    if not date_str:
+        return ""
+    if "/" in date_str and len(date_str) == 10:
+        return date_str
+    if "-" in date_str:
+        parts = date_str.split("-")
+        if len(parts) == 3:
+            return f"{parts[1]}/{parts[2]}/{parts[0]}"
+    return date_str
+
+
+def safe_get_array(data: dict, key: str, default=None):
+    """Safely get an array from data, handling JSON strings."""
+    if default is None:
+        default = []
+    value = data.get(key, default)
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+            if isinstance(parsed, list):
+                return parsed
+        except (json.JSONDecodeError, TypeError):
+            pass
+    return default
+
+
+def strip_dashes(value: str) -> str:
+    return value.replace("-", "").replace(" ", "")
+
+
+def state_code(value: str) -> str:
+    # The state box is a comb field; a leading space lines the code up
+    return f" {value.upper()}" if not value.startswith(' ') else value
+
+
+def date_or_present(value) -> str:
+    if isinstance(value, str) and value.upper() == "PRESENT":
+        return "Present"
+    return format_date(value)
+
+
+def three_digits(value) -> str:
+    # Weight is three one-digit boxes
+    return str(value).zfill(3)
+
+
+def child_name(item: dict) -> str:
+    if item.get("first_name") or item.get("last_name"):
+        return f"{item.get('first_name', '')} {item.get('last_name', '')}".strip()
+    return ""
+
+
+# Value kind the intake schema checks for each transform (see intake_schema.py);
+# untransformed text is "text"
+TRANSFORM_KINDS = {
+    format_date: "date",
+    date_or_present: "date_or_present",
+    three_digits: "digits",
+    strip_dashes: "string",
+    state_code: "string",
+}
+
+
+def _lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def _first(data: dict, keys: Tuple[str, ...]):
+    """data.get(k1) or data.get(k2) or ... for one or more keys."""
+    value = None
+    for key in keys:
+        value = data.get(key)
+        if value:
+            return value
+    return value
+
+
+def _as_keys(keys: Keys) -> Tuple[str, ...]:
+    return (keys,) if isinstance(keys, str) else tuple(keys)
+
+
+def _as_fields(fields: Union[str, Sequence[str]]) -> Tuple[str, ...]:
+    return (sys.intern(fields),) if isinstance(fields, str) else tuple(map(sys.intern, fields))
+
+
+def rows(template: str, count: int, start: int = 1, **overrides: str) -> Tuple[Optional[str], ...]:
+    """
+    Expand a repeat-group field name for rows 1..count.
+
+    ``template`` uses {idx} for the row's number on the form (``start`` for the
+    first row); ``row1="..."`` style overrides replace the name for a single
+    row, and an override of "" marks a row that has no such field.
+    """
+    names = []
+    for row in range(1, count + 1):
+        name = overrides.get(f"row{row}", template.format(idx=start + row - 1))
+        names.append(sys.intern(name) if name else None)
+    return tuple(names)
+
+
+# ═══════════════════════════════════════════════════════════════
+# SPEC OPERATIONS
+# Each compiles to a closure op(data, fields) that writes into fields.
+# ═══════════════════════════════════════════════════════════════
+
+class Text:
+    """Copy a truthy intake value (first truthy of ``keys``) to one or more fields."""
+
+    def __init__(self, keys: Keys, fields: Union[str, Sequence[str]],
+                 transform: Optional[Callable] = None, spread: bool = False):
+        self.keys = _as_keys(keys)
+        self.fields = _as_fields(fields)
+        self.transform = transform
+        # spread: the transformed value is split one character per field
+        self.spread = spread
+
+    def batch(self):
+        if self.spread or len(self.keys) != 1 or len(self.fields) != 1:
+            return None
+        return "text", (self.keys[0], self.fields[0], self.transform)
+
+    def compile(self) -> Op:
+        keys, targets, transform = self.keys, self.fields, self.transform
+        if self.spread:
+            def op(data, fields):
+                value = _first(data, keys)
+                if value:
+                    for target, part in zip(targets, transform(value)):
+                        fields[target] = part
+        elif len(keys) == 1 and len(targets) == 1:
+            key, target = keys[0], targets[0]
+            if transform is None:
+                def op(data, fields):
+                    value = data.get(key)
+                    if value:
+                        fields[target] = value
+            else:
+                def op(data, fields):
+                    value = data.get(key)
+                    if value:
+                        fields[target] = transform(value)
+        else:
+            def op(data, fields):
+                value = _first(data, keys)
+                if value:
+                    if transform is not None:
+                        value = transform(value)
+                    for target in targets:
+                        fields[target] = value
+        return op
+
+    def reads(self):
+        kind = TRANSFORM_KINDS.get(self.transform, "text")
+        for key in self.keys:
+            yield key, kind
+
+
+class Count:
+    """A number that is always written: missing, None and "" become "0"."""
+
+    def __init__(self, key: str, field: str):
+        self.key = key
+        self.field = sys.intern(field)
+
+    def compile(self) -> Op:
+        key, target = self.key, self.field
+
+        def op(data, fields):
+            value = data.get(key)
+            if value is None or value == "":
+                value = "0"
+            fields[target] = str(value)
+        return op
+
+    def reads(self):
+        yield self.key, "count"
+
+
+class Const:
+    """A field that always gets the same value."""
+
+    def __init__(self, field: str, value: str):
+        self.field = sys.intern(field)
+        self.value = value
+
+    def compile(self) -> Op:
+        target, value = self.field, self.value
+
+        def op(data, fields):
+            fields[target] = value
+        return op
+
+    def exports(self):
+        yield self.field, self.value
+
+
+class Set(Const):
+    """A fixed value, used inside Choice/When branches."""
+
+
+class YesNo:
+    """
+    Yes/No checkbox pair. Default: [0]=No, [1]=Yes; some questions are reversed.
+
+    Yes uses /Y and No uses /N (PDF export values). Values are matched
+    case-insensitively after str() and strip().
+    """
+
+    def __init__(self, keys: Keys, field_base: str, yes_idx: int = 1, no_idx: int = 0):
+        self.keys = _as_keys(keys)
+        self.yes_field = sys.intern(f"{field_base}[{yes_idx}]")
+        self.no_field = sys.intern(f"{field_base}[{no_idx}]")
+
+    def batch(self):
+        if len(self.keys) != 1:
+            return None
+        return "yes_no", (self.keys[0], self.yes_field, self.no_field)
+
+    def compile(self) -> Op:
+        keys, yes_field, no_field = self.keys, self.yes_field, self.no_field
+
+        def op(data, fields):
+            value = _first(data, keys)
+            if value:
+                if value != "yes" and value != "no":
+                    value = str(value).lower().strip()
+                if value == "yes":
+                    fields[yes_field] = YES
+                elif value == "no":
+                    fields[no_field] = NO
+        return op
+
+    def exports(self):
+        yield self.yes_field, YES
+        yield self.no_field, NO
+
+    def reads(self):
+        for key in self.keys:
+            yield key, "yes_no"
+
+
+class Choice:
+    """
+    Run the branch for the intake value: ``{value: [ops]}``.
+
+    A branch may also be a (field, export_value) pair, shorthand for
+    [Set(field, export_value)]. ``lower`` compares lowercased values.
+    """
+
+    def __init__(self, key: str, branches: Dict[str, Union[Tuple[str, str], List]],
+                 lower: bool = False):
+        self.key = key
+        self.branches = branches
+        self.lower = lower
+
+    def compile(self) -> Op:
+        key, lower = self.key, self.lower
+        table = {}
+        for value, branch in self.branches.items():
+            if isinstance(branch, tuple):
+                branch = [Set(*branch)]
+            table[value] = _compile_group(branch)
+
+        def op(data, fields):
+            value = data.get(key, "")
+            if lower:
+                value = _lower(value)
+            try:
+                branch = table.get(value)
+            except TypeError:  # unhashable intake value
+                return
+            if branch is not None:
+                for branch_op in branch:
+                    branch_op(data, fields)
+        return op
+
+    def exports(self):
+        for branch in self.branches.values():
+            yield from _exports([Set(*branch)] if isinstance(branch, tuple) else branch)
+
+    def reads(self):
+        # Only yes/no answers are checked against the branches: other values
+        # may legitimately match none (the form joins multiple races with ", ")
+        yes_no = set(self.branches) == {"yes", "no"} and not self.lower
+        yield self.key, "yes_no_exact" if yes_no else "string"
+        for branch in self.branches.values():
+            if isinstance(branch, list):
+                yield from _reads(branch)
+
+
+class When:
+    """Run ``then`` when ``key`` equals ``value`` (or is truthy when value is None), else ``otherwise``."""
+
+    def __init__(self, key: str, value: Optional[str], then: List,
+                 otherwise: Sequence = (), lower: bool = False):
+        self.key = key
+        self.value = value
+        self.then = then
+        self.otherwise = otherwise
+        self.lower = lower
+
+    def compile(self) -> Op:
+        key, expected, lower = self.key, self.value, self.lower
+        then = _compile_group(self.then)
+        otherwise = _compile_group(self.otherwise)
+
+        def op(data, fields):
+            value = data.get(key, "")
+            if expected is None:
+                matched = bool(value)
+            else:
+                matched = (_lower(value) if lower else value) == expected
+            for branch_op in (then if matched else otherwise):
+                branch_op(data, fields)
+        return op
+
+    def exports(self):
+        yield from _exports(self.then)
+        yield from _exports(self.otherwise)
+
+    def reads(self):
+        if self.value is None:
+            kind = "any"
+        elif self.value in ("yes", "no") and not self.lower:
+            kind = "yes_no_exact"
+        else:
+            kind = "string"
+        yield self.key, kind
+        yield from _reads(self.then)
+        yield from _reads(self.otherwise)
+
+
+# ── Repeat groups ──────────────────────────────────────────────
+
+class Item:
+    """
+    Copy a truthy value of each row's dict to that row's field.
+
+    ``keys`` may list alternates (first truthy wins). ``fallback`` gives, per
+    row, a top-level intake key used when the row has no value (None = none).
+    ``value`` computes the value from the whole row instead of a key.
+    """
+
+    def __init__(self, keys: Optional[Keys], fields: Tuple[Optional[str], ...],
+                 transform: Optional[Callable] = None,
+                 fallback: Optional[Tuple[Optional[str], ...]] = None,
+                 value: Optional[Callable[[dict], str]] = None):
+        self.keys = _as_keys(keys) if keys is not None else ()
+        self.fields = fields
+        self.transform = transform
+        self.fallback = fallback
+        self.value = value
+
+    def batch_row(self, row: int):
+        target = self.fields[row]
+        if target is None or self.value is not None or len(self.keys) != 1:
+            return None
+        if self.fallback and self.fallback[row] is not None:
+            return None
+        return "item_text", (self.keys[0], target, self.transform)
+
+    def compile_row(self, row: int) -> Optional[RowOp]:
+        target = self.fields[row]
+        if target is None:
+            return None
+        keys, transform, compute = self.keys, self.transform, self.value
+        fallback = self.fallback[row] if self.fallback else None
+
+        def op(item, data, fields):
+            if compute is not None:
+                value = compute(item)
+            else:
+                value = _first(item, keys)
+            if not value and fallback is not None:
+                value = data.get(fallback, "")
+            if value:
+                fields[target] = transform(value) if transform is not None else value
+        return op
+
+    def reads(self):
+        kind = TRANSFORM_KINDS.get(self.transform, "text")
+        for fallback in self.fallback or ():
+            if fallback is not None:
+                yield fallback, kind
+
+    def row_reads(self):
+        kind = TRANSFORM_KINDS.get(self.transform, "text")
+        for key in self.keys:
+            yield key, kind
+
+
+class ItemYesNo:
+    """Yes/No checkbox pair per row, matched exactly ("yes"/"no"); ``fallback`` is a top-level key."""
+
+    def __init__(self, key: str, yes_fields: Tuple[str, ...], no_fields: Tuple[str, ...],
+                 fallback: Optional[str] = None):
+        self.key = key
+        self.yes_fields = _as_fields(yes_fields)
+        self.no_fields = _as_fields(no_fields)
+        self.fallback = fallback
+
+    def compile_row(self, row: int) -> Optional[RowOp]:
+        key, fallback = self.key, self.fallback
+        yes_field, no_field = self.yes_fields[row], self.no_fields[row]
+
+        def op(item, data, fields):
+            value = item.get(key) or (data.get(fallback) if fallback else None)
+            if value:
+                if value == "yes":
+                    fields[yes_field] = YES
+                elif value == "no":
+                    fields[no_field] = NO
+        return op
+
+    def exports(self):
+        for yes_field, no_field in zip(self.yes_fields, self.no_fields):
+            yield yes_field, YES
+            yield no_field, NO
+
+    def reads(self):
+        if self.fallback:
+            yield self.fallback, "yes_no_exact"
+
+    def row_reads(self):
+        yield self.key, "yes_no_exact"
+
+
+class Repeat:
+    """
+    Repeat group over the first ``limit`` entries of an intake array.
+
+    Entries that are not dicts are skipped, except that the first ``always``
+    rows are run with an empty dict so their top-level fallbacks still apply.
+    """
+
+    def __init__(self, key: str, limit: int, items: List, always: int = 0):
+        self.key = key
+        self.limit = limit
+        self.items = items
+        self.always = always
+
+    def compile(self) -> Op:
+        key, limit, always = self.key, self.limit, self.always
+        row_ops = []
+        for row in range(limit):
+            parts = []
+            for item in self.items:
+                batch = item.batch_row(row) if hasattr(item, "batch_row") else None
+                parts.append(batch or item.compile_row(row))
+            row_ops.append(_merge_runs(part for part in parts if part is not None))
+        row_ops = tuple(row_ops)
+
+        def op(data, fields):
+            entries = safe_get_array(data, key, [])
+            count = len(entries)
+            for row in range(max(min(count, limit), always)):
+                entry = entries[row] if row < count else None
+                if not isinstance(entry, dict):
+                    if row >= always:
+                        continue
+                    entry = {}
+                for row_op in row_ops[row]:
+                    row_op(entry, data, fields)
+        return op
+
+    def exports(self):
+        yield from _exports(self.items)
+
+    def reads(self):
+        # ("rows", limit, ((key, kind), ...)): a list whose first ``limit`` entries are checked
+        yield self.key, ("rows", self.limit, tuple(read for item in self.items for read in item.row_reads()))
+        yield from _reads(self.items)
+
+
+def _text_run(entries) -> Op:
+    def op(data, fields):
+        get = data.get
+        for key, target, transform in entries:
+            value = get(key)
+            if value:
+                fields[target] = value if transform is None else transform(value)
+    return op
+
+
+def _yes_no_run(entries) -> Op:
+    def op(data, fields):
+        get = data.get
+        for key, yes_field, no_field in entries:
+            value = get(key)
+            if value:
+                if value != "yes" and value != "no":
+                    value = str(value).lower().strip()
+                if value == "yes":
+                    fields[yes_field] = YES
+                elif value == "no":
+                    fields[no_field] = NO
+    return op
+
+
+def _item_text_run(entries) -> RowOp:
+    def op(item, data, fields):
+        get = item.get
+        for key, target, transform in entries:
+            value = get(key)
+            if value:
+                fields[target] = value if transform is None else transform(value)
+    return op
+
+
+_RUNS = {"text": _text_run, "yes_no": _yes_no_run, "item_text": _item_text_run}
+
+
+def _merge_runs(parts) -> tuple:
+    """
+    Turn compiled ops and ``(kind, row)`` batch entries into a tuple of ops.
+
+    Consecutive entries of the same kind become one operation looping over a
+    tuple of (key, field, ...) rows, which is cheaper than one closure call
+    per field. Order is preserved.
+    """
+    ops = []
+    run_kind, run = None, []
+    for part in parts:
+        kind, row = part if isinstance(part, tuple) else (None, part)
+        if run and kind != run_kind:
+            ops.append(_RUNS[run_kind](tuple(run)))
+            run = []
+        if kind is None:
+            ops.append(row)
+        else:
+            run_kind = kind
+            run.append(row)
+    if run:
+        ops.append(_RUNS[run_kind](tuple(run)))
+    return tuple(ops)
+
+
+def _compile_group(spec: Sequence) -> Tuple[Op, ...]:
+    """Compile entries in order, merging runs of simple Text / YesNo entries."""
+    return _merge_runs(
+        (entry.batch() if hasattr(entry, "batch") else None) or entry.compile()
+        for entry in spec
+    )
+
+
+def compile_spec(spec: Sequence) -> List[Op]:
+    """Compile a mapping spec into the flat list of operations the mapper runs."""
+    return list(_compile_group(spec))
+
+
+def _exports(spec: Sequence) -> Iterator[Tuple[str, str]]:
+    for entry in spec:
+        if hasattr(entry, "exports"):
+            yield from entry.exports()
+
+
+def _reads(spec: Sequence) -> Iterator[Tuple[str, object]]:
+    for entry in spec:
+        if hasattr(entry, "reads"):
+            yield from entry.reads()
+
+
+# ═══════════════════════════════════════════════════════════════
+# REPEATED FIELD NAMES
+# Built and interned once at import; the spec and anything else that needs
+# the per-page or per-row names index into these tuples.
+# ═══════════════════════════════════════════════════════════════
+
+# One A-Number box per page; from page 6 on the #area index runs one ahead
+A_NUMBER_FIELDS = tuple(
+    sys.intern(f"form1[0].#subform[{page}].#area[{page if page < 5 else page + 1}].Line1_AlienNumber[{page}]")
+    for page in range(14)
+)
+
+CHILD_NAME_FIELDS = rows("form1[0].#subform[4].P7_EmployerName{idx}[0]", 3)
+CHILD_BIRTH_DATE_FIELDS = rows("form1[0].#subform[4].P7_From{idx}[0]", 3)
+CHILD_RESIDENCE_FIELDS = rows("form1[0].#subform[4].P7_OccupationFieldStudy{idx}[0]", 3)
+CHILD_RELATIONSHIP_FIELDS = rows("form1[0].#subform[4].P7_OccupationFieldStudy{idx}[1]", 3)
+# Row 1 support boxes are reversed: P9_Line5a [0]=Y, [1]=N
+CHILD_SUPPORT_YES_FIELDS = _as_fields((
+    "form1[0].#subform[4].P9_Line5a[0]",
+    "form1[0].#subform[4].P6_ChildTwo[1]",
+    "form1[0].#subform[4].P6_ChildThree[1]",
+))
+CHILD_SUPPORT_NO_FIELDS = _as_fields((
+    "form1[0].#subform[4].P9_Line5a[1]",
+    "form1[0].#subform[4].P6_ChildTwo[0]",
+    "form1[0].#subform[4].P6_ChildThree[0]",
+))
+
+TRIP_DATE_LEFT_FIELDS = rows("form1[0].#subform[5].P8_Line1_DateLeft{idx}[0]", 6)
+TRIP_DATE_RETURNED_FIELDS = rows("form1[0].#subform[5].P8_Line1_DateReturn{idx}[0]", 6)
+TRIP_COUNTRIES_FIELDS = rows("form1[0].#subform[5].P8_Line1_Countries{idx}[0]", 6,
+                             row1="form1[0].#subform[5].P9_Line1_Countries1[0]")
+
+CRIME_DESCRIPTION_FIELDS = rows("form1[0].#subform[7].P12_Line29_why{idx}[0]", 5)
+CRIME_DATE_FIELDS = rows("form1[0].#subform[7].P12_Line29_Date{idx}[0]", 5)
+CRIME_CONVICTION_DATE_FIELDS = rows("form1[0].#subform[7].P12_Line29_DateOfConv{idx}[0]", 5)
+CRIME_DISPOSITION_FIELDS = rows("form1[0].#subform[7].P12_Line29_Outcome{idx}[0]", 5)
+CRIME_PLACE_FIELDS = rows("form1[0].#subform[7].P12_Line29_Outcome{idx}[1]", 5)
+CRIME_SENTENCE_FIELDS = rows("form1[0].#subform[7].P12_Line29_Outcome{idx}[2]", 5)
+
+
+# ═══════════════════════════════════════════════════════════════
+# MAPPING SPEC (in PDF output order)
+# ═══════════════════════════════════════════════════════════════
+
+MAPPING_SPEC = [
+    # ═══════════════════════════════════════════════════════════════
+    # A-NUMBER (All 14 pages)
+    # ═══════════════════════════════════════════════════════════════
+    Text("a_number", A_NUMBER_FIELDS, strip_dashes),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 1: ELIGIBILITY (Page 1)
+    # ═══════════════════════════════════════════════════════════════
+    Choice("eligibility_basis", {
+        "5year": ("form1[0].#subform[0].Part1_Eligibility[2]", "/A"),
+        "3year_marriage": ("form1[0].#subform[0].Part1_Eligibility[1]", "/B"),
+        "vawa": ("form1[0].#subform[0].Part1_Eligibility[0]", "/C"),
+        "spouse_qualified_employment": ("form1[0].#subform[0].Part1_Eligibility[6]", "/D"),
+        "military_current": ("form1[0].#subform[0].Part1_Eligibility[3]", "/E"),
+        "military_former": ("form1[0].#subform[0].Part1_Eligibility[4]", "/F"),
+        "other": ("form1[0].#subform[0].Part1_Eligibility[5]", "/G"),
+    }),
+    When("eligibility_basis", "other", [
+        Text("other_basis_reason", "form1[0].#subform[0].Part1Line5_OtherExplain[0]"),
+    ]),
+    # USCIS Field Office (e.g. for INA 319(b) filers)
+    Text("uscis_field_office", "form1[0].#subform[0].DropDownList1[0]"),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 2: PERSONAL INFO (Pages 1-2)
+    # ═══════════════════════════════════════════════════════════════
+    Text("last_name", "form1[0].#subform[0].P2_Line1_FamilyName[0]"),
+    Text("first_name", "form1[0].#subform[0].P2_Line1_GivenName[0]"),
+    Text("middle_name", "form1[0].#subform[0].P2_Line1_MiddleName[0]"),
+
+    # Other Names (array or individual other_*_1/2 fields)
+    When("has_used_other_names", "yes", [
+        Repeat("other_names", 2, always=2, items=[
+            Item("family_name", rows("form1[0].#subform[0].Line2_FamilyName{idx}[0]", 2),
+                 fallback=("other_last_name_1", "other_last_name_2")),
+            Item("given_name", rows("form1[0].#subform[0].Line3_GivenName{idx}[0]", 2),
+                 fallback=("other_first_name_1", "other_first_name_2")),
+            Item("middle_name", rows("form1[0].#subform[0].Line3_MiddleName{idx}[0]", 2),
+                 fallback=("other_middle_name_1", "other_middle_name_2")),
+        ]),
+    ]),
+
+    # Name Change (Page 2)
+    Choice("wants_name_change", {
+        "yes": [
+            Set("form1[0].#subform[1].P2_Line34_NameChange[1]", "/Y"),
+            Text("new_name_last", "form1[0].#subform[1].Part2Line3_FamilyName[0]"),
+            Text("new_name_first", "form1[0].#subform[1].Part2Line4a_GivenName[0]"),
+            Text("new_name_middle", "form1[0].#subform[1].Part2Line4a_MiddleName[0]"),
+        ],
+        "no": ("form1[0].#subform[1].P2_Line34_NameChange[0]", "/N"),
+    }),
+
+    Text("uscis_account_number", "form1[0].#subform[1].P2_Line6_USCISELISAcctNumber[0]"),
+
+    # Gender - /M for male, /F for female
+    Choice("gender", {
+        "male": ("form1[0].#subform[1].P2_Line7_Gender[0]", "/M"),
+        "female": ("form1[0].#subform[1].P2_Line7_Gender[1]", "/F"),
+    }, lower=True),
+
+    Text("date_of_birth", "form1[0].#subform[1].P2_Line8_DateOfBirth[0]", format_date),
+    Text("date_became_permanent_resident",
+         "form1[0].#subform[1].P2_Line9_DateBecamePermanentResident[0]", format_date),
+    Text("country_of_birth", "form1[0].#subform[1].P2_Line10_CountryOfBirth[0]"),
+    # Part 2.11 - Country of Citizenship/Nationality (always output if present)
+    Text(("country_of_citizenship", "country_of_nationality"),
+         "form1[0].#subform[1].P2_Line11_CountryOfNationality[0]"),
+
+    # Q10 - Was your mother or father a U.S. citizen before your 18th birthday?
+    # (P2_Line10_claimdisability is parent citizenship, NOT disability accommodations)
+    Choice("parent_us_citizen_before_18", {
+        "yes": ("form1[0].#subform[1].P2_Line10_claimdisability[1]", "/Y"),
+        "no": ("form1[0].#subform[1].P2_Line10_claimdisability[0]", "/N"),
+    }),
+    # Q11 - Disability preventing English/civics
+    Choice("disability_prevents_english", {
+        "yes": ("form1[0].#subform[1].P2_Line11_claimdisability[1]", "/Y"),
+        "no": ("form1[0].#subform[1].P2_Line11_claimdisability[0]", "/N"),
+    }),
+    # Q12.a - SSA Card
+    Choice("ssa_wants_card", {
+        "yes": ("form1[0].#subform[1].Line12a_Checkbox[1]", "/Y"),
+        "no": ("form1[0].#subform[1].Line12a_Checkbox[0]", "/N"),
+    }),
+    # Q12.b - SSN
+    Text("ssn", "form1[0].#subform[1].Line12b_SSN[0]", strip_dashes),
+    # Q12.c - SSA Consent
+    Choice("ssa_consent_disclosure", {
+        "yes": ("form1[0].#subform[1].Line12\\.c_Checkbox[1]", "/Y"),
+        "no": ("form1[0].#subform[1].Line12\\.c_Checkbox[0]", "/N"),
+    }),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 4: RESIDENCE (Page 3)
+    # ═══════════════════════════════════════════════════════════════
+    Text("street_address", "form1[0].#subform[2].P4_Line1_StreetName[0]"),
+    When("residence_in_care_of", None, [
+        Text("residence_in_care_of", "form1[0].#subform[2].P4_Line1_InCareOfName[0]"),
+    ], otherwise=[
+        When("mailing_same_as_residence", "yes", [
+            Text("mailing_in_care_of", "form1[0].#subform[2].P4_Line1_InCareOfName[0]"),
+        ]),
+    ]),
+
+    # Apt/Ste/Flr checkboxes
+    Choice("apt_type", {
+        "apt": ("form1[0].#subform[2].P4_Line1_Unit[2]", "/APT"),
+        "ste": ("form1[0].#subform[2].P4_Line1_Unit[1]", "/STE"),
+        "flr": ("form1[0].#subform[2].P4_Line1_Unit[0]", "/FLR"),
+    }, lower=True),
+    # Apt/Ste/Flr number - always output if present (not optional in UI)
+    Text("apt_ste_flr", "form1[0].#subform[2].P4_Line1_Number[0]"),
+    Text("city", "form1[0].#subform[2].P4_Line1_City[0]"),
+    Text("state", "form1[0].#subform[2].P4_Line1_State[0]", state_code),
+    Text("residence_province", "form1[0].#subform[2].P4_Line1_Province[0]"),
+    Text("zip_code", "form1[0].#subform[2].P4_Line1_ZipCode[0]"),
+    Text("residence_postal_code", "form1[0].#subform[2].P4_Line1_PostalCode[0]"),
+    Const("form1[0].#subform[2].P4_Line1_Country[0]", "United States"),
+
+    # Residence dates (From / To)
+    # Template appears to place the "From" box in index [1].
+    Text("residence_from", "form1[0].#subform[2].P4_Line1_DatesofResidence[1]", format_date),
+    Text("residence_to", "form1[0].#subform[2].P4_Line1_DatesofResidence[0]", date_or_present),
+
+    # Part 4.2 - Is your current physical address also your current mailing address?
+    # Part 4.3 - Mailing address fields are only filled when Part 4.2 is "no"
+    Choice("mailing_same_as_residence", {
+        "yes": ("form1[0].#subform[2].Pt3_Line2a_Checkbox[1]", "/Y"),
+        "no": [
+            Set("form1[0].#subform[2].Pt3_Line2a_Checkbox[0]", "/N"),
+            Choice("mailing_apt_type", {
+                "apt": ("form1[0].#subform[3].P5_Line1b_Unit[2]", "/APT"),
+                "ste": ("form1[0].#subform[3].P5_Line1b_Unit[1]", "/STE"),
+                "flr": ("form1[0].#subform[3].P5_Line1b_Unit[0]", "/FLR"),
+            }, lower=True),
+            Text("mailing_apt_ste_flr", "form1[0].#subform[3].P5_Line1b_Number[0]"),
+            Text("mailing_in_care_of", "form1[0].#subform[3].P5_Line1b_InCareOfName[0]"),
+            Text("mailing_street_address", "form1[0].#subform[3].P5_Line1b_StreetName[0]"),
+            Text("mailing_city", "form1[0].#subform[3].P5_Line1b_City[0]"),
+            Text("mailing_state", "form1[0].#subform[3].P4_Line1_State[1]"),
+            Text("mailing_zip_code", "form1[0].#subform[3].P5_Line1b_ZipCode[0]"),
+            Text("mailing_province", "form1[0].#subform[3].P5_Line1b_Province[0]"),
+            Text("mailing_postal_code", "form1[0].#subform[3].P5_Line1b_PostalCode[0]"),
+            Text("mailing_country", "form1[0].#subform[3].P5_Line1b_Country[0]"),
+        ],
+    }),
+
+    # Previous physical addresses (Part 4.1 table); row 1 From/To share P4_Line3_From1
+    Repeat("residence_addresses", 3, items=[
+        Item("street_address", rows("form1[0].#subform[2].P4_Line3_PhysicalAddress{idx}[0]", 3)),
+        Item("city", rows("form1[0].#subform[2].P4_Line3_CityTown{idx}[0]", 3)),
+        Item(("state", "province"), rows("form1[0].#subform[2].P4_Line3_State{idx}[0]", 3)),
+        Item(("zip_code", "postal_code"), rows("form1[0].#subform[2].P4_Line3_ZipCode{idx}[0]", 3)),
+        Item("country", rows("form1[0].#subform[2].P4_Line3_Country{idx}[0]", 3)),
+        Item("dates_from", rows("form1[0].#subform[2].P4_Line3_From{idx}[0]", 3), format_date),
+        Item("dates_to", rows("form1[0].#subform[2].P4_Line3_To{idx}[0]", 3,
+                              row1="form1[0].#subform[2].P4_Line3_From1[1]"), date_or_present),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 7: BIOGRAPHIC INFO (Page 3)
+    # ═══════════════════════════════════════════════════════════════
+    Choice("ethnicity", {
+        "hispanic": ("form1[0].#subform[2].P7_Line1_Ethnicity[1]", "/Y"),
+        "not_hispanic": ("form1[0].#subform[2].P7_Line1_Ethnicity[0]", "/N"),
+        "not hispanic": ("form1[0].#subform[2].P7_Line1_Ethnicity[0]", "/N"),
+    }, lower=True),
+    Choice("race", {
+        "white": ("form1[0].#subform[2].P7_Line2_Race[4]", "/W"),
+        "asian": ("form1[0].#subform[2].P7_Line2_Race[1]", "/A"),
+        "black": ("form1[0].#subform[2].P7_Line2_Race[2]", "/B"),
+        "native": ("form1[0].#subform[2].P7_Line2_Race[0]", "/I"),
+        "pacific": ("form1[0].#subform[2].P7_Line2_Race[3]", "/A"),
+    }, lower=True),
+    Text("height_feet", "form1[0].#subform[2].P7_Line3_HeightFeet[0]", str),
+    Text("height_inches", "form1[0].#subform[2].P7_Line3_HeightInches[0]", str),
+    Text("weight", (
+        "form1[0].#subform[2].P7_Line4_Pounds1[0]",
+        "form1[0].#subform[2].P7_Line4_Pounds2[0]",
+        "form1[0].#subform[2].P7_Line4_Pounds3[0]",
+    ), three_digits, spread=True),
+    Choice("eye_color", {
+        "brown": ("form1[0].#subform[2].P7_Line5_Eye[0]", "/BRO"),
+        "blue": ("form1[0].#subform[2].P7_Line5_Eye[1]", "/BLU"),
+        "green": ("form1[0].#subform[2].P7_Line5_Eye[2]", "/GRN"),
+        "hazel": ("form1[0].#subform[2].P7_Line5_Eye[3]", "/HAZ"),
+        "gray": ("form1[0].#subform[2].P7_Line5_Eye[4]", "/GRY"),
+        "black": ("form1[0].#subform[2].P7_Line5_Eye[5]", "/BLK"),
+        "pink": ("form1[0].#subform[2].P7_Line5_Eye[6]", "/PNK"),
+        "maroon": ("form1[0].#subform[2].P7_Line5_Eye[7]", "/MAR"),
+        "unknown": ("form1[0].#subform[2].P7_Line5_Eye[8]", "/XXX"),
+    }, lower=True),
+    Choice("hair_color", {
+        "bald": ("form1[0].#subform[2].P7_Line6_Hair[0]", "/BAL"),
+        "sandy": ("form1[0].#subform[2].P7_Line6_Hair[1]", "/SDY"),
+        "red": ("form1[0].#subform[2].P7_Line6_Hair[2]", "/RED"),
+        "white": ("form1[0].#subform[2].P7_Line6_Hair[3]", "/WHI"),
+        "gray": ("form1[0].#subform[2].P7_Line6_Hair[4]", "/GRY"),
+        "blond": ("form1[0].#subform[2].P7_Line6_Hair[5]", "/BLN"),
+        "brown": ("form1[0].#subform[2].P7_Line6_Hair[6]", "/BRO"),
+        "black": ("form1[0].#subform[2].P7_Line6_Hair[7]", "/BLK"),
+        "unknown": ("form1[0].#subform[2].P7_Line6_Hair[8]", "/XXX"),
+    }, lower=True),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 5: MARITAL STATUS (Page 4)
+    # ═══════════════════════════════════════════════════════════════
+    Choice("marital_status", {
+        "divorced": ("form1[0].#subform[3].P10_Line1_MaritalStatus[0]", "/D"),
+        "single": ("form1[0].#subform[3].P10_Line1_MaritalStatus[1]", "/S"),
+        "widowed": ("form1[0].#subform[3].P10_Line1_MaritalStatus[2]", "/W"),
+        "married": ("form1[0].#subform[3].P10_Line1_MaritalStatus[3]", "/M"),
+        "annulled": ("form1[0].#subform[3].P10_Line1_MaritalStatus[4]", "/A"),
+        "separated": ("form1[0].#subform[3].P10_Line1_MaritalStatus[5]", "/E"),
+    }, lower=True),
+    # Q2 - Spouse military (P7_Line2_Forces: [0]=N, [1]=Y)
+    Choice("spouse_is_military_member", {
+        "yes": ("form1[0].#subform[3].P7_Line2_Forces[1]", "/Y"),
+        "no": ("form1[0].#subform[3].P7_Line2_Forces[0]", "/N"),
+    }),
+    # Part 5.3 - Times Married: null = 0, 0 = 0, etc.
+    Count("times_married", "form1[0].#subform[3].Part9Line3_TimesMarried[0]"),
+
+    # Spouse info
+    When("marital_status", "married", lower=True, then=[
+        Text("spouse_last_name", "form1[0].#subform[3].P10_Line4a_FamilyName[0]"),
+        Text("spouse_first_name", "form1[0].#subform[3].P10_Line4a_GivenName[0]"),
+        Text("spouse_middle_name", "form1[0].#subform[3].P10_Line4a_MiddleName[0]"),
+        Text("spouse_date_of_birth", "form1[0].#subform[3].P10_Line4d_DateofBirth[0]", format_date),
+        Text("spouse_date_of_marriage", "form1[0].#subform[3].P10_Line4e_DateEnterMarriage[0]", format_date),
+
+        # Part 4.d - Spouse address same as applicant (must come first)
+        Choice("spouse_address_same_as_applicant", {
+            "yes": [
+                Set("form1[0].#subform[3].P10_Line5_Citizen[1]", "/Y"),
+                Set("form1[0].#subform[10].P10_Line1_Citizen[1]", "/Y"),
+            ],
+            "no": [
+                Set("form1[0].#subform[3].P10_Line5_Citizen[0]", "/N"),
+                Set("form1[0].#subform[10].P10_Line1_Citizen[0]", "/N"),
+            ],
+        }),
+
+        # 5.a - When did your current spouse become a U.S. citizen?
+        # By birth → go to item 7; other → 5.b date required
+        Choice("spouse_citizenship_by_birth", {
+            "yes": ("form1[0].#subform[3].P10_Line5a_When[0]", "/B"),
+            "no": [
+                Set("form1[0].#subform[3].P10_Line5a_When[1]", "/O"),
+                Text("spouse_date_became_citizen", "form1[0].#subform[3].P10_Line5b_DateBecame[0]", format_date),
+            ],
+        }),
+
+        # Spouse A-number (Page 5)
+        Text("spouse_a_number", "form1[0].#subform[4].#area[5].P7_Line6_ANumber[0]"),
+        # Part 5.7 - Spouse times married: null = 0, 0 = 0, etc.
+        Count("spouse_times_married", "form1[0].#subform[4].P10_Line4g_Employer[0]"),
+        # Spouse employer (Page 5 - Q8)
+        Text("spouse_current_employer", "form1[0].#subform[4].TextField1[0]"),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 6: CHILDREN (Page 5)
+    # ═══════════════════════════════════════════════════════════════
+    Text("total_children", "form1[0].#subform[4].P11_Line1_TotalChildren[0]", str),
+    Repeat("children", 3, items=[
+        Item(None, CHILD_NAME_FIELDS, value=child_name),
+        Item("date_of_birth", CHILD_BIRTH_DATE_FIELDS, format_date),
+        Item("residence", CHILD_RESIDENCE_FIELDS),
+        Item("relationship", CHILD_RELATIONSHIP_FIELDS),
+        ItemYesNo("support", CHILD_SUPPORT_YES_FIELDS, CHILD_SUPPORT_NO_FIELDS,
+                  fallback="providing_support_for_children"),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 3: EMPLOYMENT (Page 5)
+    # Uses P5_EmployerName for Name column, P7_ for other columns.
+    # Row 1 falls back to the flat current_* intake fields; the PDF has no
+    # P7_To1, only rows 2/3 have a To date.
+    # ═══════════════════════════════════════════════════════════════
+    Repeat("employment_history", 3, always=1, items=[
+        Item("employer_or_school", rows("form1[0].#subform[4].P5_EmployerName{idx}[0]", 3),
+             fallback=("current_employer", None, None)),
+        Item("occupation_or_field", rows("form1[0].#subform[4].P7_OccupationFieldStudy{idx}[2]", 3),
+             fallback=("current_occupation", None, None)),
+        Item("city", rows("form1[0].#subform[4].P7_City{idx}[0]", 3),
+             fallback=("employer_city", None, None)),
+        Item("state", rows("form1[0].#subform[4].P7_State{idx}[0]", 3),
+             fallback=("employer_state", None, None)),
+        Item("zip_code", rows("form1[0].#subform[4].P7_ZipCode{idx}[0]", 3),
+             fallback=("employer_zip_code", None, None)),
+        Item("country", rows("form1[0].#subform[4].P7_Country{idx}[0]", 3)),
+        Item("dates_from", rows("form1[0].#subform[4].P7_From{idx}[1]", 3), format_date,
+             fallback=("employment_from", None, None)),
+        Item("dates_to", rows("form1[0].#subform[4].P7_To{idx}[0]", 3, row1=""), date_or_present),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 4: TIME OUTSIDE US (Pages 5-6)
+    # ═══════════════════════════════════════════════════════════════
+    Repeat("trips", 6, items=[
+        Item("date_left_us", TRIP_DATE_LEFT_FIELDS, format_date),
+        Item("date_returned_us", TRIP_DATE_RETURNED_FIELDS, format_date),
+        Item("countries_traveled", TRIP_COUNTRIES_FIELDS),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 12: BACKGROUND QUESTIONS (Pages 6-10)
+    # ═══════════════════════════════════════════════════════════════
+
+    # --- Page 6 (subform[5]) ---
+    YesNo("q_claimed_us_citizen", "form1[0].#subform[5].P9_Line1"),
+    YesNo("q_voted_in_us", "form1[0].#subform[5].P9_Line2"),
+    # Q3/Q4 have reversed states: [0]=Y, [1]=N
+    # P9_Line3 = Q3 "owe overdue taxes"; P9_Line4 = Q4 "nonresident on tax return"
+    YesNo("q_owe_taxes", "form1[0].#subform[5].P9_Line3", yes_idx=0, no_idx=1),
+    YesNo("q_nonresident_alien_tax", "form1[0].#subform[5].P9_Line4", yes_idx=0, no_idx=1),
+    # Q5 Communist/Totalitarian
+    YesNo("q_communist_party", "form1[0].#subform[5].P9_5a", yes_idx=0, no_idx=1),
+    YesNo("q_terrorist_org", "form1[0].#subform[5].P9_5b", yes_idx=0, no_idx=1),
+
+    # --- Page 7 (subform[6]) Q6-Q14 ---
+    YesNo("q_used_weapon_explosive", "form1[0].#subform[6].P12_6a"),
+    # Q6.b - Kidnapping (REVERSED: [0]=Y, [1]=N)
+    YesNo("q_kidnapping_assassination_hijacking", "form1[0].#subform[6].P12_6b", yes_idx=0, no_idx=1),
+    YesNo("q_threatened_weapon_violence", "form1[0].#subform[6].P12_6c"),
+    YesNo("q_torture", "form1[0].#subform[6].P9_Line7a"),
+    YesNo("q_genocide", "form1[0].#subform[6].P9_Line7\\.b\\."),
+    YesNo("q_killing_person", "form1[0].#subform[6].P9_Line7\\.c"),
+    # Q7.d - Severe injury (using P11_7d)
+    YesNo("q_severely_injuring", "form1[0].#subform[6].P11_7d"),
+    YesNo("q_sexual_contact_nonconsent", "form1[0].#subform[6].P9_Line7\\.e"),
+    YesNo("q_religious_persecution", "form1[0].#subform[6].P9_Line7\\.f"),
+    YesNo("q_harm_race_religion", "form1[0].#subform[6].P9_Line7\\.g"),
+    # Q8.a - Military/police service (intake may use q_military_police_service or q_served_military_police_unit)
+    YesNo(("q_military_police_service", "q_served_military_police_unit"), "form1[0].#subform[6].P9_Line8a"),
+    YesNo("q_armed_group", "form1[0].#subform[6].P9_Line8b"),
+    YesNo("q_detention_facility", "form1[0].#subform[6].P9_Line9"),
+    YesNo("q_group_used_weapons", "form1[0].#subform[6].P9_Line10a"),
+    YesNo("q_used_weapon_against_person", "form1[0].#subform[6].P9_Line10b"),
+    # Q10.c - Threatened weapon (REVERSED: [0]=Y, [1]=N)
+    YesNo("q_threatened_weapon_use", "form1[0].#subform[6].P9_Line10c", yes_idx=0, no_idx=1),
+    YesNo("q_sold_provided_weapons", "form1[0].#subform[6].P9_Line11"),
+    YesNo("q_weapons_training", "form1[0].#subform[6].P9_Line12"),
+    YesNo("q_recruited_under_15", "form1[0].#subform[6].P9_Line13"),
+    YesNo("q_used_under_15_hostilities", "form1[0].#subform[6].P9_Line14"),
+
+    # --- Page 8 (subform[7]) Q15, Q16 ---
+    YesNo("q_committed_crime_not_arrested", "form1[0].#subform[7].P9_Line15a"),
+    YesNo("q_arrested", "form1[0].#subform[7].P9_Line15b"),
+    # Crime details table (PDF has space for 5 entries); Outcome[0/1/2] are text fields
+    Repeat("crimes", 5, items=[
+        Item("crime_description", CRIME_DESCRIPTION_FIELDS),
+        Item("date_of_crime", CRIME_DATE_FIELDS, format_date),
+        Item("date_of_conviction", CRIME_CONVICTION_DATE_FIELDS, format_date),
+        Item("result_disposition", CRIME_DISPOSITION_FIELDS),
+        Item("place_of_crime", CRIME_PLACE_FIELDS),
+        Item("sentence", CRIME_SENTENCE_FIELDS),
+    ]),
+    YesNo("q_completed_probation", "form1[0].#subform[7].P12_Line16"),
+
+    # --- Page 9 (subform[8]) Q17-25 ---
+    YesNo("q_prostitution", "form1[0].#subform[8].P11_Line17A"),
+    YesNo("q_controlled_substances", "form1[0].#subform[8].P11_Line17B"),
+    YesNo("q_polygamy", "form1[0].#subform[8].P11_Line17C"),
+    YesNo("q_marriage_fraud", "form1[0].#subform[8].P12_Line17d"),
+    YesNo("q_helped_illegal_entry", "form1[0].#subform[8].P12_Line17e"),
+    # Q17.f (P12_Line17f: [0]=Yes, [1]=No - TU bug shows both "Select Yes")
+    YesNo("q_illegal_gambling", "form1[0].#subform[8].P12_Line17f", yes_idx=0, no_idx=1),
+    YesNo("q_failed_child_support", "form1[0].#subform[8].P12_Line17g"),
+    YesNo("q_misrepresentation_public_benefits", "form1[0].#subform[8].P12_Line17h"),
+    # Q18/Q19 ([0]=Yes, [1]=No - TU bug shows both "Select Yes")
+    YesNo("q_false_info_us_government", "form1[0].#subform[8].P12_Line18", yes_idx=0, no_idx=1),
+    YesNo("q_lied_us_government", "form1[0].#subform[8].P12_Line19", yes_idx=0, no_idx=1),
+    YesNo("q_removal_proceedings", "form1[0].#subform[8].P12_Line20"),
+    YesNo("q_removed_deported", "form1[0].#subform[8].P12_Line21"),
+    YesNo("q_male_18_26_lived_us", "form1[0].#subform[8].P9_Line22a"),
+    YesNo("q_registered_selective_service", "form1[0].#subform[8].Pt9_Line22b"),
+    Text("selective_service_number", "form1[0].#subform[8].P9_Line22c_SSNumber[0]"),
+    Text("selective_service_date", "form1[0].#subform[8].P9_Line22c_Date[0]", format_date),
+    YesNo("q_left_us_avoid_draft", "form1[0].#subform[8].P12_Line23"),
+    YesNo("q_applied_military_exemption", "form1[0].#subform[8].P12_Line24"),
+    YesNo("q_served_us_military", "form1[0].#subform[8].P12_Line25"),
+
+    # --- Page 10 (subform[9]) Q26-37 ---
+    YesNo("q_current_military_member", "form1[0].#subform[9].P12_Line26a"),
+    YesNo("q_scheduled_deploy", "form1[0].#subform[9].P12_Line26b"),
+    YesNo("q_stationed_outside_us", "form1[0].#subform[9].P12_Line26c"),
+    YesNo("q_former_military_outside_us", "form1[0].#subform[9].P11_Line26d"),
+    YesNo("q_court_martialed", "form1[0].#subform[9].P12_Line27", yes_idx=0, no_idx=1),
+    YesNo("q_discharged_because_alien", "form1[0].#subform[9].P12_Line28", yes_idx=0, no_idx=1),
+    YesNo("q_deserted_military", "form1[0].#subform[9].P9_Line29"),
+    # Q30 combines 30.a and 30.b with the titles list inline
+    YesNo("q_title_of_nobility", "form1[0].#subform[9].P12_Line30a", yes_idx=0, no_idx=1),
+    YesNo("q_willing_to_give_up_titles", "form1[0].#subform[9].P12_Line30b", yes_idx=0, no_idx=1),
+    Text("q_titles_list", "form1[0].#subform[9].P9_NobilityTitles[0]"),
+    YesNo("q_support_constitution", "form1[0].#subform[9].P12_Line31"),
+    YesNo("q_understand_oath", "form1[0].#subform[9].P12_Line32", yes_idx=0, no_idx=1),
+    YesNo("q_unable_oath_disability", "form1[0].#subform[9].P12_Line33", yes_idx=0, no_idx=1),
+    # Q34/Q36 ([0]=No, [1]=Yes); Q35/Q37 reversed ([0]=Yes, [1]=No)
+    YesNo("q_willing_take_oath", "form1[0].#subform[9].P12_Line34"),
+    YesNo("q_willing_bear_arms", "form1[0].#subform[9].P12_Line35", yes_idx=0, no_idx=1),
+    YesNo("q_willing_noncombatant", "form1[0].#subform[9].P12_Line36"),
+    YesNo("q_willing_work_national_importance", "form1[0].#subform[9].P12_Line37", yes_idx=0, no_idx=1),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 13: CONTACT INFO (Page 11)
+    # ═══════════════════════════════════════════════════════════════
+    Text("daytime_phone", "form1[0].#subform[10].P12_Line3_Telephone[0]"),
+    Text("mobile_phone", "form1[0].#subform[10].P12_Line3_Mobile[0]"),
+    Text("email", "form1[0].#subform[10].P12_Line5_Email[0]"),
+
+    # Part 11 - Signature and Date, plus the Part 15/16 duplicate signature
+    # blocks (Signature at Interview, Oath of Allegiance)
+    Text("signature_date", "form1[0].#subform[10].P13_DateofSignature[0]", format_date),
+    Text("applicant_signature", (
+        "form1[0].#subform[10].P12_SignatureApplicant[0]",
+        "form1[0].#subform[13].ApplicantsSignature[0]",
+        "form1[0].#subform[13].Part15ApplicantsSignature[0]",
+    )),
+    Text("signature_date", (
+        "form1[0].#subform[13].Part15DateofSignature[0]",
+        "form1[0].#subform[13].Part15DateofSignature[1]",
+    ), format_date),
+
+    # Fee Reduction (P10_Line1_Citizen: [0]=No, [1]=Yes)
+    Choice("fee_reduction_requested", {
+        "yes": ("form1[0].#subform[10].P10_Line1_Citizen[1]", "/Y"),
+        "no": ("form1[0].#subform[10].P10_Line1_Citizen[0]", "/N"),
+    }),
+    Text("household_income", "form1[0].#subform[10].P10_Line2_TotalHouseholdIn[0]"),
+    Text("household_size", "form1[0].#subform[10].P10_Line3_HouseHoldSize[0]", str),
+    # Q4 "Total number of household members earning income" = P11_Line1_TotalChildren[1] on subform[10]
+    Text("household_income_earners", "form1[0].#subform[10].P11_Line1_TotalChildren[1]", str),
+    # Q5 "I reside in a household" (P10_Line5a: [0]=No, [1]=Yes)
+    Choice("is_head_of_household", {
+        "yes": ("form1[0].#subform[10].P10_Line5a[1]", "/Y"),
+        "no": ("form1[0].#subform[10].P10_Line5a[0]", "/N"),
+    }),
+    Text("head_of_household_name", "form1[0].#subform[10].P10_Line5b_NameOfHousehold[0]"),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 12: INTERPRETER (Page 12)
+    # ═══════════════════════════════════════════════════════════════
+    When("used_interpreter", "yes", [
+        Text("interpreter_last_name", "form1[0].#subform[11].P14_Line1_nterpreterFamilyName[0]"),
+        Text("interpreter_first_name", "form1[0].#subform[11].P14_Line1_nterpreterGivenName[0]"),
+        Text("interpreter_business_name", "form1[0].#subform[11].P14_Line2_NameofBusinessorOrgName[0]"),
+        Text("interpreter_phone", "form1[0].#subform[11].P14_Line4_Telephone[0]"),
+        Text("interpreter_mobile", "form1[0].#subform[11].P14_Line5_Mobile[0]"),
+        Text("interpreter_email", "form1[0].#subform[11].P14_Line5_EmailAddress[0]"),
+        Text("interpreter_language", "form1[0].#subform[11].P14_NameOfLanguage[0]"),
+        Text("interpreter_signature", "form1[0].#subform[11].P12_SignatureApplicant[1]"),
+        Text("interpreter_signature_date", "form1[0].#subform[11].P14_DateofSignature[0]", format_date),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 13: PREPARER (Page 12)
+    # ═══════════════════════════════════════════════════════════════
+    When("used_preparer", "yes", [
+        Text("preparer_last_name", "form1[0].#subform[11].P15_Line1_PreparerFamilyName[0]"),
+        Text("preparer_first_name", "form1[0].#subform[11].P15_Line1_PreparerGivenName[0]"),
+        Text("preparer_business_name", "form1[0].#subform[11].P15_Line2_NameofBusinessorOrgName[0]"),
+        Text("preparer_phone", "form1[0].#subform[11].P15_Line4_Telephone[0]"),
+        Text("preparer_mobile", "form1[0].#subform[11].P15_Line5_Mobile[0]"),
+        Text("preparer_email", "form1[0].#subform[11].P15_Line6_Email[0]"),
+        Text("preparer_signature", "form1[0].#subform[11].P12_SignatureApplicant[2]"),
+        Text("preparer_signature_date", "form1[0].#subform[11].P15_DateofSignature[0]", format_date),
+    ]),
+
+    # ═══════════════════════════════════════════════════════════════
+    # PART 16: ADDITIONAL INFORMATION (Pages 13-14)
+    # ═══════════════════════════════════════════════════════════════
+    # Rows are form lines 3-6; columns A-D are page, part, item and explanation
+    Repeat("additional_information", 4, items=[
+        Item("page_number", rows("form1[0].#subform[12].P11_Line{idx}A[0]", 4, start=3)),
+        Item("part_number", rows("form1[0].#subform[12].P11_Line{idx}B[0]", 4, start=3)),
+        Item("item_number", rows("form1[0].#subform[12].P11_Line{idx}C[0]", 4, start=3)),
+        Item("explanation", rows("form1[0].#subform[12].P11_Line{idx}D[0]", 4, start=3)),
+    ]),
+]
+
+COMPILED_MAPPING = compile_spec(MAPPING_SPEC)
+
+
+def export_values(spec: Sequence = None) -> Iterator[Tuple[str, str]]:
+    """
+    Every (field, value) the spec writes as a constant: checkbox export values
+    such as /Y, /N, /M, /F, plus fixed texts. app.py checks them against the
+    template's on-states whenever it loads (ParsedTemplate.check_button_values).
+    """
+    return _exports(MAPPING_SPEC if spec is None else spec)
+
+
+def intake_reads(spec: Sequence = None) -> Iterator[Tuple[str, object]]:
+    """
+    Every (intake key, value kind) the spec reads, in spec order; a key read in
+    several places appears once per place. intake_schema.py compiles these.
+    """
+    return _reads(MAPPING_SPEC if spec is None else spec)
+
+
+# Intake keys read as arrays (every Repeat, including those inside When and
+# Choice branches), which the intake app sends as JSON strings (decoded once by intake.py)
+ARRAY_KEYS = frozenset(key for key, kind in intake_reads() if isinstance(kind, tuple))
+
+
+def map_form_data_to_pdf_fields(data: dict) -> dict:
+    """Map intake form data to PDF field names with correct checkbox states (see MAPPING_SPEC)."""
+    fields = {}
+    for op in COMPILED_MAPPING:
+        op(data, fields)
+    return fields
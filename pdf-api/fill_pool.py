@@ -0,0 +1,127 @@
+"""
+Process-pool fill engine.
+
+pypdf is pure Python, so request threads in one process share a single core.
+FillPool hands fill_pdf calls to a ProcessPoolExecutor whose workers parse the
+template when they start, and refuses new work once ``max_pending`` calls are
+queued or running so callers can shed load (503) instead of piling up.
+
+Enabled by PDF_FILL_WORKERS (a count, or "auto" for one per core); off when unset.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import FrozenSet, Optional
+
+
+class PoolBusy(Exception):
+    """Raised when the fill pool already has ``max_pending`` calls queued or running."""
+
+
+def _warm_worker(template_path: str) -> None:
+    from template_cache import get_template
+
+    get_template(template_path)
+
+
+def _fill_in_worker(template_path: str, field_data: dict, incremental: bool, flatten: bool,
+                    size_modes: FrozenSet[str]) -> bytes:
+    from app import fill_pdf
+
+    return fill_pdf(template_path, field_data, incremental=incremental, flatten=flatten, size_modes=size_modes)
+
+
+class FillPool:
+    """A pre-warmed ProcessPoolExecutor for fill_pdf with a bounded queue."""
+
+    def __init__(self, template_path: str, workers: int, max_pending: Optional[int] = None):
+        self.template_path = template_path
+        self.workers = workers
+        self.max_pending = max_pending if max_pending is not None else workers * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.pending = 0
+        self.rejected = 0
+        self._count_lock = threading.Lock()
+        # Imported here: multiprocessing is only needed when the pool is enabled
+        from concurrent.futures import ProcessPoolExecutor
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_warm_worker,
+            initargs=(template_path,),
+        )
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the ``max_pending`` slots for the block; raises PoolBusy when full.
+
+        fill() takes one per call. A fill run outside the pool (a profiled
+        request, which must run in the request thread) takes one too, so it
+        counts against the same limit.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._count_lock:
+                self.rejected += 1
+            raise PoolBusy(f"{self.max_pending} fills already pending")
+        with self._count_lock:
+            self.pending += 1
+        try:
+            yield
+        finally:
+            with self._count_lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def fill(self, field_data: dict, incremental: bool = False, flatten: bool = False,
+             size_modes: FrozenSet[str] = frozenset()) -> bytes:
+        """Fill in a worker process and wait for the bytes; raises PoolBusy when full."""
+        with self.slot():
+            future = self._executor.submit(
+                _fill_in_worker, self.template_path, field_data, incremental, flatten, size_modes
+            )
+            return future.result()
+
+    def start(self) -> None:
+        """Fork the pool processes now instead of on the first fill."""
+        self._executor.submit(os.getpid).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def workers_from_env() -> int:
+    value = os.environ.get("PDF_FILL_WORKERS", "").strip().lower()
+    if not value or value == "0":
+        return 0
+    if value == "auto":
+        return os.cpu_count() or 1
+    return int(value)
+
+
+_pool: Optional[FillPool] = None
+_pool_lock = threading.Lock()
+
+
+def current_fill_pool() -> Optional[FillPool]:
+    """This process's FillPool if one has been created, without creating it."""
+    return _pool
+
+
+def get_fill_pool(template_path: str) -> Optional[FillPool]:
+    """Return this process's FillPool, created on first use, or None when disabled."""
+    global _pool
+    if _pool is None:
+        workers = workers_from_env()
+        if workers <= 0:
+            return None
+        with _pool_lock:
+            if _pool is None:
+                max_pending = os.environ.get("PDF_FILL_QUEUE")
+                _pool = FillPool(
+                    template_path,
+                    workers,
+                    int(max_pending) if max_pending else None,
+                )
+    return _pool
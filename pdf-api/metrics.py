@@ -0,0 +1,220 @@
+"""
+Prometheus-text metrics for the PDF API.
+
+A small in-process registry (counters, gauges, histograms) rendered by
+GET /metrics in the Prometheus text exposition format. Stage timings come from
+each request's RequestTimer (see request_log.py), so /metrics and the request
+log always agree.
+
+Metrics are per process: with several gunicorn workers each scrape sees the
+worker that answered it, which carries a ``pid`` label on pdf_api_process_info.
+"""
+
+import functools
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import current_app
+
+from request_log import RequestTimer
+
+# Seconds; fills run ~10 ms (cached, warm) to ~1 s (cold template parse)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """A settable gauge, or a callback gauge when ``collect`` returns {label_values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self) -> Iterable[str]:
+        if self._collect is not None:
+            values = sorted(self._collect().items())
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # label values -> [per-bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((labels, list(state)) for labels, state in self._values.items())
+        for label_values, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "pdf_api_requests_total", "Requests handled, by endpoint and HTTP status.", ("endpoint", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "pdf_api_request_seconds", "Wall time of each request, by endpoint.", ("endpoint",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pdf_api_stage_seconds",
+    "Time spent in each request stage (parse, map, cache, template, fill, flatten, serialize).",
+    ("endpoint", "stage")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "pdf_api_in_flight_requests", "Requests currently being handled by this process.", ("endpoint",)))
+
+
+def _process_info() -> Dict[LabelValues, float]:
+    return {(str(os.getpid()),): 1}
+
+
+REGISTRY.register(Gauge(
+    "pdf_api_process_info", "The process that answered this scrape.", ("pid",), collect=_process_info))
+
+
+def register_collector(name: str, documentation: str, labels: Sequence[str],
+                       collect: Callable[[], Dict[LabelValues, float]], kind: str = "gauge") -> None:
+    """Expose values computed at scrape time (cache state, pool size, ...)."""
+    metric = Gauge(name, documentation, labels, collect=collect)
+    metric.kind = kind
+    REGISTRY.register(metric)
+
+
+def observe_request(endpoint: str, timer: RequestTimer, status: int) -> None:
+    REQUESTS.inc(endpoint, str(status))
+    REQUEST_SECONDS.observe(timer.elapsed(), endpoint)
+    for stage, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint, stage)
+
+
+def instrumented(endpoint: str):
+    """
+    Wrap a view that takes a RequestTimer as its first argument.
+
+    Tracks the in-flight gauge while it runs and, once it returns, records the
+    status and the timer's stages.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            timer = RequestTimer()
+            IN_FLIGHT.inc(endpoint)
+            try:
+                response = current_app.make_response(view(timer, *args, **kwargs))
+            finally:
+                IN_FLIGHT.dec(endpoint)
+            observe_request(endpoint, timer, response.status_code)
+            return response
+        return wrapper
+    return decorator
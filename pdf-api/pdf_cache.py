@@ -0,0 +1,187 @@
+"""
+Generated-PDF cache.
+
+The Next.js route re-posts the same intake payload every time an applicant
+downloads their PDF, so /generate keys finished PDFs by a hash of the mapped
+field dict (plus the output modes and the template's mtime) and serves repeats
+from a size-bounded LRU in memory, optionally backed by a size-bounded
+directory shared by all workers on the host. Intake changes that don't change
+any PDF field hash to the same key.
+
+The memory tier keeps a PDF as the chunks it was written in (PdfChunks):
+views of the cached template bytes plus the re-serialized objects. Storing
+and serving an entry never joins the document; a hit streams the same chunks.
+The disk tier writes them out one after another.
+
+PDF_CACHE_MB sizes the memory tier (default 32, 0 disables the cache) by
+document length, shared template views included;
+PDF_CACHE_DIR turns on the disk tier, bounded by PDF_CACHE_DISK_MB (default 512).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from request_log import logger
+from template_cache import PdfChunks
+
+
+def cache_key(field_data: dict, template_path: str, incremental: bool = False, flatten: bool = False,
+              size_modes: FrozenSet[str] = frozenset()) -> str:
+    """Canonical hash of a fill: mapped fields (order-independent), output modes and template version."""
+    canonical = json.dumps(field_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    digest = hashlib.sha256()
+    modes = ",".join(sorted(size_modes))
+    digest.update(f"{os.stat(template_path).st_mtime_ns}:{int(incremental)}:{int(flatten)}:{modes}:".encode())
+    digest.update(canonical.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """Two-tier LRU of finished PDFs: an in-process dict, then an optional directory."""
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        # key -> (chunks, length)
+        self._entries: "OrderedDict[str, Tuple[tuple, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[PdfChunks]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return PdfChunks.from_chunks(entry[0])
+
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        chunks = (memoryview(data),)
+        self._memory_put(key, chunks, len(data))
+        return PdfChunks.from_chunks(chunks)
+
+    def put(self, key: str, pdf: PdfChunks) -> None:
+        chunks = tuple(pdf.chunks())
+        self._memory_put(key, chunks, len(pdf))
+        self._disk_put(key, chunks, len(pdf))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _memory_put(self, key: str, chunks: tuple, length: int) -> None:
+        if length > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (chunks, length)
+            self._size += length
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime is the LRU clock for disk eviction
+        except OSError:
+            return None
+        return data
+
+    def _disk_put(self, key: str, chunks: tuple, length: int) -> None:
+        if not self.disk_dir or length > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("could not write PDF cache file", extra={"error": str(e)})
+            return
+        self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        # Rescan rather than track sizes: other workers write to the same directory
+        files = []
+        total = 0
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.disk_max_bytes:
+            return
+        files.sort()
+        for _, size, path in files:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            if total <= self.disk_max_bytes:
+                break
+
+
+_cache: Optional[PdfCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> Optional[PdfCache]:
+    """Return this process's PdfCache, created on first use, or None when PDF_CACHE_MB=0."""
+    global _cache
+    if _cache is None:
+        max_mb = float(os.environ.get("PDF_CACHE_MB", "32"))
+        if max_mb <= 0:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = PdfCache(
+                    int(max_mb * 1024 * 1024),
+                    os.environ.get("PDF_CACHE_DIR") or None,
+                    int(float(os.environ.get("PDF_CACHE_DISK_MB", "512")) * 1024 * 1024),
+                )
+    return _cache
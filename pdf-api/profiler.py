@@ -0,0 +1,170 @@
+"""
+Opt-in profiling of /generate fills.
+
+Nothing is profiled unless PDF_PROFILE_DIR is set. Then a request is profiled
+when it carries ``X-PDF-Profile: 1`` and is authorized, or falls in the
+PDF_PROFILE_SAMPLE percentage of requests (default 0). A request is
+authorized when it sends PDF_PROFILE_TOKEN in ``X-PDF-Profile-Token``, or,
+with no token set, when it comes from localhost; the same applies to reading
+profiles back from /debug/profiles. A profiled fill runs under a stack sampler
+that snapshots the request thread every PDF_PROFILE_INTERVAL_MS (default 1)
+and writes collapsed stacks (``frame;frame;frame count`` lines, the input of
+flamegraph.pl / speedscope) to ``<dir>/<time>-<pid>-<id>.folded``.
+PDF_PROFILE_MODE=cprofile records a cProfile ``.prof`` instead (open it with
+pstats or snakeviz). The directory keeps the newest PDF_PROFILE_MAX files
+(default 50).
+
+With profiling off, ``maybe_profile`` is one dict lookup and returns a shared
+nullcontext.
+"""
+
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+from request_log import logger
+
+PROFILE_HEADER = "X-PDF-Profile"
+TOKEN_HEADER = "X-PDF-Profile-Token"
+PROFILE_SUFFIXES = (".folded", ".prof")
+
+_DISABLED = nullcontext()
+_counter = 0
+_counter_lock = threading.Lock()
+
+
+def profile_dir() -> Optional[str]:
+    return os.environ.get("PDF_PROFILE_DIR") or None
+
+
+def authorized(headers, remote_addr: Optional[str]) -> bool:
+    """True when the request may force a profile or read profiles (PDF_PROFILE_TOKEN, else localhost)."""
+    token = os.environ.get("PDF_PROFILE_TOKEN")
+    if token:
+        return hmac.compare_digest(headers.get(TOKEN_HEADER, "").encode(), token.encode())
+    return remote_addr in ("127.0.0.1", "::1")
+
+
+def requested(headers, remote_addr: Optional[str]) -> bool:
+    """True when this request should be profiled: forced by an authorized header, or sampled."""
+    if profile_dir() is None:
+        return False
+    if headers.get(PROFILE_HEADER) == "1" and authorized(headers, remote_addr):
+        return True
+    sample = float(os.environ.get("PDF_PROFILE_SAMPLE", "0"))
+    return sample > 0 and random.random() * 100 < sample
+
+
+def maybe_profile(enabled: bool, label: str):
+    """Context manager profiling the block when ``enabled``; yields the profile name or None."""
+    if not enabled:
+        return _DISABLED
+    return _profile(label)
+
+
+def _next_name(label: str, suffix: str) -> str:
+    global _counter
+    with _counter_lock:
+        _counter += 1
+        count = _counter
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{count}-{label}{suffix}"
+
+
+@contextmanager
+def _profile(label: str):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    if os.environ.get("PDF_PROFILE_MODE", "sample").lower() == "cprofile":
+        import cProfile
+
+        name = _next_name(label, ".prof")
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield name
+        finally:
+            profile.disable()
+            profile.dump_stats(os.path.join(directory, name))
+    else:
+        name = _next_name(label, ".folded")
+        interval = float(os.environ.get("PDF_PROFILE_INTERVAL_MS", "1")) / 1000
+        sampler = StackSampler(threading.get_ident(), interval)
+        sampler.start()
+        try:
+            yield name
+        finally:
+            sampler.stop()
+            _write_atomic(os.path.join(directory, name), sampler.collapsed())
+    logger.info("profile written", extra={"profile": name})
+    _prune(directory, int(os.environ.get("PDF_PROFILE_MAX", "50")))
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack on an interval and counts identical stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True, name="pdf-profile-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def list_profiles() -> List[Dict[str, object]]:
+    """Profiles in PDF_PROFILE_DIR, newest first."""
+    directory = profile_dir()
+    if directory is None or not os.path.isdir(directory):
+        return []
+    profiles = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(PROFILE_SUFFIXES):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            profiles.append({"name": entry.name, "bytes": stat.st_size, "mtime": stat.st_mtime})
+    profiles.sort(key=lambda profile: profile["mtime"], reverse=True)
+    return profiles
+
+
+def _prune(directory: str, keep: int) -> None:
+    profiles = list_profiles()
+    for profile in profiles[keep:]:
+        try:
+            os.remove(os.path.join(directory, profile["name"]))
+        except OSError:
+            continue
@@ -0,0 +1,1045 @@
+"""
+Parsed N-400 template cache.
+
+Parsing, decrypting and appending templates/n-400.pdf into a PdfWriter costs
+far more than filling the fields, so each worker does it once and hands every
+request a copy-on-write working copy of the result. The template is reloaded
+when the file's mtime changes.
+
+With PDF_TEMPLATE_SNAPSHOT_DIR set, the parsed template is also pickled to
+``<dir>/<template>.snapshot`` and later loads read it back instead of parsing
+the PDF again (~160 ms against ~1.4 s: the whole writer is unpickled, not
+just the widget index). A snapshot is only used when it was written for the same
+template bytes, pypdf version and Python version; otherwise it is rebuilt.
+Snapshots are unpickled, so the directory must be one only this service writes.
+"""
+
+import gc
+import hashlib
+import io
+import json
+import os
+import pickle
+import platform
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+import pypdf
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    BooleanObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+from appearances import AppearanceGenerator, cache_size_from_env, inherited
+from request_log import logger
+
+
+class WidgetEntry(NamedTuple):
+    """One widget annotation of the template, as filling needs to see it."""
+    page_index: int
+    idnum: int
+    field_type: Optional[str]
+    on_states: Tuple[str, ...]
+
+
+class TemplateBytes(NamedTuple):
+    """The template serialized once, decrypted, with where each object starts."""
+    data: bytes
+    xref_offset: int
+    # object_offsets[i] is where object i + 1 starts; the last entry is xref_offset
+    object_offsets: List[int]
+
+
+class PageWidgets(NamedTuple):
+    """What flattening needs to know about one page: its widgets and the annotations to keep."""
+    page_idnum: int
+    widgets: Tuple[int, ...]
+    other_annots: Tuple[IndirectObject, ...]
+
+
+class FieldCatalog(NamedTuple):
+    """Every field of a template as JSON-ready dicts, plus the serialized full list and its ETag."""
+    fields: Tuple[dict, ...]
+    # Lowercased (name, tooltip) per field, for search
+    search_keys: Tuple[Tuple[str, str], ...]
+    body: bytes
+    etag: str
+
+    def search(self, text: str = "", field_type: Optional[str] = None) -> List[dict]:
+        """Fields whose name or tooltip contains ``text`` (case-insensitive), optionally of one type."""
+        text = text.lower()
+        return [
+            field for field, (name, tooltip) in zip(self.fields, self.search_keys)
+            if (text in name or text in tooltip) and (field_type is None or field["type"] == field_type)
+        ]
+
+
+def catalog_body(fields) -> bytes:
+    return json.dumps({"total_fields": len(fields), "fields": list(fields)}, separators=(",", ":")).encode()
+
+
+# Annotation flags (/F) that keep a widget from being drawn
+_HIDDEN_FLAGS = 2 | 32  # Hidden, NoView
+
+# Bump when ParsedTemplate's attributes change, so older snapshots are rebuilt
+SNAPSHOT_FORMAT = 3
+_SNAPSHOT_MAGIC = b"n400-template-snapshot"
+
+
+def _placement(name: str, annot: DictionaryObject, appearance: DictionaryObject) -> bytes:
+    """
+    Content-stream operators that draw ``appearance`` into ``annot``'s /Rect.
+
+    Maps the appearance's /BBox (after its /Matrix) onto the rectangle, as a
+    viewer does when it renders the widget (PDF 32000-1, 12.5.5).
+    """
+    rect = [float(v) for v in annot["/Rect"]]
+    x0, x1 = sorted((rect[0], rect[2]))
+    y0, y1 = sorted((rect[1], rect[3]))
+    bbox = [float(v) for v in appearance.get("/BBox", (0, 0, x1 - x0, y1 - y0))]
+    a, b, c, d, e, f = (float(v) for v in appearance.get("/Matrix", (1, 0, 0, 1, 0, 0)))
+    corners = [(bbox[0], bbox[1]), (bbox[2], bbox[1]), (bbox[0], bbox[3]), (bbox[2], bbox[3])]
+    xs = [a * x + c * y + e for x, y in corners]
+    ys = [b * x + d * y + f for x, y in corners]
+    sx = (x1 - x0) / (max(xs) - min(xs)) if max(xs) > min(xs) else 1.0
+    sy = (y1 - y0) / (max(ys) - min(ys)) if max(ys) > min(ys) else 1.0
+    tx = x0 - min(xs) * sx
+    ty = y0 - min(ys) * sy
+    return f"q {sx:g} 0 0 {sy:g} {tx:g} {ty:g} cm {name} Do Q\n".encode()
+
+
+class ParsedTemplate:
+    """A decrypted, fully resolved template held in memory for the life of a worker."""
+
+    def __init__(self, path: str, data: Optional[bytes] = None):
+        self.path = path
+        # Stat before reading so a write during the load triggers another reload
+        self.mtime_ns = os.stat(path).st_mtime_ns
+
+        start = time.perf_counter()
+        reader = PdfReader(io.BytesIO(data) if data is not None else path)
+        if reader.is_encrypted:
+            reader.decrypt('')
+
+        writer = PdfWriter()
+        writer.append(reader)
+
+        # Filled text fields get real appearance streams (see appearances.py), so
+        # viewers need not regenerate them; PDF_NEED_APPEARANCES=1 asks them to anyway
+        try:
+            if "/AcroForm" in writer._root_object:
+                acro_form = writer._root_object["/AcroForm"]
+                if os.environ.get("PDF_NEED_APPEARANCES", "0") == "1":
+                    acro_form[NameObject("/NeedAppearances")] = BooleanObject(True)
+                else:
+                    acro_form.pop("/NeedAppearances", None)
+        except Exception as e:
+            logger.warning("could not set NeedAppearances", extra={"error": str(e)})
+
+        # Pull every object into the writer now; working copies rely on the
+        # graph being closed so they can skip PdfWriter's sweep on write.
+        writer._sweep_indirect_references(writer._root)
+
+        self.writer = writer
+        self.field_count = len(reader.get_fields() or {})
+        self.default_da = writer._root_object["/AcroForm"].get(
+            "/DA", TextStringObject("/Helvetica 0 Tf 0 g")
+        )
+        self.appearances = AppearanceGenerator(writer._root_object, self.default_da, cache_size_from_env())
+        self.page_count = len(writer.pages)
+        self.widget_index, self.title_index = self._build_widget_index(writer)
+        self.button_states = self._build_button_states(self.widget_index)
+        self.base = self._serialize(writer)
+        self._page_widgets: Optional[List[PageWidgets]] = None
+        self._field_catalog: Optional[FieldCatalog] = None
+        # Size-mode set -> precomputed template part of compact output (see compact.py)
+        self.compact_bases: Dict[FrozenSet[str], object] = {}
+        # (widget idnum, appearance idnum) -> placement operators, for template appearances
+        self.placements: Dict[Tuple[int, int], bytes] = {}
+        # object number -> every template object it reaches, for single-page output
+        self._closures: Dict[int, FrozenSet[int]] = {}
+        # object number -> serialized scalar entries, reused when a copied dict is written
+        self._entry_bytes: Dict[int, Dict[str, bytes]] = {}
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - start
+        logger.info("template loaded", extra={
+            "path": path,
+            "encrypted": reader.is_encrypted,
+            "fields": self.field_count,
+            "widgets": sum(len(entries) for entries in self.widget_index.values()),
+            "load_ms": round(self.load_seconds * 1000, 2),
+        })
+
+    def __getstate__(self) -> dict:
+        # The appearance generator holds a lock and per-process caches; placements
+        # refer to rendered objects. Both are rebuilt after a snapshot load.
+        state = dict(self.__dict__)
+        del state["appearances"]
+        state["placements"] = {}
+        state["_page_widgets"] = None
+        state["_closures"] = {}
+        state["_entry_bytes"] = {}
+        state["_field_catalog"] = None
+        state["compact_bases"] = {}
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.appearances = AppearanceGenerator(self.writer._root_object, self.default_da, cache_size_from_env())
+
+    @staticmethod
+    def _build_widget_index(
+        writer: PdfWriter,
+    ) -> Tuple[Dict[str, Tuple[WidgetEntry, ...]], Dict[str, Tuple[WidgetEntry, ...]]]:
+        """
+        Index every widget by its fully qualified name (and by bare /T).
+
+        Keys are the names map_form_data_to_pdf_fields produces, e.g.
+        form1[0].#subform[5].P9_Line3[0], so filling is one dict lookup per
+        mapped field instead of a scan over every annotation on every page.
+        """
+        by_name: Dict[str, List[WidgetEntry]] = {}
+        by_title: Dict[str, List[WidgetEntry]] = {}
+        for page_index, page in enumerate(writer.pages):
+            for annot_ref in page.get("/Annots", []):
+                annot = annot_ref.get_object()
+                if annot.get("/Subtype") != "/Widget":
+                    continue
+                field_type = annot.get("/FT")
+                on_states: Tuple[str, ...] = ()
+                if field_type == "/Btn":
+                    normal = annot.get("/AP", DictionaryObject()).get("/N", DictionaryObject())
+                    on_states = tuple(str(k) for k in normal.get_object().keys() if k != "/Off")
+                entry = WidgetEntry(page_index, annot_ref.idnum, field_type, on_states)
+                qualified = writer._get_qualified_field_name(annot)
+                if qualified is not None:
+                    by_name.setdefault(qualified, []).append(entry)
+                if "/T" in annot:
+                    by_title.setdefault(annot["/T"], []).append(entry)
+        return (
+            {name: tuple(entries) for name, entries in by_name.items()},
+            {title: tuple(entries) for title, entries in by_title.items()},
+        )
+
+    @staticmethod
+    def _build_button_states(
+        widget_index: Dict[str, Tuple[WidgetEntry, ...]],
+    ) -> Dict[str, FrozenSet[str]]:
+        """Button field name -> its widgets' on-states, read from each /AP /N."""
+        return {
+            name: frozenset(state for entry in entries for state in entry.on_states)
+            for name, entries in widget_index.items()
+            if entries[0].field_type == "/Btn"
+        }
+
+    def check_button_values(self, values: Iterable[Tuple[str, str]]) -> List[Tuple[str, str, Tuple[str, ...]]]:
+        """
+        The (field, value, on_states) of every button value the template cannot show.
+
+        ``values`` are (field name, export value) pairs such as the mapping's
+        constants; pairs naming non-button fields are ignored.
+        """
+        problems = []
+        for name, value in values:
+            states = self.button_states.get(name)
+            if states is not None and value != "/Off" and value not in states:
+                problems.append((name, value, tuple(sorted(states))))
+        return problems
+
+    @staticmethod
+    def _serialize(writer: PdfWriter) -> TemplateBytes:
+        """
+        Write the unfilled template once.
+
+        Object numbers match ``writer`` exactly, so working copies can copy
+        untouched objects straight out of these bytes, or append their changed
+        objects to them as a PDF incremental update. Serializing here also
+        keeps requests from writing shared stream objects, which pypdf mutates
+        while writing them.
+        """
+        stream = io.BytesIO()
+        object_positions = writer._write_pdf_structure(stream)
+        xref_offset = writer._write_xref_table(stream, object_positions)
+        writer._write_trailer(stream, xref_offset)
+        return TemplateBytes(stream.getvalue(), xref_offset, object_positions + [xref_offset])
+
+    def page_widgets(self) -> List[PageWidgets]:
+        """Widgets per page, built on the first flatten and reused after that."""
+        if self._page_widgets is None:
+            pages = []
+            for page in self.writer.pages:
+                widgets, others = [], []
+                for annot_ref in page.get("/Annots", []):
+                    if annot_ref.get_object().get("/Subtype") == "/Widget":
+                        widgets.append(annot_ref.idnum)
+                    else:
+                        others.append(annot_ref)
+                pages.append(PageWidgets(page.indirect_reference.idnum, tuple(widgets), tuple(others)))
+            self._page_widgets = pages
+        return self._page_widgets
+
+    def field_catalog(self) -> FieldCatalog:
+        """
+        Every filled-by-name field: type, tooltip (/TU), MaxLen, on-states and its widgets' pages and rects.
+
+        Built on first use from the widget index and kept for the life of
+        the template, together with its JSON and a strong ETag of that JSON.
+        """
+        if self._field_catalog is None:
+            objects = self.writer._objects
+            fields = []
+            for name, entries in sorted(self.widget_index.items()):
+                annot = objects[entries[0].idnum - 1]
+                field_type = inherited(annot, "/FT")
+                tooltip = inherited(annot, "/TU")
+                max_len = inherited(annot, "/MaxLen")
+                fields.append({
+                    "name": name,
+                    "type": str(field_type)[1:] if field_type is not None else None,
+                    "tooltip": str(tooltip) if tooltip is not None else None,
+                    "max_len": int(max_len) if max_len is not None else None,
+                    "on_states": sorted(self.button_states[name]) if name in self.button_states else None,
+                    "widgets": [
+                        {
+                            "page": entry.page_index + 1,
+                            "rect": [round(float(v), 2) for v in objects[entry.idnum - 1]["/Rect"]],
+                        }
+                        for entry in entries
+                    ],
+                })
+            body = catalog_body(fields)
+            self._field_catalog = FieldCatalog(
+                fields=tuple(fields),
+                search_keys=tuple((field["name"].lower(), (field["tooltip"] or "").lower()) for field in fields),
+                body=body,
+                etag=hashlib.sha256(body).hexdigest()[:32],
+            )
+        return self._field_catalog
+
+    def closure(self, idnum: int) -> FrozenSet[int]:
+        """Object ``idnum`` and every template object it references, directly or not (cached)."""
+        closure = self._closures.get(idnum)
+        if closure is None:
+            objects = self.writer._objects
+            seen = set()
+            stack = [idnum]
+            while stack:
+                current = stack.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                stack.extend(references(objects[current - 1]))
+            closure = self._closures[idnum] = frozenset(seen)
+        return closure
+
+    def entry_bytes(self, idnum: int) -> Dict[str, bytes]:
+        """
+        Serialized ``key value`` lines of template dictionary ``idnum`` (cached).
+
+        Only scalar values are kept: a request may change a nested direct
+        dictionary or array in place, but replaces a string, name, number or
+        reference outright, so the cached line stays valid while the copied
+        dictionary still holds the template's value object.
+        """
+        entries = self._entry_bytes.get(idnum)
+        if entries is None:
+            entries = {}
+            for key, value in dict.items(self.writer._objects[idnum - 1]):
+                if isinstance(value, (DictionaryObject, ArrayObject)):
+                    continue
+                buffer = io.BytesIO()
+                _write_entry(buffer, key, value)
+                entries[key] = buffer.getvalue()
+            self._entry_bytes[idnum] = entries
+        return entries
+
+    def working_copy(self) -> "WorkingCopy":
+        return WorkingCopy(self)
+
+
+class PdfChunks:
+    """
+    Write-only file that keeps a document as an ordered list of chunks.
+
+    Large memoryview writes (slices of the cached template) are kept as
+    views; everything else is gathered into bytearrays between them. tell()
+    is the total written so far, which is all PdfWriter needs for offsets.
+    """
+
+    # Smaller views are copied into the current buffer instead
+    MIN_VIEW = 4096
+
+    def __init__(self):
+        self._chunks = []
+        self._buffer = bytearray()
+        self._length = 0
+
+    @classmethod
+    def from_chunks(cls, chunks) -> "PdfChunks":
+        """A document made of existing chunks, shared rather than copied (see pdf_cache.py)."""
+        pdf = cls()
+        pdf._chunks = list(chunks)
+        pdf._length = sum(len(chunk) for chunk in pdf._chunks)
+        return pdf
+
+    def write(self, data) -> int:
+        size = len(data)
+        if isinstance(data, memoryview) and size >= self.MIN_VIEW:
+            if self._buffer:
+                self._chunks.append(self._buffer)
+                self._buffer = bytearray()
+            self._chunks.append(data)
+        else:
+            self._buffer += data
+        self._length += size
+        return size
+
+    def tell(self) -> int:
+        return self._length
+
+    def flush(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return self._length
+
+    def chunks(self) -> list:
+        if self._buffer:
+            self._chunks.append(self._buffer)
+            self._buffer = bytearray()
+        return self._chunks
+
+    def iter_bytes(self, chunk_size: int = 64 * 1024):
+        """Yield the document as bytes objects of at most ``chunk_size``, copying one at a time."""
+        for chunk in self.chunks():
+            view = memoryview(chunk)
+            for start in range(0, len(view), chunk_size):
+                yield bytes(view[start:start + chunk_size])
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.chunks())
+
+
+class WorkingCopy(PdfWriter):
+    """
+    Per-request view of a ParsedTemplate.
+
+    Starts out sharing every object with the template; ``writable`` swaps in a
+    shallow copy of an object before it is changed, so the cached template is
+    never modified and a request only pays for the objects it touches.
+    """
+
+    def __init__(self, template: ParsedTemplate):
+        super().__init__()
+        master = template.writer
+        self.template = template
+        self._master = master
+        self._objects = list(master._objects)
+        self._root = master._root
+        self._root_object = master._root_object
+        self._info = master._info
+        self._pages = master._pages
+        self._ID = master._ID
+        self.pdf_header = master.pdf_header
+        self._copied = set()
+
+    def get_object(self, indirect_reference):
+        if isinstance(indirect_reference, IndirectObject) and indirect_reference.pdf is self._master:
+            indirect_reference = indirect_reference.idnum
+        return super().get_object(indirect_reference)
+
+    def writable(self, idnum: int) -> DictionaryObject:
+        """Return object ``idnum`` as a dictionary this request may modify."""
+        if idnum not in self._copied:
+            obj = DictionaryObject(self._objects[idnum - 1])
+            obj.indirect_reference = IndirectObject(idnum, 0, self)
+            self._objects[idnum - 1] = obj
+            self._copied.add(idnum)
+        return self._objects[idnum - 1]
+
+    def update_widgets(self, fields: Dict[str, object], page_index: Optional[int] = None) -> int:
+        """
+        Copy field values onto the widgets they name and return how many were set.
+
+        Same per-widget behaviour as PdfWriter.update_page_form_field_values
+        with auto_regenerate=True, but only the widgets named in ``fields`` are
+        visited, and text appearances come from the template's
+        AppearanceGenerator. Names that match no widget are skipped, as are
+        widgets on other pages than ``page_index`` when it is given.
+        """
+        widget_index = self.template.widget_index
+        title_index = self.template.title_index
+        filled = 0
+        for name, value in fields.items():
+            entries = widget_index.get(name) or title_index.get(name)
+            if not entries:
+                continue
+            for entry in entries:
+                if page_index is not None and entry.page_index != page_index:
+                    continue
+                self._set_widget_value(entry, value)
+                filled += 1
+        return filled
+
+    def _set_widget_value(self, entry: WidgetEntry, value) -> None:
+        annot = self.writable(entry.idnum)
+        if entry.field_type == "/Btn":
+            # /V and /AS both take the on-state as a PDF name, not a string
+            state = NameObject(value)
+            annot[NameObject("/V")] = state
+            annot[NameObject("/AS")] = state
+            return
+        if isinstance(value, list):
+            annot[NameObject("/V")] = ArrayObject(TextStringObject(v) for v in value)
+        else:
+            annot[NameObject("/V")] = TextStringObject(value)
+        if entry.field_type == "/Tx" or entry.field_type == "/Ch":
+            appearances = self.template.appearances
+            layout = appearances.layout(entry.idnum, annot)
+            if layout is not None and not isinstance(value, list):
+                self._set_appearance(annot, appearances.appearance(layout, str(value)))
+                return
+            # List boxes and multi-select values: pypdf's generator
+            if "/DA" not in annot:
+                f = annot
+                da = self.template.default_da
+                while "/DA" not in f:
+                    f = f.get("/Parent")
+                    if f is None:
+                        break
+                    f = f.get_object()
+                    if "/DA" in f:
+                        da = f["/DA"]
+                annot[NameObject("/DA")] = da
+            self._update_text_field(annot)
+
+    def flatten(self, page_index: Optional[int] = None) -> int:
+        """
+        Draw every widget's current appearance into its page and drop the form.
+
+        Each page's content is wrapped in q/Q and followed by one ``Do`` per
+        visible widget; the widgets leave /Annots and /AcroForm is removed, so
+        viewers have nothing left to regenerate. Appearance streams are
+        referenced, not copied: checkbox states and unfilled fields reuse the
+        template's objects, and their placement operators are cached on the
+        template. With ``page_index`` only that page is flattened. Returns the
+        number of widgets drawn.
+        """
+        template = self.template
+        master_objects = self._master._objects
+        placements = template.placements
+        drawn = 0
+        for index, page_plan in enumerate(template.page_widgets()):
+            if not page_plan.widgets or (page_index is not None and index != page_index):
+                continue
+            ops = [b"Q\n"]
+            xobjects = DictionaryObject()
+            for idnum in page_plan.widgets:
+                annot = self._objects[idnum - 1]
+                if annot.get("/F", 0) & _HIDDEN_FLAGS or "/AP" not in annot:
+                    continue
+                normal = annot["/AP"].get("/N")
+                if normal is None:
+                    continue
+                if not isinstance(normal.get_object(), StreamObject):
+                    # Checkbox/radio: one appearance per state, chosen by /AS
+                    normal = normal.get_object().get(annot.get("/AS", "/Off"))
+                if not isinstance(normal, IndirectObject):
+                    continue
+                appearance_idnum = normal.idnum
+                appearance = self._objects[appearance_idnum - 1]
+                name = f"/FlW{idnum}"
+                if appearance_idnum <= len(master_objects) and appearance is master_objects[appearance_idnum - 1]:
+                    key = (idnum, appearance_idnum)
+                    placement = placements.get(key)
+                    if placement is None:
+                        placement = placements[key] = _placement(name, annot, appearance)
+                else:
+                    placement = _placement(name, annot, appearance)
+                ops.append(placement)
+                xobjects[NameObject(name)] = IndirectObject(appearance_idnum, 0, self)
+                drawn += 1
+
+            page = self.writable(page_plan.page_idnum)
+            if xobjects:
+                contents = page.get("/Contents")
+                if contents is None:
+                    contents = ArrayObject()
+                elif isinstance(contents.get_object(), ArrayObject):
+                    contents = contents.get_object()
+                else:
+                    contents = ArrayObject([contents])
+                page[NameObject("/Contents")] = ArrayObject(
+                    [self._add_object(_stream(b"q\n"))] + list(contents)
+                    + [self._add_object(_stream(b"".join(ops)))]
+                )
+                resources = DictionaryObject(page.get("/Resources", DictionaryObject()).get_object())
+                page_xobjects = resources.get("/XObject")
+                page_xobjects = DictionaryObject(page_xobjects.get_object()) if page_xobjects else DictionaryObject()
+                page_xobjects.update(xobjects)
+                resources[NameObject("/XObject")] = page_xobjects
+                page[NameObject("/Resources")] = resources
+            if page_plan.other_annots:
+                page[NameObject("/Annots")] = ArrayObject(page_plan.other_annots)
+            else:
+                page.pop("/Annots", None)
+
+        root = self.writable(self._root.idnum)
+        root.pop("/AcroForm", None)
+        self._root_object = root
+        return drawn
+
+    def _set_appearance(self, annot: DictionaryObject, appearance: DictionaryObject) -> None:
+        """Point the widget's /AP /N at ``appearance``, reusing its template object number."""
+        ap = annot.get("/AP")
+        ap = ap.get_object() if ap is not None else None
+        normal = ap.get("/N") if ap is not None else None
+        if isinstance(normal, IndirectObject):
+            self._objects[normal.idnum - 1] = appearance
+            return
+        # Shared objects get no indirect_reference; nothing reads it when writing
+        self._objects.append(appearance)
+        ap = DictionaryObject(ap) if ap is not None else DictionaryObject()
+        ap[NameObject("/N")] = IndirectObject(len(self._objects), 0, self)
+        annot[NameObject("/AP")] = ap
+
+    def write_stream(self, stream) -> None:
+        # The template graph was swept when it was loaded and nothing added
+        # since points outside it, so PdfWriter's full-graph sweep is skipped.
+        # Untouched objects are copied from the template's serialized bytes,
+        # one memoryview slice per run of consecutive untouched objects.
+        base = self.template.base
+        data = memoryview(base.data)
+        offsets = base.object_offsets
+        master_objects = self._master._objects
+        stream.write(data[:offsets[0]])
+
+        object_positions = []
+        run_start = None
+        run_position = 0
+        for i, obj in enumerate(self._objects):
+            if i < len(master_objects) and obj is master_objects[i]:
+                if run_start is None:
+                    run_start, run_position = i, stream.tell()
+                object_positions.append(run_position + offsets[i] - offsets[run_start])
+                continue
+            if run_start is not None:
+                stream.write(data[offsets[run_start]:offsets[i]])
+                run_start = None
+            object_positions.append(stream.tell())
+            self._write_object(stream, i + 1)
+        if run_start is not None:
+            stream.write(data[offsets[run_start]:offsets[len(self._objects)]])
+        xref_location = self._write_xref_table(stream, object_positions)
+        self._write_trailer(stream, xref_location)
+
+    def write_chunks(self, incremental: bool = False) -> "PdfChunks":
+        """
+        Serialize into a PdfChunks instead of one contiguous buffer.
+
+        Runs of untouched objects (and, with ``incremental``, the whole
+        template) stay memoryviews of ``template.base.data``, so only the
+        changed objects and the xref are newly allocated.
+        """
+        chunks = PdfChunks()
+        if incremental:
+            chunks.write(memoryview(self.template.base.data))
+            chunks.write(self.incremental_tail())
+        else:
+            self.write_stream(chunks)
+        return chunks
+
+    def write_page_chunks(self, page_index: int) -> "PdfChunks":
+        """
+        Serialize page ``page_index`` alone as a one-page document.
+
+        The page is given a new page tree and catalog; its annotations and
+        the form are left out, so flatten it first to keep the field values.
+        Object numbers stay those of the template: template objects the page
+        reaches are sliced from ``template.base.data`` (the set each of them
+        reaches is cached on the template) and the xref is a compressed
+        stream, which allows the gaps in the numbering.
+        """
+        page_plan = self.template.page_widgets()[page_index]
+        page = self.writable(page_plan.page_idnum)
+        # Inheritable attributes (PDF 32000-1, 7.7.3.4) move onto the page itself
+        node = page
+        while "/Parent" in node:
+            node = node["/Parent"].get_object()
+            for key in ("/Resources", "/MediaBox", "/CropBox", "/Rotate"):
+                if key in node and key not in page:
+                    page[NameObject(key)] = node.raw_get(key)
+        page.pop("/Annots", None)
+        pages_ref = self._add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject([IndirectObject(page_plan.page_idnum, 0, self)]),
+            NameObject("/Count"): NumberObject(1),
+        }))
+        page[NameObject("/Parent")] = pages_ref
+        root_ref = self._add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): pages_ref,
+        }))
+
+        # Every object the new catalog reaches; untouched template objects bring their cached closure
+        master_objects = self._master._objects
+        needed = set()
+        stack = [root_ref.idnum]
+        while stack:
+            idnum = stack.pop()
+            if idnum in needed:
+                continue
+            if idnum <= len(master_objects) and self._objects[idnum - 1] is master_objects[idnum - 1]:
+                for member in self.template.closure(idnum):
+                    if self._objects[member - 1] is master_objects[member - 1]:
+                        needed.add(member)
+                    elif member not in needed:
+                        stack.append(member)
+                continue
+            needed.add(idnum)
+            stack.extend(references(self._objects[idnum - 1]))
+
+        base = self.template.base
+        data = memoryview(base.data)
+        offsets = base.object_offsets
+        chunks = PdfChunks()
+        chunks.write(data[:offsets[0]])
+        positions = {}
+        for idnum in sorted(needed):
+            positions[idnum] = chunks.tell()
+            obj = self._objects[idnum - 1]
+            if idnum <= len(master_objects) and obj is master_objects[idnum - 1]:
+                chunks.write(data[offsets[idnum - 1]:offsets[idnum]])
+                continue
+            buffer = io.BytesIO()
+            self._write_object(buffer, idnum)
+            chunks.write(buffer.getvalue())
+        write_xref_stream(chunks, positions, len(self._objects) + 1, {"/Root": root_ref})
+        return chunks
+
+    def _write_object(self, stream, idnum: int) -> None:
+        """
+        Write changed object ``idnum`` as an indirect object.
+
+        A copied template dictionary is written entry by entry, taking the
+        bytes of every entry that still holds the template's value from
+        ``template.entry_bytes``, so only the entries this request set (/V,
+        /AS, /AP) are encoded again; re-encoding the long /TU tooltips of each
+        filled widget was most of the cost of a tail.
+        """
+        obj = self._objects[idnum - 1]
+        stream.write(f"{idnum} 0 obj\n".encode())
+        if idnum in self._copied and type(obj) is DictionaryObject:
+            master = self._master._objects[idnum - 1]
+            cached = self.template.entry_bytes(idnum)
+            stream.write(b"<<\n")
+            for key, value in dict.items(obj):
+                entry = cached.get(key)
+                if entry is not None and value is dict.get(master, key):
+                    stream.write(entry)
+                else:
+                    _write_entry(stream, key, value)
+            stream.write(b">>")
+        else:
+            obj.write_to_stream(stream)
+        stream.write(b"\nendobj\n")
+
+    def changed_objects(self) -> List[int]:
+        """Object numbers this working copy replaced or added, in ascending order."""
+        master_objects = self._master._objects
+        objects = self._objects
+        changed = [i + 1 for i, obj in enumerate(master_objects) if objects[i] is not obj]
+        changed.extend(range(len(master_objects) + 1, len(objects) + 1))
+        return changed
+
+    def incremental_tail(self) -> bytes:
+        """
+        Serialize only the changed objects as an incremental update.
+
+        The result is a new body, xref section and trailer (/Prev pointing at
+        the template's xref) meant to follow ``template.base.data`` unchanged.
+        """
+        base = self.template.base
+        stream = io.BytesIO()
+        offsets = []
+        changed = self.changed_objects()
+        for idnum in changed:
+            offsets.append(len(base.data) + stream.tell())
+            self._write_object(stream, idnum)
+
+        xref_location = len(base.data) + stream.tell()
+        stream.write(b"xref\n")
+        # Restate the head of the free list so readers see a zero-based table
+        stream.write(f"0 1\n{0:0>10} {65535:0>5} f \n".encode())
+        run_start = 0
+        for i in range(1, len(changed) + 1):
+            # One subsection per run of consecutive object numbers
+            if i == len(changed) or changed[i] != changed[i - 1] + 1:
+                stream.write(f"{changed[run_start]} {i - run_start}\n".encode())
+                for offset in offsets[run_start:i]:
+                    stream.write(f"{offset:0>10} {0:0>5} n \n".encode())
+                run_start = i
+
+        stream.write(b"trailer\n")
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(len(self._objects) + 1),
+            NameObject("/Root"): self._root,
+            NameObject("/Info"): self._info,
+            NameObject("/Prev"): NumberObject(base.xref_offset),
+        })
+        if self._ID:
+            trailer[NameObject("/ID")] = self._ID
+        trailer.write_to_stream(stream)
+        stream.write(f"\nstartxref\n{xref_location}\n%%EOF\n".encode())
+        return stream.getvalue()
+
+    def write_incremental(self, stream) -> None:
+        """Write the cached template bytes followed by this copy's incremental update."""
+        stream.write(self.template.base.data)
+        stream.write(self.incremental_tail())
+
+
+def _write_entry(stream, key: NameObject, value) -> None:
+    # One dictionary entry, formatted (and /%...% keys skipped) as DictionaryObject.write_to_stream does
+    if len(key) > 2 and key[1] == "%" and key[-1] == "%":
+        return
+    key.write_to_stream(stream)
+    stream.write(b" ")
+    value.write_to_stream(stream)
+    stream.write(b"\n")
+
+
+def references(obj) -> List[int]:
+    """Object numbers ``obj`` refers to directly (through nested direct arrays and dictionaries)."""
+    found = []
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, IndirectObject):
+            found.append(current.idnum)
+        elif isinstance(current, dict):
+            stack.extend(current.values())
+        elif isinstance(current, list):
+            stack.extend(current)
+    return found
+
+
+def write_xref_stream(stream, positions: Dict[int, int], idnum: int, trailer: Dict[str, object],
+                      compressed: Optional[Dict[int, Tuple[int, int]]] = None) -> None:
+    """
+    Finish a document with a cross-reference stream as object ``idnum``.
+
+    ``positions`` maps object numbers to byte offsets and ``compressed`` maps
+    objects stored in object streams to (stream number, index). /Index lists
+    one subsection per run of object numbers, so the numbering may have gaps
+    (PDF 32000-1, 7.5.8). ``trailer`` holds the other trailer keys (/Root, ...).
+    """
+    compressed = compressed or {}
+    positions = dict(positions)
+    xref_offset = positions[idnum] = stream.tell()
+    numbers = sorted(set(positions) | set(compressed))
+    index = [0, 1]
+    rows = [b"\x00\x00\x00\x00\x00\xff\xff"]  # object 0: head of the free list
+    run_start = numbers[0]
+    for i, number in enumerate(numbers):
+        if number in positions:
+            rows.append(b"\x01" + positions[number].to_bytes(4, "big") + b"\x00\x00")
+        else:
+            container, position = compressed[number]
+            rows.append(b"\x02" + container.to_bytes(4, "big") + position.to_bytes(2, "big"))
+        if i + 1 == len(numbers) or numbers[i + 1] != number + 1:
+            index += [run_start, number - run_start + 1]
+            if i + 1 < len(numbers):
+                run_start = numbers[i + 1]
+    xref = _stream(b"".join(rows))
+    xref.update({NameObject(key): value for key, value in trailer.items() if value is not None})
+    xref.update({
+        NameObject("/Type"): NameObject("/XRef"),
+        NameObject("/Size"): NumberObject(max(numbers) + 1),
+        NameObject("/Index"): ArrayObject(NumberObject(n) for n in index),
+        NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)]),
+    })
+    buffer = io.BytesIO()
+    buffer.write(f"{idnum} 0 obj\n".encode())
+    xref.flate_encode().write_to_stream(buffer)
+    buffer.write(f"\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    stream.write(buffer.getvalue())
+
+
+def _stream(data: bytes) -> DecodedStreamObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return stream
+
+
+class TemplateCache:
+    """Holds one ParsedTemplate and reloads it when the file's mtime changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._template: Optional[ParsedTemplate] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self) -> ParsedTemplate:
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        template = self._template
+        if template is None or template.mtime_ns != mtime_ns:
+            with self._lock:
+                template = self._template
+                if template is None or template.mtime_ns != mtime_ns:
+                    template = load_template(self.path)
+                    self._template = template
+                    self.loads += 1
+                    for callback in _load_callbacks:
+                        callback(template)
+        return template
+
+    def peek(self) -> Optional[ParsedTemplate]:
+        """The template currently held, without loading or reloading it."""
+        return self._template
+
+
+_caches: Dict[str, TemplateCache] = {}
+_caches_lock = threading.Lock()
+_load_callbacks: List[Callable[[ParsedTemplate], None]] = []
+
+
+def on_template_load(callback: Callable[[ParsedTemplate], None]) -> None:
+    """Call ``callback(template)`` after every template (re)load in this process."""
+    _load_callbacks.append(callback)
+
+
+def snapshot_dir() -> Optional[str]:
+    return os.environ.get("PDF_TEMPLATE_SNAPSHOT_DIR") or None
+
+
+def _snapshot_digest(data: bytes) -> bytes:
+    digest = hashlib.sha256(data)
+    digest.update(f"|{SNAPSHOT_FORMAT}|{pypdf.__version__}|{platform.python_version()}".encode())
+    return digest.hexdigest().encode()
+
+
+def _new_dictionary(cls):
+    return dict.__new__(cls)
+
+
+def _set_dictionary_state(obj: DictionaryObject, state) -> None:
+    items, attributes = state
+    dict.update(obj, items)
+    obj.__dict__.update(attributes)
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """
+    Pickles pypdf dictionaries so that loading fills them with dict.update.
+
+    By default they are refilled key by key through DictionaryObject.__setitem__,
+    whose isinstance checks were most of a snapshot's load time.
+    """
+
+    def reducer_override(self, obj):
+        if isinstance(obj, DictionaryObject):
+            return _new_dictionary, (type(obj),), (dict(obj), obj.__dict__), None, None, _set_dictionary_state
+        return NotImplemented
+
+
+def _read_snapshot(path: str, digest: bytes) -> Optional[ParsedTemplate]:
+    try:
+        with open(path, "rb") as f:
+            if f.readline() != _SNAPSHOT_MAGIC + b" " + digest + b"\n":
+                logger.info("template snapshot is stale", extra={"snapshot": path})
+                return None
+            # ~250k small objects and nothing to collect: the collector's passes
+            # over them while they're built would double the load
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                return pickle.load(f)
+            finally:
+                if enabled:
+                    gc.enable()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("could not read template snapshot", extra={"snapshot": path, "error": str(e)})
+        return None
+
+
+def _write_snapshot(path: str, digest: bytes, template: ParsedTemplate) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAPSHOT_MAGIC + b" " + digest + b"\n")
+            _SnapshotPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(template)
+        os.replace(tmp_path, path)
+        logger.info("template snapshot written", extra={"snapshot": path, "bytes": os.path.getsize(path)})
+    except Exception as e:
+        logger.warning("could not write template snapshot", extra={"snapshot": path, "error": str(e)})
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_template(path: str) -> ParsedTemplate:
+    """
+    Parse the template at ``path``, or load it from its snapshot.
+
+    Without PDF_TEMPLATE_SNAPSHOT_DIR this is ParsedTemplate(path). With it,
+    a snapshot matching the template's bytes is unpickled instead, and a
+    missing or stale one is written after parsing.
+    """
+    directory = snapshot_dir()
+    if directory is None:
+        return ParsedTemplate(path)
+
+    start = time.perf_counter()
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = _snapshot_digest(data)
+    snapshot_path = os.path.join(directory, os.path.basename(path) + ".snapshot")
+    template = _read_snapshot(snapshot_path, digest)
+    if template is None:
+        template = ParsedTemplate(path, data)
+        template.mtime_ns = mtime_ns
+        _write_snapshot(snapshot_path, digest, template)
+        return template
+
+    template.path = path
+    template.mtime_ns = mtime_ns
+    template.loaded_at = time.time()
+    template.load_seconds = time.perf_counter() - start
+    logger.info("template loaded from snapshot", extra={
+        "path": path,
+        "snapshot": snapshot_path,
+        "load_ms": round(template.load_seconds * 1000, 2),
+    })
+    return template
+
+
+def cached_templates() -> Dict[str, TemplateCache]:
+    """Every template cache in this process, by absolute path (for metrics)."""
+    with _caches_lock:
+        return dict(_caches)
+
+
+def get_template(path: str) -> ParsedTemplate:
+    """Return the cached parsed template for ``path``, loading it on first use."""
+    key = os.path.abspath(path)
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(key, TemplateCache(key))
+    return cache.get()
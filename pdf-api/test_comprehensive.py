@@ -6,7 +6,9 @@ Tests ALL fields from the intake form schema.
 Run with: python3 test_comprehensive.py
 """
 
-from app import map_form_data_to_pdf_fields, fill_pdf
+from app import TEMPLATE_PATH, map_form_data_to_pdf_fields, fill_pdf
+from field_mapping import export_values
+from template_cache import get_template, load_template
 from pypdf import PdfReader
 import os
 import json
@@ -424,5 +426,549 @@ def run_comprehensive_test():
     print("=" * 70)
 
 
+def test_mapping_matches_snapshot():
+    """
+    The compiled mapping must reproduce the original if-chain exactly.
+
+    test_comprehensive_fields.json was written by the hand-written
+    map_form_data_to_pdf_fields that field_mapping.MAPPING_SPEC replaced;
+    both the values and the order fields are filled in must match.
+    """
+    snapshot_path = os.path.join(os.path.dirname(__file__), "test_comprehensive_fields.json")
+    with open(snapshot_path) as f:
+        expected = json.load(f)
+    pdf_fields = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+    assert list(pdf_fields.items()) == list(expected.items())
+
+
+def test_checkbox_export_values_match_template():
+    """Every checkbox value the mapping writes must be one of that widget's /AP /N on-states."""
+    assert get_template(TEMPLATE_PATH).check_button_values(export_values()) == []
+
+
+def test_template_snapshot_fills_identically(tmp_path, monkeypatch):
+    """A template loaded from its snapshot must produce the same bytes as a fresh parse."""
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+    expected = get_template(TEMPLATE_PATH).working_copy()
+    expected.update_widgets(field_data)
+
+    monkeypatch.setenv("PDF_TEMPLATE_SNAPSHOT_DIR", str(tmp_path))
+    load_template(TEMPLATE_PATH)  # parses and writes the snapshot
+    assert os.path.exists(tmp_path / "n-400.pdf.snapshot")
+    loaded = load_template(TEMPLATE_PATH).working_copy()
+    loaded.update_widgets(field_data)
+    assert loaded.write_chunks().getvalue() == expected.write_chunks().getvalue()
+
+
+def test_preview_is_one_filled_page():
+    """/preview returns just the requested page, flattened, with the payload's values drawn on it."""
+    import io
+    from app import app
+
+    response = app.test_client().post("/preview?page=1", json=COMPREHENSIVE_TEST_DATA)
+    assert response.status_code == 200
+    reader = PdfReader(io.BytesIO(response.get_data()))
+    assert len(reader.pages) == 1
+    assert "/AcroForm" not in reader.trailer["/Root"]
+    assert COMPREHENSIVE_TEST_DATA["last_name"] in reader.pages[0].extract_text()
+
+
+def test_fields_catalog_is_complete_and_conditional():
+    """/fields lists every widget-backed field, filters server-side and honours its ETag."""
+    from app import app
+
+    client = app.test_client()
+    response = client.get("/fields")
+    catalog = response.get_json()
+    assert catalog["total_fields"] == len(get_template(TEMPLATE_PATH).widget_index)
+    assert client.get("/fields", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    buttons = client.get("/fields?q=eligibility&type=Btn").get_json()["fields"]
+    assert buttons and all(field["type"] == "Btn" and field["on_states"] for field in buttons)
+
+
+def test_size_modes_shrink_without_changing_values():
+    """?size=all writes a smaller PDF that reads back with the same field values; bad names are a 400."""
+    import io
+    from app import app
+
+    client = app.test_client()
+    plain = client.post("/generate?size=", json=COMPREHENSIVE_TEST_DATA).get_data()
+    compact = client.post("/generate?size=all", json=COMPREHENSIVE_TEST_DATA).get_data()
+    assert len(compact) < len(plain) * 0.8
+    values = [
+        {name: field.get("/V") for name, field in PdfReader(io.BytesIO(pdf), strict=True).get_fields().items()}
+        for pdf in (plain, compact)
+    ]
+    assert values[0] == values[1]
+    assert client.post("/generate?size=tiny", json=COMPREHENSIVE_TEST_DATA).status_code == 400
+
+
+def test_intake_decoding_and_limits():
+    """JSON-string arrays map like native ones; bad JSON is a 400 and oversized input a 413."""
+    from app import app
+    from field_mapping import ARRAY_KEYS
+    from intake import MAX_ARRAY_ITEMS, MAX_BODY_BYTES, decode_intake
+
+    # Repeat groups nested in When branches are array keys too
+    assert "other_names" in ARRAY_KEYS
+    stringified = {key: json.dumps(value) if isinstance(value, list) else value
+                   for key, value in COMPREHENSIVE_TEST_DATA.items()}
+    decoded = decode_intake(json.dumps(stringified).encode())
+    assert all(isinstance(decoded[key], list) for key in ARRAY_KEYS if key in decoded)
+    assert map_form_data_to_pdf_fields(decoded) == map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+
+    client = app.test_client()
+    assert client.post("/generate", data="{not json", content_type="application/json").status_code == 400
+    assert client.post("/generate", json=[1, 2]).status_code == 400
+    too_many = dict(COMPREHENSIVE_TEST_DATA, trips=json.dumps([{}] * (MAX_ARRAY_ITEMS + 1)))
+    assert client.post("/generate", json=too_many).status_code == 413
+    too_many = dict(COMPREHENSIVE_TEST_DATA, other_names=json.dumps([{}] * (MAX_ARRAY_ITEMS + 1)))
+    assert client.post("/generate", json=too_many).status_code == 413
+    assert client.post("/generate", data=b" " * (MAX_BODY_BYTES + 1), content_type="application/json").status_code == 413
+
+
+def test_invalid_intake_is_one_422_with_every_violation():
+    """Malformed values are reported together, with their paths, before any fill."""
+    import copy
+    from app import app
+    from intake_schema import validate
+
+    assert validate(COMPREHENSIVE_TEST_DATA) == []
+    payload = copy.deepcopy(COMPREHENSIVE_TEST_DATA)
+    payload["date_of_birth"] = "March 15th"
+    payload["times_married"] = "twice"
+    payload["trips"][1]["date_returned_us"] = "2023-13-01"
+    payload["children"].append("not an object")
+    response = app.test_client().post("/generate", json=payload)
+    assert response.status_code == 422
+    assert [v["field"] for v in response.get_json()["violations"]] == [
+        "date_of_birth", "times_married", "children[2]", "trips[1].date_returned_us",
+    ]
+
+
+def test_frontend_present_rows_are_accepted():
+    """Rows as components/n400-form.tsx sends them ("PRESENT" end dates, month-only dates) fill, not 422."""
+    from app import app
+
+    payload = dict(
+        COMPREHENSIVE_TEST_DATA,
+        residence_addresses=json.dumps([
+            {"street_address": "123 Main St", "city": "Austin", "state": "TX", "zip_code": "78701",
+             "country": "United States", "dates_from": "2019-06-01", "dates_to": "PRESENT"},
+        ]),
+        employment_history=[
+            {"employer_or_school": "Acme", "occupation_or_field": "Engineer",
+             "dates_from": "08/2020", "dates_to": "PRESENT"},
+        ],
+    )
+    response = app.test_client().post("/generate", json=payload)
+    assert response.status_code == 200, response.get_json()
+    fields = map_form_data_to_pdf_fields(payload)
+    assert fields["form1[0].#subform[2].P4_Line3_From1[1]"] == "Present"
+
+
+def test_stringified_arrays_fill_like_lists():
+    """Every array key sent as a JSON string (as the intake app does) validates and fills like the list form."""
+    import io
+    from app import app
+    from field_mapping import ARRAY_KEYS
+
+    payload = dict(
+        COMPREHENSIVE_TEST_DATA,
+        residence_addresses=[{"street_address": "742 Evergreen Terrace", "city": "Seattle", "state": "WA",
+                              "zip_code": "98101", "country": "United States",
+                              "dates_from": "2019-06-01", "dates_to": "PRESENT"}],
+        employment_history=[{"employer_or_school": "Northwest Tech", "occupation_or_field": "Engineer",
+                             "city": "Seattle", "state": "WA", "country": "United States",
+                             "dates_from": "08/2020", "dates_to": "Present"}],
+        crimes=[{"crime_description": "Speeding", "date_of_crime": "2015-04-01", "result_disposition": "Fined",
+                 "place_of_crime": "Seattle, WA", "sentence": "None"}],
+        additional_information=[{"page_number": "5", "part_number": "6", "item_number": "1",
+                                 "explanation": "See attached."}],
+    )
+    assert ARRAY_KEYS <= set(payload)
+    stringified = {key: json.dumps(value) if isinstance(value, list) else value for key, value in payload.items()}
+    assert "other_names" in stringified and isinstance(stringified["other_names"], str)
+
+    def values(response):
+        assert response.status_code == 200, response.get_json()
+        fields = PdfReader(io.BytesIO(response.get_data()), strict=True).get_fields()
+        return {name: field.get("/V") for name, field in fields.items()}
+
+    client = app.test_client()
+    as_lists = values(client.post("/generate", json=payload))
+    as_strings = values(client.post("/generate", json=stringified))
+    assert as_strings == as_lists
+    assert "Garcia" in as_strings.values()  # other_names, the repeat group inside a When branch
+
+
+def test_pdf_cache_hits_and_template_changes_invalidate(tmp_path):
+    """A repeat /generate is served from the cache unchanged; touching the template changes the key."""
+    import shutil
+    from app import app
+    from pdf_cache import PdfCache, cache_key
+
+    client = app.test_client()
+    payload = dict(COMPREHENSIVE_TEST_DATA, first_name="Cached")
+    first = client.post("/generate", json=payload)
+    second = client.post("/generate", json=payload)
+    assert (first.headers["X-PDF-Cache"], second.headers["X-PDF-Cache"]) == ("miss", "hit")
+    assert first.get_data() == second.get_data()
+
+    template = tmp_path / "n-400.pdf"
+    shutil.copy(TEMPLATE_PATH, template)
+    cache = PdfCache(8 * 1024 * 1024, disk_dir=str(tmp_path / "disk"), disk_max_bytes=8 * 1024 * 1024)
+    fields = map_form_data_to_pdf_fields(payload)
+    key = cache_key(fields, str(template))
+    cache.put(key, get_template(TEMPLATE_PATH).working_copy().write_chunks())
+    assert cache.get(key).getvalue() == PdfCache(0, str(tmp_path / "disk"), 8 * 1024 * 1024).get(key).getvalue()
+    stat = os.stat(template)
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert cache.get(cache_key(fields, str(template))) is None
+
+
+def test_incremental_output_matches_full_output():
+    """An incremental update parses and gives every widget the same /V and /AS as a full write."""
+    import io
+    from app import fill_pdf
+
+    field_data = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+
+    def widget_states(pdf):
+        reader = PdfReader(io.BytesIO(pdf), strict=True)
+        states = {}
+        for page_number, page in enumerate(reader.pages):
+            for index, annot in enumerate(page.get("/Annots") or ()):
+                annot = annot.get_object()
+                states[(page_number, index)] = (annot.get("/T"), annot.get("/V"), annot.get("/AS"))
+        return states
+
+    full = fill_pdf(TEMPLATE_PATH, field_data)
+    incremental = fill_pdf(TEMPLATE_PATH, field_data, incremental=True)
+    assert incremental.startswith(get_template(TEMPLATE_PATH).base.data)
+    assert widget_states(incremental) == widget_states(full)
+
+    # Changed widgets reuse the template's bytes for unchanged entries; the
+    # result must match pypdf serializing each object itself
+    writer = get_template(TEMPLATE_PATH).working_copy()
+    writer.update_widgets(field_data)
+    for idnum in writer.changed_objects():
+        written = io.BytesIO()
+        writer._write_object(written, idnum)
+        expected = io.BytesIO()
+        writer._objects[idnum - 1].write_to_stream(expected)
+        assert written.getvalue() == f"{idnum} 0 obj\n".encode() + expected.getvalue() + b"\nendobj\n"
+
+
+def test_batch_zip_reports_each_item():
+    """/generate/batch fills good items and lists every failure in manifest.json, for JSON and NDJSON bodies."""
+    import io
+    import zipfile
+    from app import app
+    from intake import MAX_BODY_BYTES
+
+    good = dict(COMPREHENSIVE_TEST_DATA, trips=json.dumps(COMPREHENSIVE_TEST_DATA["trips"]))
+    bad_date = dict(COMPREHENSIVE_TEST_DATA, date_of_birth="someday")
+
+    def manifest(response):
+        assert response.status_code == 200
+        archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+        result = json.loads(archive.read("manifest.json"))
+        for item in result["items"]:
+            if item["status"] == "ok":
+                assert len(PdfReader(io.BytesIO(archive.read(item["file"]))).pages) == 14
+        return [(item["status"], item.get("error")) for item in result["items"]]
+
+    client = app.test_client()
+    assert manifest(client.post("/generate/batch", json=[good, bad_date, "not a payload"])) == [
+        ("ok", None), ("error", "Invalid intake payload"), ("error", "No data provided"),
+    ]
+
+    ndjson = b"\n".join([json.dumps(good).encode(), b"{broken", b"", json.dumps({"x": "y" * MAX_BODY_BYTES}).encode()])
+    statuses = manifest(client.post("/generate/batch", data=ndjson, content_type="application/x-ndjson"))
+    assert [status for status, _ in statuses] == ["ok", "error", "error"]
+    assert statuses[1][1].startswith("Invalid JSON") and statuses[2][1].startswith("Line over")
+
+    assert client.post("/generate/batch", json={"not": "an array"}).status_code == 400
+
+
+def test_full_fill_pool_answers_503(monkeypatch):
+    """With no queue slots the pool refuses the fill, and /generate answers 503 with Retry-After."""
+    import fill_pool
+    from app import FILL_RETRY_AFTER, app
+
+    monkeypatch.setenv("PDF_FILL_WORKERS", "1")
+    monkeypatch.setenv("PDF_FILL_QUEUE", "0")
+    monkeypatch.setattr(fill_pool, "_pool", None)
+    try:
+        response = app.test_client().post("/generate", json=dict(COMPREHENSIVE_TEST_DATA, first_name="Busy"))
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == FILL_RETRY_AFTER
+        assert fill_pool.current_fill_pool().rejected == 1
+    finally:
+        fill_pool.current_fill_pool().shutdown()
+
+
+def test_flatten_drops_the_form_and_keeps_the_pages():
+    """?flatten=1 leaves no /AcroForm and no widgets; each page keeps its text and gains the values."""
+    import io
+    from app import app
+
+    client = app.test_client()
+    plain = PdfReader(io.BytesIO(client.post("/generate", json=COMPREHENSIVE_TEST_DATA).get_data()), strict=True)
+    response = client.post("/generate?flatten=1", json=COMPREHENSIVE_TEST_DATA)
+    assert response.status_code == 200
+    flat = PdfReader(io.BytesIO(response.get_data()), strict=True)
+
+    assert "/AcroForm" not in flat.trailer["/Root"]
+    assert len(flat.pages) == len(plain.pages)
+    for page in flat.pages:
+        assert all(annot.get_object().get("/Subtype") != "/Widget" for annot in page.get("/Annots") or ())
+    first_page = flat.pages[0].extract_text()
+    assert plain.pages[0].extract_text() in first_page
+    assert COMPREHENSIVE_TEST_DATA["last_name"] in first_page
+
+
+def test_appearance_cache_and_widget_fonts():
+    """A repeat value is served from the LRU; a font missing from the AcroForm /DR comes from the widget's /DR."""
+    from appearances import AppearanceGenerator
+    from pypdf.generic import ArrayObject, DictionaryObject, FloatObject, NameObject, NumberObject, TextStringObject
+
+    template = get_template(TEMPLATE_PATH)
+    root = template.writer._root_object
+    generator = AppearanceGenerator(root, template.default_da, 16)
+    entry = template.widget_index["form1[0].#subform[0].P2_Line1_FamilyName[0]"][0]
+    layout = generator.layout(entry.idnum, template.writer._objects[entry.idnum - 1])
+    first = generator.appearance(layout, "Rodriguez")
+    assert generator.appearance(layout, "Rodriguez") is first
+    assert generator.appearance(layout, "Smith") is not first
+    assert generator.stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+    courier = root["/AcroForm"]["/DR"]["/Font"].raw_get("/CourierStd")
+    annot = DictionaryObject({
+        NameObject("/FT"): NameObject("/Tx"),
+        NameObject("/Rect"): ArrayObject([NumberObject(0), NumberObject(0), FloatObject(100), FloatObject(20)]),
+        NameObject("/DA"): TextStringObject("/WidgetFont 9 Tf 0 g"),
+        NameObject("/DR"): DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/WidgetFont"): courier}),
+        }),
+    })
+    layout = generator.layout(-1, annot)
+    assert layout.font_id == courier.idnum
+    rendered = generator.appearance(layout, "N/A")
+    assert rendered["/Resources"]["/Font"].raw_get("/WidgetFont") == courier
+
+
+def test_mapping_non_string_values():
+    """ints, bools and None map as the if-chain mapper did; enum lookups skip values it raised on."""
+    from field_mapping import intake_reads
+
+    base = map_form_data_to_pdf_fields(COMPREHENSIVE_TEST_DATA)
+
+    def mapped(**changes):
+        return map_form_data_to_pdf_fields(dict(COMPREHENSIVE_TEST_DATA, **changes))
+
+    # None anywhere is the same as leaving the key out
+    for key in {key for key, _ in intake_reads()}:
+        without = {k: v for k, v in COMPREHENSIVE_TEST_DATA.items() if k != key}
+        assert mapped(**{key: None}) == map_form_data_to_pdf_fields(without), key
+
+    weight = mapped(weight=150)
+    assert [weight[f"form1[0].#subform[2].P7_Line4_Pounds{box}[0]"] for box in (1, 2, 3)] == ["1", "5", "0"]
+    assert mapped(daytime_phone=5551234567)["form1[0].#subform[10].P12_Line3_Telephone[0]"] == 5551234567
+    assert mapped(times_married=2)["form1[0].#subform[3].Part9Line3_TimesMarried[0]"] == "2"
+    assert mapped(times_married=0)["form1[0].#subform[3].Part9Line3_TimesMarried[0]"] == "0"
+
+    # Yes/no answers are compared as lowercased text, so True and 1 tick neither box
+    for value in (True, 1):
+        fields = mapped(q_claimed_us_citizen=value)
+        assert "form1[0].#subform[5].P9_Line1[0]" in base
+        assert "form1[0].#subform[5].P9_Line1[0]" not in fields
+        assert "form1[0].#subform[5].P9_Line1[1]" not in fields
+
+    # Enum values that aren't strings match no branch
+    assert "form1[0].#subform[1].P2_Line7_Gender[1]" in base
+    assert "form1[0].#subform[1].P2_Line7_Gender[1]" not in mapped(gender=1)
+    assert "form1[0].#subform[1].P2_Line7_Gender[0]" not in mapped(gender=True)
+
+
+def test_bulk_script_validates_and_resumes(tmp_path, monkeypatch, capsys):
+    """scripts/fill-pdf.py bulk fills valid lines, reports bad JSON and invalid payloads, and skips done output."""
+    import importlib.util
+    import sys
+    from request_log import logger
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "fill-pdf.py")
+    spec = importlib.util.spec_from_file_location("fill_pdf_script", path)
+    script = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, spec.name, script)  # workers look _bulk_fill_one up by module name
+    spec.loader.exec_module(script)
+
+    good = json.dumps(dict(COMPREHENSIVE_TEST_DATA, id="good"))
+    # Archived rows keep array answers as the intake app sent them: JSON strings
+    archived = json.dumps({key: json.dumps(value) if isinstance(value, list) else value
+                           for key, value in dict(COMPREHENSIVE_TEST_DATA, id="archived").items()})
+    lines = [good, "{broken", json.dumps(dict(COMPREHENSIVE_TEST_DATA, id="bad", date_of_birth="March 15th")),
+             "", archived]
+    level = logger.level
+    try:
+        assert script.bulk_fill(lines, str(tmp_path), TEMPLATE_PATH, jobs=1) == 2
+        assert sorted(os.listdir(tmp_path)) == ["N-400_archived.pdf", "N-400_good.pdf"]
+        reader = PdfReader(str(tmp_path / "N-400_good.pdf"), strict=True)
+        assert reader.get_fields()["form1[0].#subform[0].P2_Line1_FamilyName[0]"].get("/V") == "Rodriguez"
+        fields = PdfReader(str(tmp_path / "N-400_archived.pdf"), strict=True).get_fields()
+        assert fields["form1[0].#subform[0].Line2_FamilyName1[0]"].get("/V") == "Garcia"  # other_names
+        errors = capsys.readouterr().err
+        assert "line 2: invalid payload: Invalid JSON" in errors
+        assert "line 3: invalid intake payload: date_of_birth: expected a date" in errors
+
+        assert script.bulk_fill([good], str(tmp_path), TEMPLATE_PATH, jobs=1) == 0
+        assert "0 written, 1 skipped, 0 failed" in capsys.readouterr().out
+    finally:
+        logger.setLevel(level)  # bulk_fill quiets the shared logger
+
+
+def test_profiling_needs_a_token_or_localhost(tmp_path, monkeypatch):
+    """X-PDF-Profile and /debug/profiles need PDF_PROFILE_TOKEN (else localhost); a profiled fill takes a pool slot."""
+    import fill_pool
+    from app import app
+
+    monkeypatch.setenv("PDF_PROFILE_DIR", str(tmp_path))
+    monkeypatch.delenv("PDF_PROFILE_TOKEN", raising=False)
+    monkeypatch.delenv("PDF_PROFILE_SAMPLE", raising=False)
+    client = app.test_client()
+    payload = dict(COMPREHENSIVE_TEST_DATA, first_name="Profiled")
+    remote = {"REMOTE_ADDR": "203.0.113.7"}
+
+    response = client.post("/generate", json=payload, headers={"X-PDF-Profile": "1"}, environ_base=remote)
+    assert response.status_code == 200 and "X-PDF-Profile" not in response.headers
+    assert client.get("/debug/profiles", environ_base=remote).status_code == 403
+    local = client.post("/generate", json=payload, headers={"X-PDF-Profile": "1"}).headers["X-PDF-Profile"]
+    assert [profile["name"] for profile in client.get("/debug/profiles").get_json()["profiles"]] == [local]
+
+    monkeypatch.setenv("PDF_PROFILE_TOKEN", "s3cret")
+    assert client.get("/debug/profiles").status_code == 403
+    assert client.get("/debug/profiles", headers={"X-PDF-Profile-Token": "wrong"}).status_code == 403
+    authorized = {"X-PDF-Profile": "1", "X-PDF-Profile-Token": "s3cret"}
+    name = client.post("/generate", json=payload, headers=authorized, environ_base=remote).headers["X-PDF-Profile"]
+    profile = client.get(f"/debug/profiles/{name}", headers=authorized, environ_base=remote)
+    assert profile.status_code == 200 and b"fill_pdf_chunks" in profile.get_data()
+
+    monkeypatch.setenv("PDF_FILL_WORKERS", "1")
+    monkeypatch.setenv("PDF_FILL_QUEUE", "0")
+    monkeypatch.setattr(fill_pool, "_pool", None)
+    try:
+        assert client.post("/generate", json=payload, headers=authorized, environ_base=remote).status_code == 503
+    finally:
+        fill_pool.current_fill_pool().shutdown()
+
+
+def test_generate_logs_one_record_with_stage_timings(monkeypatch):
+    """A /generate fill emits one "generate" record with parse, map, fill and serialize timings."""
+    import logging
+    import fill_pool
+    from app import app
+    from request_log import JsonFormatter, logger
+
+    monkeypatch.delenv("PDF_FILL_WORKERS", raising=False)  # in the pool, fill and serialize aren't split
+    monkeypatch.setattr(fill_pool, "_pool", None)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        response = app.test_client().post("/generate", json=dict(COMPREHENSIVE_TEST_DATA, first_name="Logged"))
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+
+    assert response.status_code == 200
+    generate = [record for record in records if record.getMessage() == "generate"]
+    assert len(generate) == 1
+    entry = json.loads(JsonFormatter().format(generate[0]))
+    assert entry["status"] == 200 and entry["bytes"] == len(response.get_data())
+    for stage in ("parse", "validate", "map", "template", "fill", "serialize"):
+        assert isinstance(entry[f"{stage}_ms"], float), stage
+    assert entry["total_ms"] >= entry["fill_ms"] + entry["serialize_ms"]
+
+
+def test_metrics_count_generate_requests_and_stages(monkeypatch):
+    """/metrics moves the request counter, the request histogram and the stage histograms by one per /generate."""
+    import re
+    import fill_pool
+    from app import app
+
+    monkeypatch.delenv("PDF_FILL_WORKERS", raising=False)
+    monkeypatch.setattr(fill_pool, "_pool", None)
+    client = app.test_client()
+
+    def samples():
+        response = client.get("/metrics")
+        assert response.status_code == 200 and response.mimetype == "text/plain"
+        return {name: float(value) for name, value in re.findall(r"^(\S+) (\S+)$", response.get_data(as_text=True), re.M)}
+
+    before = samples()
+    assert client.post("/generate", json=dict(COMPREHENSIVE_TEST_DATA, first_name="Counted")).status_code == 200
+    assert client.post("/generate", data=b"{broken", content_type="application/json").status_code == 400
+    after = samples()
+
+    def delta(name):
+        return after[name] - before.get(name, 0)
+
+    assert delta('pdf_api_requests_total{endpoint="generate",status="200"}') == 1
+    assert delta('pdf_api_requests_total{endpoint="generate",status="400"}') == 1
+    assert delta('pdf_api_request_seconds_count{endpoint="generate"}') == 2
+    assert delta('pdf_api_request_seconds_bucket{endpoint="generate",le="+Inf"}') == 2
+    assert delta('pdf_api_request_seconds_sum{endpoint="generate"}') > 0
+    for stage in ("parse", "map", "fill", "serialize"):
+        assert delta(f'pdf_api_stage_seconds_count{{endpoint="generate",stage="{stage}"}}') == (2 if stage == "parse" else 1)
+    assert after['pdf_api_in_flight_requests{endpoint="generate"}'] == 0
+
+
+def test_gthread_mode_fills_concurrent_requests_in_the_pool(monkeypatch):
+    """PDF_SERVING=gthread configures threaded workers and a started pool that serves concurrent requests."""
+    import io
+    import runpy
+    import threading
+    import fill_pool
+    from app import app
+
+    environ = {key: value for key, value in os.environ.items() if not key.startswith("PDF_FILL_")}
+    environ.update(PDF_SERVING="gthread", PDF_THREADS="4")
+    monkeypatch.setattr(os, "environ", environ)  # the config file setdefaults the pool settings
+    monkeypatch.setattr(fill_pool, "_pool", None)
+    config = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py"))
+    assert (config["worker_class"], config["threads"]) == ("gthread", 4)
+    assert (environ["PDF_FILL_WORKERS"], environ["PDF_FILL_QUEUE"]) == ("auto", "8")
+
+    environ["PDF_FILL_WORKERS"] = "2"
+    config["post_worker_init"](None)  # starts this worker's pool before any request thread
+    pool = fill_pool.current_fill_pool()
+    try:
+        assert (pool.workers, pool.max_pending) == (2, 8)
+        responses = {}
+
+        def post(index):
+            payload = dict(COMPREHENSIVE_TEST_DATA, first_name=f"Thread{index}")
+            responses[index] = app.test_client().post("/generate", json=payload)
+
+        threads = [threading.Thread(target=post, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, response in responses.items():
+            assert response.status_code == 200
+            fields = PdfReader(io.BytesIO(response.get_data()), strict=True).get_fields()
+            assert fields["form1[0].#subform[0].P2_Line1_GivenName[0]"].get("/V") == f"Thread{index}"
+        assert len(responses) == 4 and pool.pending == 0 and pool.rejected == 0
+    finally:
+        pool.shutdown()
+
+
 if __name__ == "__main__":
     run_comprehensive_test()
@@ -4,13 +4,18 @@ N-400 PDF Form Filler
 Uses pypdf to fill the N-400 form with sample data.
 
 Run with: python3 scripts/fill-pdf.py
+     python3 scripts/fill-pdf.py --incremental   (write an incremental update)
+     python3 scripts/fill-pdf.py bulk archive.ndjson --out regenerated/ --jobs 4
+     python3 scripts/fill-pdf.py bulk - --out regenerated/ < archive.ndjson
 """
 
 from pypdf import PdfReader, PdfWriter
 from pypdf.generic import NameObject, BooleanObject
 import os
+import re
 import sys
 import json
+import time
 
 # Sample test data
 SAMPLE_DATA = {
@@ -292,6 +297,28 @@ def get_all_field_names(reader):
     return []
 
 
+def build_button_table(writer):
+    """
+    Map each button's qualified field name to its widgets and their on-states.
+
+    One pass over the pages' /Annots; the on-states are the non-/Off keys of
+    each widget's /AP /N, i.e. the values /V and /AS can take.
+    """
+    table = {}
+    for page in writer.pages:
+        for annot_ref in page.get("/Annots", []):
+            annot = annot_ref.get_object()
+            if annot.get("/Subtype") != "/Widget" or annot.get("/FT") != "/Btn":
+                continue
+            name = writer._get_qualified_field_name(annot)
+            ap = annot.get("/AP")
+            normal = ap.get_object().get("/N") if ap is not None else None
+            normal = normal.get_object() if normal is not None else {}
+            on_states = {str(k) for k in normal.keys() if k != "/Off"}
+            table.setdefault(name, []).append((annot, on_states))
+    return table
+
+
 def fill_pdf(input_path, output_path, field_data):
     """Fill PDF form fields with the provided data."""
     print(f"📄 Loading PDF from: {input_path}")
@@ -333,63 +360,18 @@ def fill_pdf(input_path, output_path, field_data):
         except Exception as e:
             print(f"  ✗ Error applying fields on page {page_index + 1}: {e}")
 
-    def normalize_name(field_name: str) -> str:
-        """Normalize a full field name to align with widget /T values."""
-        # Many N-400 fields look like:
-        #   form1[0].#subform[0].Part1_Eligibility[0]
-        # but the widget /T is just "Part1_Eligibility[0]".
-        return field_name.split(".")[-1]
-
-    # Then, explicitly set checkbox/radio button values at the AcroForm level
-    def set_button_values(field_objs, mapping):
-        if not field_objs:
-            return
-        for field_ref in field_objs:
-            field = field_ref.get_object()
-            field_type = field.get("/FT")
-            name = field.get("/T")
-
-            # If this is a button and we have a target value, set /V and /AS
-            if field_type == "/Btn" and name in mapping:
-                on_value = mapping[name]
-                if isinstance(on_value, str):
-                    on_value = NameObject(on_value)
-                try:
-                    field.update({
-                        NameObject("/V"): on_value,
-                        NameObject("/AS"): on_value,
-                    })
-                    print(f"  ✓ Set button {name} to {on_value}")
-                except Exception as e:
-                    print(f"  ✗ Failed to set button {name}: {e}")
-
-            # Recurse into kids (for radio groups / nested fields)
-            kids = field.get("/Kids")
-            if kids:
-                set_button_values(kids, mapping)
+    # Then set checkbox/radio values explicitly: /V and /AS must be the on-state name
+    buttons = build_button_table(writer)
+    for full_name, value in field_data.items():
+        for annot, on_states in buttons.get(full_name, ()):
+            state = NameObject(value) if isinstance(value, str) else value
+            if state != "/Off" and state not in on_states:
+                print(f"  ✗ {full_name}: {state} is not one of {sorted(on_states)}")
+                continue
+            annot[NameObject("/V")] = state
+            annot[NameObject("/AS")] = state
+            print(f"  ✓ Set button {full_name} to {state}")
 
-    try:
-        acro_form = writer._root_object.get("/AcroForm")
-        if hasattr(acro_form, "get_object"):
-            acro_form = acro_form.get_object()
-        if acro_form:
-            fields_array = acro_form.get("/Fields")
-            if fields_array:
-                # Build mapping keyed by normalized names so widget /T matches
-                btn_mapping = {}
-                for full_name, value in field_data.items():
-                    field_def = fields.get(full_name)
-                    if not field_def:
-                        continue
-                    if field_def.get("/FT") != "/Btn":
-                        continue
-                    norm = normalize_name(full_name)
-                    btn_mapping[norm] = value
-
-                set_button_values(fields_array, btn_mapping)
-    except Exception as e:
-        print(f"⚠️ Failed to apply explicit button values: {e}")
-    
     # Save
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, 'wb') as f:
@@ -398,6 +380,176 @@ def fill_pdf(input_path, output_path, field_data):
     print(f"\n✅ Saved to: {output_path}")
 
 
+def use_pdf_api_modules():
+    """Make pdf-api/ importable so the script shares the API's mapping and template cache."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    pdf_api_dir = os.path.abspath(os.path.join(script_dir, "..", "pdf-api"))
+    if pdf_api_dir not in sys.path:
+        sys.path.insert(0, pdf_api_dir)
+
+
+def fill_pdf_incremental(input_path, output_path, field_data):
+    """
+    Fill PDF form fields and save the result as an incremental update.
+
+    The output is the decrypted template followed by only the changed
+    field objects, a new xref section and trailer (see pdf-api/template_cache.py).
+    """
+    use_pdf_api_modules()
+    from template_cache import get_template
+
+    template = get_template(input_path)
+    writer = template.working_copy()
+    # Buttons get /V and /AS from the template's on-state table (template.button_states)
+    filled = writer.update_widgets(field_data)
+    print(f"Filled {filled} widgets from {len(field_data)} mapped fields")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'wb') as f:
+        writer.write_incremental(f)
+
+    print(f"\n✅ Saved to: {output_path}")
+
+
+def bulk_output_name(line_number, data, pdf_filename):
+    """
+    File name for one bulk payload: its row id when it has one, else its line number.
+
+    Names depend only on the payload, so a rerun finds what an interrupted
+    run already wrote.
+    """
+    if data.get("id"):
+        name = f"N-400_{data['id']}.pdf"
+    else:
+        name = f"{line_number:06d}_{pdf_filename(data)}"
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)
+
+
+def _bulk_fill_one(template_path, data, output_path, incremental, flatten):
+    """Map, fill and write one payload in a worker process; returns the PDF size."""
+    from app import fill_pdf_chunks, map_form_data_to_pdf_fields
+
+    field_data = map_form_data_to_pdf_fields(data)
+    pdf = fill_pdf_chunks(template_path, field_data, incremental=incremental, flatten=flatten)
+    # Written under a temporary name so an interrupted write is never mistaken for output
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in pdf.chunks():
+            f.write(chunk)
+    os.replace(tmp_path, output_path)
+    return len(pdf)
+
+
+def bulk_fill(lines, output_dir, template_path, jobs, incremental=False, flatten=False, progress_every=2.0):
+    """
+    Fill one PDF per NDJSON payload in ``lines`` into ``output_dir``.
+
+    Each line is decoded and validated like a /generate body (pdf-api's
+    intake.py and intake_schema.py; PDF_VALIDATE=0 skips validation), and a
+    payload that fails is reported and counted, not filled.
+
+    The template is parsed here once; workers are forked from this process
+    and share it (where fork is unavailable each worker parses it once).
+    Lines are read as workers free up (at most 4 payloads per worker in
+    flight) and workers write their own files, so memory stays flat however
+    long the input is. Payloads whose output already exists are skipped.
+    Returns the number of payloads that failed.
+    """
+    use_pdf_api_modules()
+    import multiprocessing
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    from app import pdf_filename
+    from intake import PayloadError, decode_intake
+    from intake_schema import VALIDATE_DEFAULT, validate
+    from request_log import logger
+    from template_cache import get_template
+
+    logger.setLevel("WARNING")  # one record per fill would drown the progress lines
+    os.makedirs(output_dir, exist_ok=True)
+    get_template(template_path)
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+
+    counts = {"written": 0, "skipped": 0, "failed": 0}
+    written_bytes = 0
+    start = last_report = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        rate = counts["written"] / elapsed if elapsed else 0.0
+        print(f"{counts['written']} written, {counts['skipped']} skipped, {counts['failed']} failed, "
+              f"{rate:.1f} PDFs/s, {written_bytes / 1e6:.1f} MB in {elapsed:.1f}s",
+              file=sys.stdout if final else sys.stderr)
+
+    def collect(done):
+        nonlocal written_bytes, last_report
+        for future in done:
+            line_number, output_path = pending.pop(future)
+            try:
+                written_bytes += future.result()
+                counts["written"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"  ✗ line {line_number} ({os.path.basename(output_path)}): {e}", file=sys.stderr)
+        if time.perf_counter() - last_report >= progress_every:
+            last_report = time.perf_counter()
+            report()
+
+    pending = {}
+    # Workers put pdf-api/ on sys.path themselves instead of relying on the start method copying ours
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=use_pdf_api_modules) as pool:
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = decode_intake(line.encode("utf-8"))
+            except PayloadError as e:
+                counts["failed"] += 1
+                print(f"  ✗ line {line_number}: invalid payload: {e}", file=sys.stderr)
+                continue
+            violations = validate(data) if VALIDATE_DEFAULT else []
+            if violations:
+                counts["failed"] += 1
+                details = "; ".join(f"{v['field']}: {v['error']}" for v in violations)
+                print(f"  ✗ line {line_number}: invalid intake payload: {details}", file=sys.stderr)
+                continue
+            output_path = os.path.join(output_dir, bulk_output_name(line_number, data, pdf_filename))
+            if os.path.exists(output_path):
+                counts["skipped"] += 1
+                continue
+            if len(pending) >= jobs * 4:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            future = pool.submit(_bulk_fill_one, template_path, data, output_path, incremental, flatten)
+            pending[future] = (line_number, output_path)
+        collect(wait(pending).done)
+
+    report(final=True)
+    return counts["failed"]
+
+
+def bulk_main(argv, template_path):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="fill-pdf.py bulk",
+                                     description="Fill one PDF per NDJSON intake payload, resuming where a run stopped.")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON file, or - for stdin (default)")
+    parser.add_argument("--out", default="test-output/bulk", help="output directory (default: test-output/bulk)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    parser.add_argument("--incremental", action="store_true", help="write incremental updates")
+    parser.add_argument("--flatten", action="store_true", help="write flattened PDFs")
+    parser.add_argument("--progress", type=float, default=2.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        failed = bulk_fill(sys.stdin, args.out, template_path, args.jobs, args.incremental, args.flatten, args.progress)
+    else:
+        with open(args.input, encoding="utf-8") as lines:
+            failed = bulk_fill(lines, args.out, template_path, args.jobs, args.incremental, args.flatten, args.progress)
+    return 1 if failed else 0
+
+
 def build_full_sample_data(reader):
     """
     Build sample data that touches every field in the N-400 PDF.
@@ -517,12 +669,11 @@ if __name__ == "__main__":
     
     if len(sys.argv) > 1 and sys.argv[1] == "list":
         list_fields(input_pdf, "test-output/pdf-fields-python.json")
+    elif len(sys.argv) > 1 and sys.argv[1] == "bulk":
+        sys.exit(bulk_main(sys.argv[2:], input_pdf))
     else:
         # Use realistic data and the same mapping logic as the API
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        pdf_api_dir = os.path.abspath(os.path.join(script_dir, "..", "pdf-api"))
-        if pdf_api_dir not in sys.path:
-            sys.path.insert(0, pdf_api_dir)
+        use_pdf_api_modules()
 
         from app import map_form_data_to_pdf_fields
 
@@ -530,4 +681,7 @@ if __name__ == "__main__":
         field_data = map_form_data_to_pdf_fields(intake_data)
 
         # Fill the PDF with mapped data
-        fill_pdf(input_pdf, output_pdf, field_data)
+        if "--incremental" in sys.argv[1:]:
+            fill_pdf_incremental(input_pdf, output_pdf, field_data)
+        else:
+            fill_pdf(input_pdf, output_pdf, field_data)